@@ -0,0 +1,3 @@
+# Audio and note processing shared by the cloud functions in spec/.
+# Modules in this package must not import spec.config so they can be used
+# without Firebase credentials.
@@ -0,0 +1,131 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import maximum_filter
+
+# Audio is reduced to this rate before analysis
+FINGERPRINT_SAMPLE_RATE = 11025
+
+FRAME_SIZE = 2048
+HOP_SIZE = 128
+FRAMES_PER_SECOND = FINGERPRINT_SAMPLE_RATE / HOP_SIZE
+
+# 33 log-spaced bands give 32 energy differences, i.e. one 32-bit
+# sub-fingerprint per frame
+N_BANDS = 33
+MIN_FREQUENCY = 300.0
+MAX_FREQUENCY = 2000.0
+
+# Spectral peaks used for landmarks: searched below ~4 kHz, one per
+# neighbourhood of (frames, bins), and only in the loudest 5% of cells
+PEAK_MIN_BIN = 5
+PEAK_MAX_BIN = 744
+PEAK_NEIGHBORHOOD = (31, 21)
+PEAK_PERCENTILE = 95
+
+# Each peak is paired with up to FAN_OUT later peaks inside the target zone
+FAN_OUT = 3
+TARGET_MIN_FRAMES = 2
+TARGET_MAX_FRAMES = 63
+TARGET_MAX_BINS = 63
+
+# Only about 1 in INDEX_SAMPLING landmarks is kept for the lookup index. The
+# choice depends on the landmark hash, not its position, so two copies of the
+# same audio keep the same landmarks whatever their alignment.
+INDEX_SAMPLING = 16
+
+
+def _power_spectrogram(samples, sample_rate):
+    factor = max(int(round(sample_rate / FINGERPRINT_SAMPLE_RATE)), 1)
+    usable = len(samples) // factor * factor
+    # Averaging before decimating doubles as a cheap anti-aliasing filter
+    audio = samples[:usable].reshape(-1, factor).mean(axis=1, dtype=np.float32) / 32768.0
+    if len(audio) < FRAME_SIZE + HOP_SIZE:
+        return np.zeros((0, FRAME_SIZE // 2 + 1), dtype=np.float32)
+
+    frames = sliding_window_view(audio, FRAME_SIZE)[::HOP_SIZE] * np.hanning(FRAME_SIZE).astype(np.float32)
+    return np.abs(np.fft.rfft(frames, axis=1)) ** 2
+
+
+def _sub_fingerprints(power):
+    """One 32-bit word per frame from the signs of band-energy differences over time."""
+    if len(power) < 2:
+        return np.zeros(0, dtype=np.uint32)
+    edges = np.geomspace(MIN_FREQUENCY, MAX_FREQUENCY, N_BANDS + 1)
+    bins = np.round(edges * FRAME_SIZE / FINGERPRINT_SAMPLE_RATE).astype(np.int64)
+    cumulative = np.cumsum(power, axis=1)
+    energies = cumulative[:, bins[1:] - 1] - cumulative[:, bins[:-1] - 1]
+
+    band_diff = energies[:, :-1] - energies[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+    packed = np.ascontiguousarray(np.packbits(bits, axis=1, bitorder="little"))
+    return packed.view("<u4").ravel().astype(np.uint32)
+
+
+def _landmarks(power):
+    """(hash, frame) pairs for sampled spectral peak pairs, ordered by frame."""
+    if len(power) == 0:
+        return []
+    log_power = np.log(power[:, PEAK_MIN_BIN:PEAK_MAX_BIN] + 1e-10)
+    local_max = maximum_filter(log_power, size=PEAK_NEIGHBORHOOD, mode="constant", cval=-np.inf)
+    peaks = (log_power == local_max) & (log_power > np.percentile(log_power, PEAK_PERCENTILE))
+    times, bins = np.nonzero(peaks)
+
+    landmarks = []
+    for i in range(len(times)):
+        paired = 0
+        for j in range(i + 1, len(times)):
+            dt = times[j] - times[i]
+            if dt > TARGET_MAX_FRAMES:
+                break
+            df = bins[j] - bins[i]
+            if dt < TARGET_MIN_FRAMES or abs(df) > TARGET_MAX_BINS:
+                continue
+            landmark = (int(bins[i]) << 13) | (int(df + 64) << 6) | int(dt)
+            # Keep a hash-dependent subset (Fibonacci hashing mixes the bits)
+            if (((landmark * 0x9E3779B1) & 0xFFFFFFFF) >> 24) % INDEX_SAMPLING == 0:
+                landmarks.append((landmark, int(times[i])))
+            paired += 1
+            if paired >= FAN_OUT:
+                break
+    return landmarks
+
+
+def compute_fingerprint(samples, sample_rate):
+    """
+    Compute a compact spectral fingerprint of mono audio.
+
+    Two views are derived from one spectrogram:
+    - sub-fingerprints: one 32-bit word per frame (about 86 per second) whose
+      bits are the signs of the time derivative of energy differences between
+      adjacent bands. Used to verify a candidate match by bit error rate.
+    - landmarks: hashes of pairs of spectral peaks with the frame of the
+      first peak. They survive re-encoding and sub-frame misalignment, so
+      they are what the lookup index is built from.
+
+    Args:
+        samples: 1-D int16 array of mono samples
+        sample_rate: Sample rate of samples
+
+    Returns:
+        tuple: (sub_fingerprints, landmarks) as a uint32 array and a list of
+        (hash, frame) tuples
+    """
+    power = _power_spectrogram(samples, sample_rate)
+    return _sub_fingerprints(power), _landmarks(power)
+
+
+def bit_error_rate(query, reference, offset):
+    """
+    Fraction of differing bits where query overlaps reference shifted by offset frames.
+
+    A positive offset means query starts offset frames into reference.
+
+    Returns:
+        tuple: (bit_error_rate, overlap_frames); the rate is 1.0 without overlap
+    """
+    start = max(offset, 0)
+    end = min(offset + len(query), len(reference))
+    if end <= start:
+        return 1.0, 0
+    diff = np.bitwise_xor(query[start - offset:end - offset], reference[start:end])
+    return float(np.unpackbits(diff.view(np.uint8)).mean()), end - start
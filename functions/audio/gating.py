@@ -0,0 +1,116 @@
+import numpy as np
+
+# Resolution of the energy gate
+GATE_FRAME_SECONDS = 0.05
+
+# Frames with an RMS level below this are silence. Low enough to keep quiet
+# playing and reverb tails; separation bleed in stems sits well under it.
+SILENCE_THRESHOLD_DBFS = -55.0
+
+# Silent gaps shorter than this are kept, so phrases aren't cut apart
+MIN_SILENCE_SECONDS = 1.0
+
+# Audio kept on each side of an active region, giving the model context for
+# onsets and letting notes decay
+REGION_PADDING_SECONDS = 0.5
+
+# Digital silence inserted between regions when they are joined for inference
+REGION_GAP_SECONDS = 0.25
+
+
+def active_regions(samples, sample_rate):
+    """
+    Find the spans of a mono signal that are not silent.
+
+    Returns:
+        list: (start_sample, end_sample) pairs, padded, merged and in order
+    """
+    frame = max(int(sample_rate * GATE_FRAME_SECONDS), 1)
+    frame_count = -(-len(samples) // frame)
+    if frame_count == 0:
+        return []
+
+    padded = np.zeros(frame_count * frame, dtype=np.float32)
+    padded[:len(samples)] = samples
+    frames = padded.reshape(frame_count, frame) / 32768.0
+    level_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    active = level_db > SILENCE_THRESHOLD_DBFS
+    if not active.any():
+        return []
+
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # Close gaps that are too short to be worth skipping
+    keep = (starts[1:] - ends[:-1]) * GATE_FRAME_SECONDS >= MIN_SILENCE_SECONDS
+    starts = np.concatenate((starts[:1], starts[1:][keep]))
+    ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+
+    pad = int(REGION_PADDING_SECONDS * sample_rate)
+    region_starts = np.maximum(starts * frame - pad, 0)
+    region_ends = np.minimum(ends * frame + pad, len(samples))
+
+    regions = []
+    for start, end in zip(region_starts.tolist(), region_ends.tolist()):
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def join_regions(samples, sample_rate, regions):
+    """
+    Concatenate active regions, separated by short silent gaps.
+
+    Returns:
+        tuple: (joined_samples, segments) where segments lists
+        (joined_start, original_start, duration) in seconds for each region,
+        to map times in the joined audio back with restore_note_times
+    """
+    gap = np.zeros(int(REGION_GAP_SECONDS * sample_rate), dtype=samples.dtype)
+    pieces = []
+    segments = []
+    position = 0
+    for start, end in regions:
+        if pieces:
+            pieces.append(gap)
+            position += len(gap)
+        pieces.append(samples[start:end])
+        segments.append((position / sample_rate, start / sample_rate, (end - start) / sample_rate))
+        position += end - start
+    joined = np.concatenate(pieces) if pieces else samples[:0]
+    return joined, segments
+
+
+def restore_note_times(note_events, segments):
+    """
+    Map note events from joined audio back onto the original timeline.
+
+    Notes are assigned to the region they start in and clipped to its end;
+    notes starting inside an inserted gap are dropped.
+
+    Returns:
+        list: Note event tuples sorted by onset
+    """
+    if not segments:
+        return []
+    joined_starts = np.array([segment[0] for segment in segments])
+    restored = []
+    for start, end, pitch, amplitude, pitch_bends in note_events:
+        index = int(np.searchsorted(joined_starts, start, side="right")) - 1
+        if index < 0:
+            continue
+        joined_start, original_start, duration = segments[index]
+        if start >= joined_start + duration:
+            continue
+        shift = original_start - joined_start
+        if end > joined_start + duration:
+            clipped = joined_start + duration
+            if pitch_bends and end > start:
+                pitch_bends = pitch_bends[:max(int(len(pitch_bends) * (clipped - start) / (end - start)), 1)]
+            end = clipped
+        restored.append((start + shift, end + shift, pitch, amplitude, pitch_bends))
+    restored.sort(key=lambda note: (note[0], note[2]))
+    return restored
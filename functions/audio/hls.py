@@ -0,0 +1,118 @@
+import posixpath
+from urllib.parse import quote, unquote, urlparse
+
+
+def is_master_playlist(text):
+    """Whether an m3u8 playlist lists variant streams rather than segments."""
+    return "#EXT-X-STREAM-INF" in text
+
+
+def parse_master_playlist(text):
+    """
+    Parse the variant streams of a master playlist.
+
+    Returns:
+        list: (bandwidth, uri) tuples in playlist order
+    """
+    variants = []
+    bandwidth = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF"):
+            bandwidth = 0
+            for attribute in line.split(":", 1)[1].split(","):
+                name, _, value = attribute.partition("=")
+                if name.strip() == "BANDWIDTH":
+                    bandwidth = int(value)
+        elif line and not line.startswith("#") and bandwidth is not None:
+            variants.append((bandwidth, line))
+            bandwidth = None
+    return variants
+
+
+def parse_media_playlist(text):
+    """
+    Parse the segments of a media playlist.
+
+    Returns:
+        list: (duration, uri) tuples in playlist order
+    """
+    segments = []
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+        elif line and not line.startswith("#") and duration is not None:
+            segments.append((duration, line))
+            duration = None
+    return segments
+
+
+def build_media_playlist(segments):
+    """
+    Write a complete (VOD) media playlist.
+
+    Args:
+        segments: (duration, uri) tuples in playback order
+    """
+    target_duration = max((int(-(-duration // 1)) for duration, _ in segments), default=1)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{target_duration}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD"
+    ]
+    for duration, uri in segments:
+        lines.append(f"#EXTINF:{duration:.6f},")
+        lines.append(uri)
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def build_master_playlist(variants, codecs="mp4a.40.2"):
+    """
+    Write a master playlist.
+
+    Args:
+        variants: (bandwidth, uri) tuples, one per media playlist
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for bandwidth, uri in variants:
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={int(bandwidth)},CODECS="{codecs}"')
+        lines.append(uri)
+    return "\n".join(lines) + "\n"
+
+
+def storage_path_from_url(url):
+    """
+    Convert any of the URL forms used for Storage objects into an object path.
+
+    Accepts gs:// URLs, Firebase download URLs
+    (https://firebasestorage.googleapis.com/v0/b/<bucket>/o/<path>),
+    https://storage.googleapis.com/<bucket>/<path> URLs and bare paths.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "gs":
+        return parsed.path.lstrip("/")
+    if parsed.netloc == "firebasestorage.googleapis.com":
+        return unquote(parsed.path.split("/o/", 1)[1])
+    if parsed.netloc == "storage.googleapis.com":
+        return unquote(parsed.path.lstrip("/").split("/", 1)[1])
+    return unquote(parsed.path).lstrip("/")
+
+
+def resolve_segment_path(playlist_path, uri):
+    """Storage path of a segment URI as written in the playlist at playlist_path."""
+    if "://" in uri:
+        return storage_path_from_url(uri)
+    return posixpath.normpath(posixpath.join(posixpath.dirname(playlist_path), uri))
+
+
+def storage_download_url(bucket_name, path):
+    """Firebase download URL for a public-read Storage object."""
+    return (
+        f"https://firebasestorage.googleapis.com/v0/b/{bucket_name}/o/"
+        f"{quote(path, safe='')}?alt=media"
+    )
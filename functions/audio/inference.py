@@ -0,0 +1,347 @@
+"""
+Optional shared basic-pitch inference server.
+
+One long-lived process owns the model. Clients (request handler threads,
+or batch worker processes) cut their audio into basic-pitch's input
+windows, place them in a shared memory block and send only its name over a
+local socket. The server gathers the windows of concurrent requests into
+batches, writes the model outputs back into each request's block and
+replies; the client then turns the outputs into note events itself.
+
+Enabled with the INFERENCE_SERVER environment variable: "local" starts a
+server owned by this process on first use, any other value is the socket
+path of a running server (with its key in INFERENCE_SERVER_AUTHKEY).
+"""
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing import get_context, shared_memory
+from multiprocessing.connection import Client, Listener
+import numpy as np
+from basic_pitch.constants import (
+    ANNOT_N_FRAMES,
+    AUDIO_N_SAMPLES,
+    AUDIO_SAMPLE_RATE,
+    FFT_HOP,
+    N_FREQ_BINS_CONTOURS,
+    N_FREQ_BINS_NOTES
+)
+
+# Windows overlap by this many output frames, as in basic_pitch.inference.run_inference
+OVERLAP_FRAMES = 30
+OVERLAP_SAMPLES = OVERLAP_FRAMES * FFT_HOP
+HOP_SAMPLES = AUDIO_N_SAMPLES - OVERLAP_SAMPLES
+
+# Per-window model outputs, in the order they follow the input in shared memory
+OUTPUT_SHAPES = {
+    "note": (ANNOT_N_FRAMES, N_FREQ_BINS_NOTES),
+    "onset": (ANNOT_N_FRAMES, N_FREQ_BINS_NOTES),
+    "contour": (ANNOT_N_FRAMES, N_FREQ_BINS_CONTOURS)
+}
+
+# Most windows run through the model at once (about 2 s of audio each)
+MAX_BATCH_WINDOWS = int(os.getenv('INFERENCE_MAX_BATCH_WINDOWS', '32'))
+
+# How long the server waits for other requests to fill a batch
+BATCH_WAIT_SECONDS = float(os.getenv('INFERENCE_BATCH_WAIT_MS', '5')) / 1000
+
+# How long a client waits for a server it started to load the model
+SERVER_START_TIMEOUT_SECONDS = 180
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def window_audio(audio):
+    """
+    Cut 22.05 kHz mono audio into the model's overlapping input windows.
+
+    Returns:
+        np.ndarray: float32 windows of shape (n_windows, AUDIO_N_SAMPLES, 1)
+    """
+    padded = np.concatenate([np.zeros(OVERLAP_SAMPLES // 2, dtype=np.float32), audio.astype(np.float32)])
+    starts = range(0, len(padded), HOP_SAMPLES)
+    windows = np.zeros((len(starts), AUDIO_N_SAMPLES, 1), dtype=np.float32)
+    for i, start in enumerate(starts):
+        window = padded[start:start + AUDIO_N_SAMPLES]
+        windows[i, :len(window), 0] = window
+    return windows
+
+
+def load_windows(audio_path):
+    """
+    Load an audio file as basic-pitch does and cut it into input windows.
+
+    Returns:
+        tuple: (windows, original_length) with the length in samples at 22.05 kHz
+    """
+    import librosa
+
+    audio, _ = librosa.load(str(audio_path), sr=AUDIO_SAMPLE_RATE, mono=True)
+    return window_audio(audio), len(audio)
+
+
+def notes_from_outputs(outputs, original_length):
+    """
+    Turn per-window model outputs into note events, with basic-pitch's default settings.
+
+    Returns:
+        list: (start_time, end_time, pitch, amplitude, pitch_bends) tuples
+    """
+    from basic_pitch import note_creation
+    from basic_pitch.inference import unwrap_output
+
+    unwrapped = {
+        name: unwrap_output(output, original_length, OVERLAP_FRAMES) for name, output in outputs.items()
+    }
+    _, note_events = note_creation.model_output_to_notes(
+        unwrapped,
+        onset_thresh=0.5,
+        frame_thresh=0.3,
+        min_note_len=int(np.round(127.70 / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP))),
+        min_freq=None,
+        max_freq=None,
+        multiple_pitch_bends=False,
+        melodia_trick=True,
+        midi_tempo=120
+    )
+    return note_events
+
+
+def _block_views(buffer, window_count):
+    """numpy views of a request's input windows and outputs in a shared memory block."""
+    views = {}
+    offset = 0
+    for name, shape in [("windows", (AUDIO_N_SAMPLES, 1)), *OUTPUT_SHAPES.items()]:
+        full_shape = (window_count, *shape)
+        views[name] = np.ndarray(full_shape, dtype=np.float32, buffer=buffer, offset=offset)
+        offset += int(np.prod(full_shape)) * 4
+    return views
+
+
+def _block_bytes(window_count):
+    per_window = AUDIO_N_SAMPLES + sum(int(np.prod(shape)) for shape in OUTPUT_SHAPES.values())
+    return window_count * per_window * 4
+
+
+class _Request:
+    def __init__(self, connection, block, window_count):
+        self.connection = connection
+        self.block = block
+        self.views = _block_views(block.buf, window_count)
+        self.window_count = window_count
+
+    def finish(self, reply):
+        self.views = None
+        self.block.close()
+        self.connection.send(reply)
+
+
+def _serve_connection(connection, requests):
+    try:
+        while True:
+            message = connection.recv()
+            if message.get("stats"):
+                connection.send({"status": "ok", "stats": requests.stats})
+                continue
+            # Servers are spawned by start_server, so they share their clients'
+            # resource tracker and attaching doesn't take over the block, which
+            # the client unlinks
+            block = shared_memory.SharedMemory(name=message["block"])
+            requests.put(_Request(connection, block, message["windows"]))
+    except (EOFError, ConnectionResetError):
+        pass
+    finally:
+        connection.close()
+
+
+class _RequestQueue(queue.Queue):
+    def __init__(self):
+        super().__init__()
+        self.stats = {"requests": 0, "windows": 0, "batches": 0, "maxBatchRequests": 0, "modelSeconds": 0.0}
+
+
+def _run_batches(model, requests, max_batch_windows, batch_wait):
+    while True:
+        batch = [requests.get()]
+        window_count = batch[0].window_count
+        deadline = time.monotonic() + batch_wait
+        while window_count < max_batch_windows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+            window_count += batch[-1].window_count
+
+        try:
+            started = time.monotonic()
+            windows = np.concatenate([request.views["windows"] for request in batch])
+            outputs = {name: [] for name in OUTPUT_SHAPES}
+            for start in range(0, len(windows), max_batch_windows):
+                for name, output in model.predict(windows[start:start + max_batch_windows]).items():
+                    outputs[name].append(output)
+            outputs = {name: np.concatenate(parts) for name, parts in outputs.items()}
+
+            position = 0
+            for request in batch:
+                for name in OUTPUT_SHAPES:
+                    request.views[name][:] = outputs[name][position:position + request.window_count]
+                position += request.window_count
+            reply = {"status": "ok"}
+
+            stats = requests.stats
+            stats["requests"] += len(batch)
+            stats["windows"] += len(windows)
+            stats["batches"] += 1
+            stats["maxBatchRequests"] = max(stats["maxBatchRequests"], len(batch))
+            stats["modelSeconds"] += time.monotonic() - started
+        except Exception as e:
+            print(f"Inference batch failed: {e}")
+            reply = {"status": "error", "error": str(e)}
+
+        for request in batch:
+            try:
+                request.finish(reply)
+            except OSError as e:
+                print(f"Warning: Failed to reply to inference client: {e}")
+
+
+def serve(address, authkey, max_batch_windows=MAX_BATCH_WINDOWS, batch_wait=BATCH_WAIT_SECONDS, model=None):
+    """
+    Run an inference server on a Unix socket until the process is killed.
+
+    Args:
+        model: Anything with basic-pitch's Model.predict; the basic-pitch
+            model is loaded if not given
+    """
+    if model is None:
+        from audio.pipeline import get_model
+        model = get_model()
+    requests = _RequestQueue()
+    threading.Thread(
+        target=_run_batches, args=(model, requests, max_batch_windows, batch_wait), daemon=True
+    ).start()
+
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+        print(f"Inference server listening on {address}")
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=_serve_connection, args=(connection, requests), daemon=True).start()
+
+
+def start_server(address=None, authkey=None):
+    """
+    Start an inference server process and wait until its model is loaded.
+
+    Returns:
+        tuple: (process, address, authkey)
+    """
+    address = address or os.path.join(tempfile.gettempdir(), f"basic-pitch-{uuid.uuid4().hex[:8]}.sock")
+    authkey = authkey or os.urandom(16)
+    # TensorFlow isn't fork-safe, so the server is spawned fresh
+    process = get_context("spawn").Process(target=serve, args=(address, authkey), name="inference-server", daemon=True)
+    process.start()
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while True:
+        try:
+            Client(address, family="AF_UNIX", authkey=authkey).close()
+            return process, address, authkey
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not process.is_alive():
+                raise RuntimeError(f"Inference server exited with code {process.exitcode}")
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise TimeoutError("Inference server did not start")
+            time.sleep(0.1)
+
+
+class InferenceClient:
+    """Sends windows to an inference server; one connection per calling thread."""
+
+    def __init__(self, address, authkey, process=None):
+        self.address = address
+        self.authkey = authkey
+        # Set when this process started the server
+        self.process = process
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            self._local.connection = connection
+        return connection
+
+    def _call(self, message):
+        connection = self._connection()
+        try:
+            connection.send(message)
+            reply = connection.recv()
+        except (EOFError, OSError):
+            self._local.connection = None
+            raise
+        if reply["status"] != "ok":
+            raise RuntimeError(f"Inference server error: {reply.get('error')}")
+        return reply
+
+    def predict(self, windows):
+        """
+        Run the model on input windows.
+
+        Returns:
+            dict: "note", "onset" and "contour" outputs, one row per window
+        """
+        block = shared_memory.SharedMemory(create=True, size=max(_block_bytes(len(windows)), 1))
+        views = None
+        try:
+            views = _block_views(block.buf, len(windows))
+            views["windows"][:] = windows
+            self._call({"block": block.name, "windows": len(windows)})
+            return {name: views[name].copy() for name in OUTPUT_SHAPES}
+        finally:
+            views = None
+            block.close()
+            block.unlink()
+
+    def stats(self):
+        return self._call({"stats": True})["stats"]
+
+
+def inference_client():
+    """
+    The process-wide inference client, or None if INFERENCE_SERVER isn't set.
+
+    With INFERENCE_SERVER=local the first call starts a server for this process.
+    """
+    global _client
+    setting = os.getenv('INFERENCE_SERVER')
+    if not setting:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if setting == "local":
+                    print("Starting inference server...")
+                    process, address, authkey = start_server()
+                    _client = InferenceClient(address, authkey, process)
+                else:
+                    authkey = bytes.fromhex(os.getenv('INFERENCE_SERVER_AUTHKEY', ''))
+                    _client = InferenceClient(setting, authkey)
+    return _client
+
+
+def server_stats():
+    """Batching counters of the inference server this process has used, or None."""
+    if _client is None:
+        return None
+    try:
+        return {"address": _client.address, **_client.stats()}
+    except (EOFError, OSError, RuntimeError) as e:
+        return {"address": _client.address, "error": str(e)}
@@ -0,0 +1,89 @@
+import re
+
+# Notes whose onsets are closer than this are one chord; the highest note
+# is taken as the melody
+CHORD_SECONDS = 0.05
+
+# Shorter notes are ornaments or transcription noise
+MIN_MELODY_NOTE_SECONDS = 0.1
+
+# Intervals per n-gram. Three intervals (four notes) are distinctive enough
+# to index while short hummed queries still contain several of them.
+NGRAM_INTERVALS = 3
+
+# Larger leaps are folded into this range, so octave errors in hummed or
+# transcribed melodies don't break matches
+MAX_INTERVAL = 12
+
+NOTE_NAME_PATTERN = re.compile(r"^([A-Ga-g])([#b]*)(-?\d+)$")
+NOTE_OFFSETS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+
+def note_name_to_pitch(name):
+    """
+    MIDI pitch of a note name such as "C4", "F#3" or "Bb5" (C4 is 60).
+
+    Raises:
+        ValueError: If name is not a note name
+    """
+    match = NOTE_NAME_PATTERN.match(name.strip())
+    if not match:
+        raise ValueError(f"Invalid note name: {name}")
+    letter, accidentals, octave = match.groups()
+    return 12 * (int(octave) + 1) + NOTE_OFFSETS[letter.upper()] + accidentals.count("#") - accidentals.count("b")
+
+
+def melody_contour(note_events):
+    """
+    Reduce (possibly polyphonic) note events to a single melody line.
+
+    The top note of each chord is kept, short notes are dropped and repeated
+    pitches are merged, since hummed and transcribed melodies disagree most
+    about how often a note is re-struck.
+
+    Returns:
+        list: (onset_time, pitch) pairs in time order
+    """
+    notes = sorted(
+        (float(start), int(pitch)) for start, end, pitch, *_ in note_events
+        if end - start >= MIN_MELODY_NOTE_SECONDS
+    )
+    contour = []
+    chord_start = None
+    for onset, pitch in notes:
+        if chord_start is not None and onset - chord_start < CHORD_SECONDS:
+            if pitch > contour[-1][1]:
+                contour[-1] = (contour[-1][0], pitch)
+            continue
+        chord_start = onset
+        contour.append((onset, pitch))
+
+    melody = []
+    for onset, pitch in contour:
+        if not melody or melody[-1][1] != pitch:
+            melody.append((onset, pitch))
+    return melody
+
+
+def _fold_interval(interval):
+    while abs(interval) > MAX_INTERVAL:
+        interval -= 12 if interval > 0 else -12
+    return interval
+
+
+def interval_ngrams(contour, size=NGRAM_INTERVALS):
+    """
+    Transposition-invariant n-grams of a melody's pitch intervals.
+
+    Returns:
+        list: (key, note_index, onset_time) for every run of size intervals,
+        where key is the intervals in semitones joined by commas (e.g. "2,2,-4")
+        and note_index is the position of the run's first note in the contour
+    """
+    intervals = [
+        _fold_interval(contour[i + 1][1] - contour[i][1]) for i in range(len(contour) - 1)
+    ]
+    return [
+        (",".join(str(interval) for interval in intervals[i:i + size]), i, contour[i][0])
+        for i in range(len(intervals) - size + 1)
+    ]
@@ -0,0 +1,171 @@
+"""
+Standard MIDI File encoding of note events, without pretty_midi.
+
+Files are written byte for byte as basic-pitch's note_events_to_midi and
+pretty_midi would write them (120 BPM, 220 ticks per beat, one Electric
+Piano track, pitch bends dropped from overlapping notes), but the events
+are built and ordered as numpy arrays and written straight into one buffer.
+"""
+import struct
+import numpy as np
+
+TICKS_PER_BEAT = 220
+TEMPO_BPM = 120
+TICK_SECONDS = 60.0 / (TEMPO_BPM * TICKS_PER_BEAT)
+
+# General MIDI "Electric Piano 1", the instrument basic-pitch writes
+PROGRAM = 4
+
+# basic-pitch's pitch bends are in contour bins, three per semitone; MIDI
+# pitch wheel values span +/-2 semitones
+BEND_BINS_PER_SEMITONE = 3
+PITCH_WHEEL_MIN = -8192
+PITCH_WHEEL_MAX = 8191
+
+NOTE_ON = 0x90
+PITCH_WHEEL = 0xE0
+
+# Ordering of events on the same tick, as pretty_midi sorts them
+_PITCH_WHEEL_RANK = 7 * 256 * 256
+_NOTE_RANK = 10 * 256 * 256
+
+# Tempo, then 4/4 time signature, then the end of the track one tick later
+_TIMING_TRACK = (
+    b"\x00\xff\x51\x03" + (60_000_000 // TEMPO_BPM).to_bytes(3, "big") +
+    b"\x00\xff\x58\x04\x04\x02\x18\x08" +
+    b"\x01\xff\x2f\x00"
+)
+_END_OF_TRACK = b"\x01\xff\x2f\x00"
+
+
+def _ticks(times):
+    """Absolute ticks of times in seconds, rounded as pretty_midi does."""
+    times = np.asarray(times, dtype=np.float64)
+    return np.where(times > 0, np.round(times / TICK_SECONDS), 0).astype(np.int64)
+
+
+def _overlapping(starts, ends):
+    """Mask of notes that overlap another note in time (see basic-pitch's drop_overlapping_pitch_bends)."""
+    order = np.lexsort((ends, starts))
+    sorted_starts, sorted_ends = starts[order], ends[order]
+    overlapping = np.zeros(len(starts), dtype=bool)
+    if len(starts) > 1:
+        # Overlaps a later note: the next one starts before this one ends
+        overlapping[:-1] = sorted_starts[1:] < sorted_ends[:-1]
+        # Overlaps an earlier note: one of them is still sounding
+        overlapping[1:] |= np.maximum.accumulate(sorted_ends[:-1]) > sorted_starts[1:]
+    mask = np.zeros(len(starts), dtype=bool)
+    mask[order] = overlapping
+    return mask
+
+
+def _variable_length(values):
+    """MIDI variable-length quantities as a (n, 4) byte array and each one's length."""
+    lengths = np.ones(len(values), dtype=np.int64)
+    for bits in (7, 14, 21):
+        lengths += values >= (1 << bits)
+    encoded = np.zeros((len(values), 4), dtype=np.uint8)
+    for position in range(4):
+        # Byte position of 4 holds bits 7 * (length - 1 - position)
+        shift = 7 * (lengths - 1 - position)
+        used = shift >= 0
+        byte = (values >> np.maximum(shift, 0)) & 0x7F
+        continuation = np.where(shift > 0, 0x80, 0)
+        encoded[:, position] = np.where(used, byte | continuation, 0)
+    return encoded, lengths
+
+
+def encode_midi(starts, ends, pitches, velocities, pitch_bends=None):
+    """
+    Encode notes as a Standard MIDI File.
+
+    Args:
+        starts, ends: Note times in seconds
+        pitches: MIDI note numbers
+        velocities: MIDI velocities (0-127)
+        pitch_bends: Optional per-note lists of pitch bends in contour bins
+            (or None), spread evenly over the note as basic-pitch outputs them
+
+    Returns:
+        bytes: The MIDI file
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    pitches = np.asarray(pitches, dtype=np.int64)
+    velocities = np.asarray(velocities, dtype=np.int64)
+    count = len(starts)
+    if count == 0:
+        return b"MThd" + struct.pack(">IHHH", 6, 1, 1, TICKS_PER_BEAT) + \
+            b"MTrk" + struct.pack(">I", len(_TIMING_TRACK)) + _TIMING_TRACK
+
+    # Note on and note off (a note on with velocity 0) per note
+    ticks = [_ticks(starts), _ticks(ends)]
+    ranks = [_NOTE_RANK + pitches * 256 + velocities, _NOTE_RANK + pitches * 256]
+    statuses = [np.full(count, NOTE_ON), np.full(count, NOTE_ON)]
+    data = [np.stack([pitches, velocities], axis=1), np.stack([pitches, np.zeros(count, dtype=np.int64)], axis=1)]
+
+    if pitch_bends is not None:
+        bent = [
+            i for i in np.flatnonzero(~_overlapping(starts, ends)).tolist()
+            if pitch_bends[i]
+        ]
+        if bent:
+            bend_counts = np.array([len(pitch_bends[i]) for i in bent], dtype=np.int64)
+            values = np.concatenate([np.asarray(pitch_bends[i], dtype=np.float64) for i in bent])
+            values = np.clip(np.round(values * 4096 / BEND_BINS_PER_SEMITONE).astype(np.int64),
+                             PITCH_WHEEL_MIN, PITCH_WHEEL_MAX)
+            times = np.concatenate([np.linspace(starts[i], ends[i], n) for i, n in zip(bent, bend_counts)])
+            wheel = values - PITCH_WHEEL_MIN
+            ticks.append(_ticks(times))
+            ranks.append(_PITCH_WHEEL_RANK + values)
+            statuses.append(np.full(len(values), PITCH_WHEEL))
+            data.append(np.stack([wheel & 0x7F, wheel >> 7], axis=1))
+
+    ticks = np.concatenate(ticks)
+    ranks = np.concatenate(ranks)
+    statuses = np.concatenate(statuses)
+    data = np.concatenate(data)
+    order = np.lexsort((ranks, ticks))
+    ticks, statuses, data = ticks[order], statuses[order], data[order]
+
+    # Delta times, status bytes (left out while running status applies) and data bytes
+    deltas, delta_lengths = _variable_length(np.diff(ticks, prepend=0))
+    write_status = np.ones(len(ticks), dtype=bool)
+    write_status[1:] = statuses[1:] != statuses[:-1]
+    rows = np.zeros((len(ticks), 7), dtype=np.uint8)
+    rows[:, :4] = deltas
+    rows[:, 4] = statuses
+    rows[:, 5:] = data
+    used = np.zeros((len(ticks), 7), dtype=bool)
+    used[:, :4] = np.arange(4) < delta_lengths[:, None]
+    used[:, 4] = write_status
+    used[:, 5:] = True
+
+    events = rows[used].tobytes()
+    track = b"\x00\xc0" + bytes([PROGRAM]) + events + _END_OF_TRACK
+    return b"".join([
+        b"MThd", struct.pack(">IHHH", 6, 1, 2, TICKS_PER_BEAT),
+        b"MTrk", struct.pack(">I", len(_TIMING_TRACK)), _TIMING_TRACK,
+        b"MTrk", struct.pack(">I", len(track)), track
+    ])
+
+
+def note_events_to_midi_bytes(note_events, time_offset=0.0):
+    """
+    Encode note events as a Standard MIDI File and return its bytes.
+
+    Args:
+        note_events: (start_time, end_time, pitch, amplitude, pitch_bends) tuples
+        time_offset: Subtracted from every time, to re-time notes of a range
+            to start at 0
+    """
+    if not note_events:
+        return encode_midi([], [], [], [])
+    starts, ends, pitches, amplitudes, pitch_bends = zip(*note_events)
+    return encode_midi(
+        np.asarray(starts, dtype=np.float64) - time_offset,
+        np.asarray(ends, dtype=np.float64) - time_offset,
+        pitches,
+        np.round(127 * np.asarray(amplitudes, dtype=np.float64)).astype(np.int64),
+        pitch_bends
+    )
@@ -0,0 +1,265 @@
+import hashlib
+import os
+import subprocess
+import threading
+import numpy as np
+
+# Gains are snapped to this step so near-identical mixes share one rendition
+GAIN_STEP = 0.1
+
+# Highest gain accepted for a stem
+MAX_GAIN = 2.0
+
+MIX_SAMPLE_RATE = 44100
+MIX_CHANNELS = 2
+MIX_BITRATE = "192k"
+
+# Samples of each stem summed at a time while streaming a mix
+MIX_BLOCK_SAMPLES = MIX_SAMPLE_RATE
+
+
+def quantize_gains(gains):
+    """
+    Snap gains to GAIN_STEP within [0, MAX_GAIN] and drop silent stems.
+
+    Returns:
+        dict: Stem name to quantized gain, sorted by stem name
+    """
+    quantized = {}
+    for stem, gain in sorted(gains.items()):
+        steps = round(min(max(float(gain), 0.0), MAX_GAIN) / GAIN_STEP)
+        if steps > 0:
+            quantized[stem] = round(steps * GAIN_STEP, 2)
+    return quantized
+
+
+def mix_key(quantized_gains, sources=()):
+    """
+    Stable cache key for a quantized mix.
+
+    sources identify the stem renditions mixed (e.g. their playlist URLs),
+    so a mix of replaced stems, such as previews upgraded to full quality,
+    gets a new key instead of the cached rendition of the old ones.
+    """
+    description = ",".join(f"{stem}={gain:.2f}" for stem, gain in sorted(quantized_gains.items())) + \
+        "|" + ",".join(sources)
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()[:16]
+
+
+def mix_segments(stem_samples, gains):
+    """
+    Sum decoded stem segments with per-stem gains.
+
+    Stems whose decoded lengths differ by a few samples (encoder padding) are
+    zero-padded to the longest one before summing.
+
+    Args:
+        stem_samples: list of (n_samples, channels) float32 arrays
+        gains: list of gains, one per stem
+
+    Returns:
+        numpy.ndarray: Mixed (n_samples, channels) float32 array, clipped to [-1, 1]
+    """
+    length = max(len(samples) for samples in stem_samples)
+    channels = stem_samples[0].shape[1]
+    stacked = np.zeros((len(stem_samples), length, channels), dtype=np.float32)
+    for i, samples in enumerate(stem_samples):
+        stacked[i, :len(samples)] = samples
+
+    mixed = np.tensordot(np.asarray(gains, dtype=np.float32), stacked, axes=1)
+    return np.clip(mixed, -1.0, 1.0, out=mixed)
+
+
+class DecodeStream:
+    """
+    ffmpeg decoding a sequence of MPEG-TS segments as one continuous stream.
+
+    Segments of one HLS rendition have continuous timestamps, so decoding
+    them back to back avoids the decoder priming at every segment boundary
+    that separately decoded segments have. The segments are fed from a
+    thread, so a generator that downloads them overlaps with decoding.
+    """
+
+    def __init__(self, segments, sample_rate=MIX_SAMPLE_RATE, channels=MIX_CHANNELS):
+        self.process = subprocess.Popen(
+            [
+                'ffmpeg', '-f', 'mpegts', '-i', 'pipe:0',
+                '-f', 'f32le', '-acodec', 'pcm_f32le',
+                '-ar', str(sample_rate), '-ac', str(channels),
+                '-loglevel', 'error', 'pipe:1'
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self.stdout = self.process.stdout
+        self.error = None
+        self._feeder = threading.Thread(target=self._feed, args=(segments,), daemon=True)
+        self._feeder.start()
+
+    def _feed(self, segments):
+        try:
+            for data in segments:
+                self.process.stdin.write(data)
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            # Reported by close(), so a failed download doesn't truncate the mix silently
+            self.error = e
+        finally:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def read(self, size):
+        return self.stdout.read(size)
+
+    def close(self):
+        """Wait for ffmpeg and raise if feeding or decoding failed."""
+        self._feeder.join()
+        self.stdout.close()
+        returncode = self.process.wait()
+        if self.error is not None:
+            raise self.error
+        if returncode != 0:
+            raise Exception(f"FFmpeg decode failed with code {returncode}")
+
+
+def decode_segments(segments, sample_rate=MIX_SAMPLE_RATE, channels=MIX_CHANNELS):
+    """
+    Decode consecutive MPEG-TS segments of one rendition as one continuous stream.
+
+    Args:
+        segments: Iterable of the segments' bytes, in order
+
+    Returns:
+        numpy.ndarray: Array of shape (n_samples, channels)
+    """
+    stream = DecodeStream(segments, sample_rate, channels)
+    try:
+        data = stream.read(-1)
+    except BaseException:
+        stream.process.kill()
+        raise
+    stream.close()
+    frame_bytes = channels * 4
+    return np.frombuffer(data[:len(data) - len(data) % frame_bytes], dtype=np.float32).reshape(-1, channels)
+
+
+def encode_segments(samples, durations, ts_offset, output_dir, sample_rate=MIX_SAMPLE_RATE, bitrate=MIX_BITRATE):
+    """
+    Encode float32 samples as one continuous AAC stream cut into MPEG-TS segments.
+
+    The stream is cut after each of durations, so the segments line up with
+    an existing segmentation, and its timestamps start at ts_offset, its
+    start time in the rendition. As in render_mix, the encoder keeps its
+    state across the cuts.
+
+    Returns:
+        list: Paths of the segment files in output_dir, one per duration
+    """
+    cuts = np.cumsum(durations)[:-1]
+    if len(cuts):
+        split = ['-segment_times', ",".join(f"{cut:.6f}" for cut in cuts)]
+    else:
+        split = ['-segment_time', f"{sum(durations) + 1:.6f}"]
+    pattern = os.path.join(output_dir, "segment_%05d.ts")
+    result = subprocess.run(
+        [
+            'ffmpeg', '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(samples.shape[1]),
+            '-i', 'pipe:0',
+            '-c:a', 'aac', '-b:a', bitrate,
+            '-output_ts_offset', f"{ts_offset:.6f}",
+            '-f', 'segment', '-segment_format', 'mpegts', *split,
+            '-loglevel', 'error', pattern
+        ],
+        input=np.ascontiguousarray(samples, dtype=np.float32).tobytes(),
+        capture_output=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg encode failed: {result.stderr.decode('utf-8', 'ignore')}")
+    paths = [pattern % i for i in range(len(durations))]
+    if not all(os.path.exists(path) for path in paths):
+        raise Exception(f"FFmpeg wrote fewer than {len(durations)} segments")
+    return paths
+
+
+def mix_streams(streams, gains, output, channels=MIX_CHANNELS, block_samples=MIX_BLOCK_SAMPLES):
+    """
+    Mix float32 PCM streams block by block into a writable file.
+
+    Only one block per stream is in memory at a time. A stream that ends
+    early is treated as silence for the rest of the mix.
+
+    Args:
+        streams: Readable binary streams of interleaved float32 samples
+        gains: Gains, one per stream
+        output: Writable binary stream for the mixed samples
+    """
+    frame_bytes = channels * 4
+    while True:
+        blocks = []
+        for stream in streams:
+            data = stream.read(block_samples * frame_bytes)
+            data = data[:len(data) - len(data) % frame_bytes]
+            blocks.append(np.frombuffer(data, dtype=np.float32).reshape(-1, channels))
+        if not any(len(block) for block in blocks):
+            return
+        output.write(mix_segments(blocks, gains).tobytes())
+
+
+def render_mix(stem_segments, gains, output_dir, segment_seconds, bitrate=MIX_BITRATE,
+               sample_rate=MIX_SAMPLE_RATE, channels=MIX_CHANNELS):
+    """
+    Mix stems and encode the mix as one continuous AAC stream cut into HLS segments.
+
+    Encoding the whole mix in one pass keeps the encoder's state across
+    segment boundaries, so the rendition has no priming gaps or clicks
+    between segments.
+
+    Args:
+        stem_segments: Per stem, an iterable of its MPEG-TS segments' bytes in order
+        gains: Gains, one per stem
+        output_dir: Directory for the segments and playlist.m3u8
+        segment_seconds: Target segment duration
+
+    Returns:
+        str: Path of the media playlist, whose segment URIs are file names in output_dir
+    """
+    playlist_path = os.path.join(output_dir, "playlist.m3u8")
+    encoder = subprocess.Popen(
+        [
+            'ffmpeg', '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels),
+            '-i', 'pipe:0',
+            '-c:a', 'aac', '-b:a', bitrate,
+            '-f', 'hls', '-hls_time', f"{segment_seconds:.6f}", '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', os.path.join(output_dir, "segment_%05d.ts"),
+            '-loglevel', 'error', playlist_path
+        ],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    decoders = [DecodeStream(segments, sample_rate, channels) for segments in stem_segments]
+    failed = True
+    try:
+        mix_streams(decoders, gains, encoder.stdin, channels)
+        failed = False
+    except BrokenPipeError:
+        # The encoder exited early; its error is raised below
+        pass
+    finally:
+        if failed:
+            for decoder in decoders:
+                decoder.process.kill()
+        try:
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = encoder.stderr.read()
+        encoder.wait()
+    if encoder.returncode != 0:
+        raise Exception(f"FFmpeg encode failed: {stderr.decode('utf-8', 'ignore')}")
+    for decoder in decoders:
+        decoder.close()
+    return playlist_path
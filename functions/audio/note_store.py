@@ -0,0 +1,156 @@
+import struct
+import numpy as np
+from audio.midi import encode_midi
+
+# Identifies the binary note store format and its version
+NOTE_STORE_MAGIC = b"ECNOTES1"
+
+# Magic, note count, pitch bend count and the longest note's duration,
+# padded so the note table starts 8-byte aligned
+HEADER_FORMAT = "<8sIId"
+HEADER_BYTES = 32
+
+# One row per note, sorted by onset. "reach" is the latest offset of this
+# note and every note before it, which is non-decreasing and so can be
+# binary-searched for the first note that may still be sounding at a time.
+# A note's pitch bends are bends[bend_start:bend_start + bend_count].
+NOTE_DTYPE = np.dtype([
+    ("onset", "<f4"),
+    ("offset", "<f4"),
+    ("reach", "<f4"),
+    ("bend_start", "<u4"),
+    ("bend_count", "<u2"),
+    ("pitch", "u1"),
+    ("velocity", "u1")
+])
+
+BEND_DTYPE = np.dtype("<i2")
+
+
+def encode_note_store(note_events):
+    """
+    Encode note events as a binary note store.
+
+    Times are stored as float32 (sub-millisecond for tracks of a few hours)
+    and amplitudes as MIDI velocities.
+
+    Returns:
+        bytes: Header, note table and pitch bends, readable with NoteStore
+    """
+    notes = sorted(note_events, key=lambda n: (n[0], n[2]))
+    table = np.zeros(len(notes), dtype=NOTE_DTYPE)
+    bend_counts = np.array([len(n[4]) if n[4] else 0 for n in notes], dtype=np.int64)
+
+    if notes:
+        table["onset"] = [n[0] for n in notes]
+        table["offset"] = [n[1] for n in notes]
+        table["reach"] = np.maximum.accumulate(table["offset"])
+        table["pitch"] = [n[2] for n in notes]
+        table["velocity"] = np.clip(np.round(127 * np.array([n[3] for n in notes], dtype=np.float64)), 0, 127)
+        table["bend_count"] = bend_counts
+        table["bend_start"] = np.cumsum(bend_counts) - bend_counts
+    bends = np.array([b for n in notes if n[4] for b in n[4]], dtype=BEND_DTYPE)
+    max_note_duration = float((table["offset"] - table["onset"]).max()) if notes else 0.0
+
+    header = struct.pack(HEADER_FORMAT, NOTE_STORE_MAGIC, len(table), len(bends), max_note_duration)
+    return header.ljust(HEADER_BYTES, b"\0") + table.tobytes() + bends.tobytes()
+
+
+class NoteStore:
+    """
+    Read-only view of an encoded note store.
+
+    The arrays are views into the given buffer, so a store opened from a
+    file with open() is memory-mapped rather than read and parsed.
+    """
+
+    def __init__(self, buffer):
+        magic, note_count, bend_count, max_note_duration = struct.unpack_from(HEADER_FORMAT, buffer)
+        if magic != NOTE_STORE_MAGIC:
+            raise ValueError("Not a note store")
+        bends_offset = HEADER_BYTES + note_count * NOTE_DTYPE.itemsize
+        self.notes = np.frombuffer(buffer, dtype=NOTE_DTYPE, count=note_count, offset=HEADER_BYTES)
+        self.bends = np.frombuffer(buffer, dtype=BEND_DTYPE, count=bend_count, offset=bends_offset)
+        self.max_note_duration = max_note_duration
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a note store file."""
+        return cls(np.memmap(path, dtype=np.uint8, mode="r"))
+
+    def __len__(self):
+        return len(self.notes)
+
+    def range_indices(self, start_time, end_time):
+        """
+        Indices of the notes sounding in [start_time, end_time), in onset order.
+
+        Two binary searches bound the candidates: notes starting before
+        end_time, from the first whose reach extends past start_time. Only
+        those are checked against their own offset.
+        """
+        notes = self.notes
+        high = int(np.searchsorted(notes["onset"], end_time, side="left"))
+        low = int(np.searchsorted(notes["reach"][:high], start_time, side="right"))
+        return low + np.flatnonzero(notes["offset"][low:high] > start_time)
+
+    def _clip(self, start_time, end_time):
+        """
+        Columns of the notes sounding in [start_time, end_time), clipped and re-timed to the range.
+
+        Returns:
+            tuple: (selected rows, relative starts, relative ends, pitch bend
+            lists), ordered by clipped start and pitch
+        """
+        selected = self.notes[self.range_indices(start_time, end_time)]
+        starts = np.maximum(selected["onset"].astype(np.float64), start_time)
+        order = np.lexsort((selected["pitch"], starts))
+        selected, starts = selected[order], starts[order]
+        onsets = selected["onset"].astype(np.float64)
+        offsets = selected["offset"].astype(np.float64)
+        ends = np.minimum(offsets, end_time)
+
+        pitch_bends = []
+        for i, (bend_start, count) in enumerate(zip(selected["bend_start"].tolist(), selected["bend_count"].tolist())):
+            bends = None
+            if count:
+                bends = self.bends[bend_start:bend_start + count].tolist()
+                if starts[i] > onsets[i] or ends[i] < offsets[i]:
+                    duration = offsets[i] - onsets[i]
+                    first = int(round((starts[i] - onsets[i]) / duration * (count - 1)))
+                    last = int(round((ends[i] - onsets[i]) / duration * (count - 1)))
+                    bends = bends[first:last + 1] or None
+            pitch_bends.append(bends)
+        return selected, np.round(starts - start_time, 4), np.round(ends - start_time, 4), pitch_bends
+
+    def slice(self, start_time, end_time):
+        """
+        Select notes sounding in [start_time, end_time) and re-time them to the range.
+
+        Notes crossing the range boundaries are clipped, with their pitch
+        bends trimmed in proportion.
+
+        Returns:
+            list: Note event tuples with times relative to start_time
+        """
+        selected, starts, ends, pitch_bends = self._clip(start_time, end_time)
+        return list(zip(
+            starts.tolist(),
+            ends.tolist(),
+            selected["pitch"].tolist(),
+            (selected["velocity"] / 127.0).tolist(),
+            pitch_bends
+        ))
+
+    def midi(self, start_time, end_time):
+        """
+        Encode the notes sounding in [start_time, end_time) as a MIDI file.
+
+        The same file as note_events_to_midi_bytes(self.slice(...)), encoded
+        from the note table's columns without building note event tuples.
+
+        Returns:
+            bytes: The MIDI file, with times relative to start_time
+        """
+        selected, starts, ends, pitch_bends = self._clip(start_time, end_time)
+        return encode_midi(starts, ends, selected["pitch"], selected["velocity"], pitch_bends)
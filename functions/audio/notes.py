@@ -0,0 +1,12 @@
+def note_events_to_json(note_events):
+    """JSON-serialisable notes as returned by transcribe_to_midi's "notes" format."""
+    return [
+        {
+            "startTime": round(float(start), 4),
+            "endTime": round(float(end), 4),
+            "pitch": int(pitch),
+            "velocity": int(round(127 * float(amplitude))),
+            "pitchBends": [int(b) for b in pitch_bends] if pitch_bends else None
+        }
+        for start, end, pitch, amplitude, pitch_bends in note_events
+    ]
@@ -0,0 +1,51 @@
+import numpy as np
+
+# Samples per min/max pair at each zoom level, finest first. Each level must
+# be a multiple of the previous one so coarser levels can be reduced from
+# the finest without touching the samples again.
+PEAK_LEVELS = (256, 1024, 4096, 16384)
+
+
+def compute_peaks(samples, levels=PEAK_LEVELS):
+    """
+    Compute int8 min/max waveform peaks at several zoom levels.
+
+    The finest level is computed from the samples in one vectorized pass and
+    each coarser level is reduced from the level before it.
+
+    Args:
+        samples: 1-D int16 array of mono samples
+        levels: Samples per peak at each level, finest first
+
+    Returns:
+        dict: Maps samples-per-peak to an int8 array of interleaved
+        [min0, max0, min1, max1, ...] values
+    """
+    finest = levels[0]
+    n_bins = -(-len(samples) // finest)
+    # Repeat the last sample so the samples reshape into whole bins without
+    # adding values the signal never reaches
+    padded = np.pad(np.asarray(samples, dtype=np.int16), (0, n_bins * finest - len(samples)), mode="edge")
+    bins = padded.reshape(n_bins, finest)
+
+    mins = bins.min(axis=1)
+    maxs = bins.max(axis=1)
+
+    peaks = {}
+    previous = finest
+    for level in levels:
+        factor = level // previous
+        if factor > 1:
+            n_bins = -(-len(mins) // factor)
+            pad = n_bins * factor - len(mins)
+            mins = np.pad(mins, (0, pad), mode="edge").reshape(n_bins, factor).min(axis=1)
+            maxs = np.pad(maxs, (0, pad), mode="edge").reshape(n_bins, factor).max(axis=1)
+        previous = level
+
+        interleaved = np.empty(len(mins) * 2, dtype=np.int8)
+        # Keep the top 8 bits of each 16-bit extreme
+        interleaved[0::2] = mins >> 8
+        interleaved[1::2] = maxs >> 8
+        peaks[level] = interleaved
+
+    return peaks
@@ -0,0 +1,231 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import wave
+import numpy as np
+import pretty_midi
+import yt_dlp
+from basic_pitch import ICASSP_2022_MODEL_PATH
+from basic_pitch.inference import Model, predict
+from audio.gating import active_regions, join_regions, restore_note_times
+from audio.inference import inference_client, load_windows, notes_from_outputs
+
+# Gating is skipped when it would remove less than this fraction of the audio
+MIN_SKIPPED_FRACTION = 0.1
+
+# The basic-pitch model, loaded once per process on first use
+_model = None
+_model_lock = threading.Lock()
+_model_load_seconds = None
+
+
+@contextlib.contextmanager
+def utf8_stdout():
+    old_stdout = sys.stdout
+    wrapper = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='ignore')
+    sys.stdout = wrapper
+    try:
+        yield
+    finally:
+        wrapper.detach()  # Prevent closing the underlying buffer
+        sys.stdout = old_stdout
+
+
+def download_hls_audio(master_url, temp_dir, prefix):
+    """
+    Download an HLS audio track and convert it to a 44.1 kHz stereo WAV file.
+
+    Args:
+        master_url: URL of the track's master playlist
+        temp_dir: Directory for the intermediate and output files
+        prefix: Prefix for file names, so concurrent downloads don't collide
+
+    Returns:
+        str: Path to the WAV file
+    """
+    downloaded_audio_path = os.path.join(temp_dir, f"{prefix}_downloaded_audio.wav")
+
+    # First download as TS file
+    temp_ts_path = os.path.join(temp_dir, f"{prefix}_temp.ts")
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'outtmpl': temp_ts_path,
+        'verbose': False,
+        'no_warnings': True,
+        'encoding': None,
+        'legacy_server_connect': False,
+        'force_generic_extractor': True
+    }
+
+    ydl = None
+    try:
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+        ydl.download([master_url])
+    finally:
+        if ydl:
+            print("Closing yt-dlp...")
+            ydl.close()
+            print("yt-dlp closed")
+
+    # Convert TS to WAV using FFmpeg
+    print("Converting TS to WAV...")
+    ffmpeg_cmd = [
+        'ffmpeg', '-y',
+        '-i', temp_ts_path,
+        '-acodec', 'pcm_s16le',
+        '-ar', '44100',
+        '-ac', '2',
+        '-loglevel', 'error',
+        downloaded_audio_path
+    ]
+
+    result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg conversion failed with code: {result.returncode}")
+
+    # The TS copy is no longer needed and /tmp is memory-backed
+    if os.path.exists(temp_ts_path):
+        os.remove(temp_ts_path)
+    print("Audio conversion completed")
+    return downloaded_audio_path
+
+
+def decode_to_wav(input_path, output_path):
+    """
+    Decode a local audio file or HLS playlist to a 44.1 kHz stereo WAV file with ffmpeg.
+
+    Returns:
+        str: output_path
+    """
+    result = subprocess.run([
+        'ffmpeg', '-y',
+        '-i', input_path,
+        '-vn',
+        '-acodec', 'pcm_s16le',
+        '-ar', '44100',
+        '-ac', '2',
+        '-loglevel', 'error',
+        output_path
+    ], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg decoding of {input_path} failed with code {result.returncode}: {result.stderr.strip()}")
+    return output_path
+
+
+def read_wav_mono(path):
+    """
+    Read a 16-bit PCM WAV file and mix it down to mono.
+
+    Returns:
+        tuple: (samples, sample_rate) with samples as a 1-D int16 array
+    """
+    with wave.open(path, "rb") as wav:
+        sample_rate = wav.getframerate()
+        channels = wav.getnchannels()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).astype(np.int32).sum(axis=1) // channels
+        samples = samples.astype(np.int16)
+    return samples, sample_rate
+
+
+def get_model():
+    """Return the process-wide basic-pitch model, loading it on first use."""
+    global _model, _model_load_seconds
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                print("Loading basic-pitch model...")
+                started = time.monotonic()
+                _model = Model(ICASSP_2022_MODEL_PATH)
+                _model_load_seconds = time.monotonic() - started
+    return _model
+
+
+def is_model_loaded():
+    """Whether this process has already paid the model load cost."""
+    return _model is not None
+
+
+def model_load_seconds():
+    """How long loading the model took in this process, or None if it isn't loaded."""
+    return _model_load_seconds
+
+
+def write_wav_mono(path, samples, sample_rate):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+
+
+def _run_basic_pitch(audio_path):
+    """Run basic-pitch on a whole file, in the shared inference server if one is configured."""
+    client = inference_client()
+    if client is not None:
+        windows, original_length = load_windows(audio_path)
+        return notes_from_outputs(client.predict(windows), original_length)
+    with utf8_stdout():
+        _, _, note_events = predict(audio_path, get_model())
+    return note_events
+
+
+def predict_note_events(audio_path):
+    """
+    Run basic-pitch on the non-silent parts of an audio file.
+
+    Silent spans (common in separated vocal and bass stems) are cut out
+    before inference and the note times mapped back, so the cost scales with
+    the active audio rather than the file's duration.
+
+    Returns:
+        list: Note events as (start_time, end_time, pitch, amplitude, pitch_bends)
+        tuples, with times in seconds
+    """
+    samples, sample_rate = read_wav_mono(audio_path)
+    regions = active_regions(samples, sample_rate)
+    if not regions:
+        print("Audio is silent; skipping inference")
+        return []
+
+    active_samples = sum(end - start for start, end in regions)
+    if active_samples > (1 - MIN_SKIPPED_FRACTION) * len(samples):
+        del samples
+        return _run_basic_pitch(audio_path)
+
+    joined, segments = join_regions(samples, sample_rate, regions)
+    del samples
+    print(f"Transcribing {len(regions)} active regions "
+          f"({active_samples / sample_rate:.1f}s of audio, {len(joined) / sample_rate:.1f}s joined)")
+    joined_path = f"{os.path.splitext(audio_path)[0]}_active.wav"
+    try:
+        write_wav_mono(joined_path, joined, sample_rate)
+        del joined
+        note_events = _run_basic_pitch(joined_path)
+    finally:
+        if os.path.exists(joined_path):
+            os.remove(joined_path)
+    return restore_note_times(note_events, segments)
+
+
+def midi_bytes_to_note_events(midi_data):
+    """
+    Decode a MIDI file into note events (without pitch bends).
+
+    Returns:
+        list: (start_time, end_time, pitch, amplitude, None) tuples sorted by onset
+    """
+    midi = pretty_midi.PrettyMIDI(io.BytesIO(midi_data))
+    note_events = [
+        (note.start, note.end, note.pitch, note.velocity / 127.0, None)
+        for instrument in midi.instruments
+        for note in instrument.notes
+    ]
+    note_events.sort(key=lambda n: (n[0], n[2]))
+    return note_events
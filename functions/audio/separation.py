@@ -0,0 +1,64 @@
+import threading
+import numpy as np
+
+# Stems produced by the separation model, matching the audio track types
+STEM_TYPES = ("vocals", "drums", "bass", "other")
+
+SEPARATION_SAMPLE_RATE = 44100
+
+# Open-Unmix model and Wiener filter iterations by quality. Previews use the
+# smaller UMX model without Wiener filtering, several times faster than UMX-L.
+SEPARATION_MODELS = {
+    "full": ("umxl", 1),
+    "preview": ("umx", 0)
+}
+
+# The Open-Unmix models, loaded once per process on first use. torch and
+# openunmix are imported lazily so that importing this module stays cheap.
+_separators = {}
+_separator_lock = threading.Lock()
+
+
+def get_separator(quality="full"):
+    """Return the process-wide Open-Unmix separator for a quality, loading it on first use."""
+    separator = _separators.get(quality)
+    if separator is None:
+        with _separator_lock:
+            separator = _separators.get(quality)
+            if separator is None:
+                import openunmix
+                model, niter = SEPARATION_MODELS[quality]
+                print(f"Loading Open-Unmix model {model}...")
+                separator = getattr(openunmix, model)(targets=list(STEM_TYPES), niter=niter, device="cpu")
+                separator.eval()
+                _separators[quality] = separator
+    return separator
+
+
+def separate_stems(samples, quality="full"):
+    """
+    Separate stereo audio into stems.
+
+    Args:
+        samples: float32 array of shape (n_samples, 2) at SEPARATION_SAMPLE_RATE
+        quality: A key of SEPARATION_MODELS
+
+    Returns:
+        dict: Stem type to a float32 array of the same shape as samples
+    """
+    import torch
+
+    separator = get_separator(quality)
+    audio = torch.from_numpy(np.ascontiguousarray(samples.T, dtype=np.float32))[None]
+    with torch.no_grad():
+        estimates = separator.to_dict(separator(audio))
+
+    stems = {}
+    for stem in STEM_TYPES:
+        separated = estimates[stem][0].cpu().numpy().T
+        # The inverse STFT may differ from the input length by a few samples
+        fitted = np.zeros_like(samples, dtype=np.float32)
+        length = min(len(separated), len(samples))
+        fitted[:length] = separated[:length]
+        stems[stem] = fitted
+    return stems
@@ -0,0 +1 @@
+# Offline batch transcription of local audio and HLS inputs. See batch/__main__.py.
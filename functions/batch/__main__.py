@@ -0,0 +1,120 @@
+"""
+Transcribe a local corpus to MIDI and note JSON.
+
+    python -m batch path/to/audio --output out/ --workers 4
+    python -m batch manifest.txt --output out/ --formats midi
+
+The input is a directory (searched recursively for audio files and HLS
+playlists) or a manifest of paths and HLS URLs, one per line (see
+batch.jobs.discover_inputs). Each file goes through the same decode,
+silence gating, basic-pitch inference and MIDI encoding as transcribe_to_midi,
+spread over a process pool that loads the model once per worker. Existing
+outputs are skipped unless --overwrite is given, so an interrupted backfill
+can be resumed. With --inference-server the model is instead loaded once,
+in a shared server process that batches windows from all workers (see
+audio.inference). A throughput summary is printed and written to
+summary.json in the output directory along with per-file results.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from audio.inference import start_server
+from batch.jobs import OUTPUT_FORMATS, discover_inputs, format_summary, init_worker, summarize, transcribe_file
+
+
+def _report(result, completed, total):
+    status = result["status"]
+    detail = result.get("error") if status == "failed" else f"{result['audioSeconds']:.1f}s audio in {result['seconds']:.1f}s"
+    print(f"[{completed}/{total}] {status} {result['id']}: {detail}", file=sys.stderr if status == "failed" else sys.stdout)
+
+
+def run_batch(jobs, output_dir, formats, workers, overwrite=False, threads_per_worker=None):
+    """
+    Transcribe jobs with a process pool (or inline with workers=0).
+
+    Returns:
+        tuple: (results, wall_seconds)
+    """
+    started = time.monotonic()
+    results = []
+    if workers == 0:
+        init_worker(threads_per_worker)
+        for job in jobs:
+            results.append(transcribe_file(job, output_dir, formats, overwrite))
+            _report(results[-1], len(results), len(jobs))
+        return results, time.monotonic() - started
+
+    # TensorFlow isn't fork-safe, so workers are spawned fresh
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker, initargs=(threads_per_worker,)) as executor:
+        futures = [executor.submit(transcribe_file, job, output_dir, formats, overwrite) for job in jobs]
+        for future in as_completed(futures):
+            results.append(future.result())
+            _report(results[-1], len(results), len(jobs))
+    return results, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-transcribe audio files and HLS streams to MIDI")
+    parser.add_argument("source", help="Directory of audio files, or a manifest of paths/URLs")
+    parser.add_argument("--output", required=True, help="Directory for the outputs and summary.json")
+    parser.add_argument("--formats", default=",".join(OUTPUT_FORMATS),
+                        help="Comma-separated outputs to write: midi, notes")
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 2) // 2, 1),
+                        help="Worker processes, each with its own model (0 runs inline)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="TensorFlow threads per worker (default: TensorFlow's choice)")
+    parser.add_argument("--inference-server", action="store_true",
+                        help="Run the model in one shared process instead of one per worker")
+    parser.add_argument("--overwrite", action="store_true", help="Redo inputs whose outputs exist")
+    parser.add_argument("--limit", type=int, default=None, help="Only process the first N inputs")
+    args = parser.parse_args()
+
+    formats = tuple(f.strip() for f in args.formats.split(",") if f.strip())
+    unknown = set(formats) - set(OUTPUT_FORMATS)
+    if unknown or not formats:
+        parser.error(f"Unknown output formats: {', '.join(sorted(unknown)) or '(none)'}")
+
+    try:
+        jobs = discover_inputs(args.source)[:args.limit]
+    except ValueError as e:
+        parser.error(str(e))
+    if not jobs:
+        parser.error(f"No inputs found in {args.source}")
+    os.makedirs(args.output, exist_ok=True)
+    print(f"Transcribing {len(jobs)} inputs with {args.workers} workers...")
+
+    server = None
+    if args.inference_server:
+        server, address, authkey = start_server()
+        # Spawned workers inherit the environment and connect to the server
+        os.environ["INFERENCE_SERVER"] = address
+        os.environ["INFERENCE_SERVER_AUTHKEY"] = authkey.hex()
+
+    try:
+        results, wall_seconds = run_batch(
+            jobs, args.output, formats, args.workers, args.overwrite, args.threads_per_worker
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            if os.path.exists(address):
+                os.remove(address)
+    summary = summarize(results, wall_seconds, args.workers)
+    print()
+    print(format_summary(summary))
+
+    summary_path = os.path.join(args.output, "summary.json")
+    with open(summary_path, "w") as f:
+        json.dump({**summary, "results": sorted(results, key=lambda r: r["id"])}, f, indent=2)
+    print(f"\nWrote {summary_path}")
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
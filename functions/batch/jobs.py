@@ -0,0 +1,214 @@
+"""
+Input discovery, the per-file worker and the throughput summary of the batch
+transcription CLI.
+
+Only the Firebase-free audio package is imported, so batches run without
+credentials.
+"""
+import collections
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import wave
+from audio.inference import inference_client
+from audio.midi import note_events_to_midi_bytes
+from audio.notes import note_events_to_json
+from audio.pipeline import decode_to_wav, download_hls_audio, get_model, predict_note_events
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".m4a", ".aac", ".ogg", ".opus", ".ts", ".m3u8")
+
+OUTPUT_FORMATS = ("midi", "notes")
+
+
+def _is_url(value):
+    return value.startswith(("http://", "https://"))
+
+
+def _input_id(value):
+    """Output name for an input without an explicit id."""
+    if _is_url(value):
+        return "url_" + hashlib.sha1(value.encode("utf-8")).hexdigest()[:12]
+    return os.path.splitext(os.path.basename(value))[0]
+
+
+def _check_id(job_id):
+    """Reject ids that would write outside the output directory."""
+    parts = job_id.replace("\\", "/").split("/")
+    if os.path.isabs(job_id) or job_id.startswith("/") or ".." in parts:
+        raise ValueError(f"Invalid id {job_id!r}: ids must be relative paths inside the output directory")
+
+
+def _unique_ids(jobs):
+    """
+    Rename jobs whose ids collide, so no two write the same outputs.
+
+    Colliding ids first get their input's extension (song.wav and song.mp3
+    become "song.wav" and "song.mp3"), then a numeric suffix if that is
+    still not enough.
+    """
+    counts = collections.Counter(job["id"] for job in jobs)
+    for job in jobs:
+        if counts[job["id"]] > 1:
+            extension = os.path.splitext(job["input"].split("?", 1)[0])[1]
+            if extension and not job["id"].endswith(extension):
+                job["id"] += extension
+    # A suffixed id must not collide with an id some other job already has
+    requested = {job["id"] for job in jobs}
+    taken = set()
+    for job in jobs:
+        if job["id"] in taken:
+            n = 2
+            while f"{job['id']}-{n}" in taken or f"{job['id']}-{n}" in requested:
+                n += 1
+            job["id"] = f"{job['id']}-{n}"
+        taken.add(job["id"])
+    return jobs
+
+
+def discover_inputs(source):
+    """
+    List the inputs of a batch.
+
+    Args:
+        source: A directory, searched recursively for audio files and HLS
+            playlists, or a manifest file with one input per line. A manifest
+            line is a path or URL, optionally followed by a tab and an id, or
+            a JSON object with "input" and optional "id". Relative manifest
+            paths are relative to the manifest.
+
+    Returns:
+        list: {"id", "input"} jobs, where id names the outputs (and may
+        contain "/" for subdirectories); ids are unique
+
+    Raises:
+        ValueError: If a manifest id is absolute or contains ".."
+    """
+    if os.path.isdir(source):
+        jobs = []
+        for root, dirs, names in os.walk(source):
+            dirs.sort()
+            for name in sorted(names):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    relative = os.path.splitext(os.path.relpath(path, source))[0]
+                    jobs.append({"id": relative.replace(os.sep, "/"), "input": path})
+        return _unique_ids(jobs)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    jobs = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                value, job_id = entry["input"], entry.get("id")
+            else:
+                value, _, job_id = line.partition("\t")
+            if not _is_url(value) and not os.path.isabs(value):
+                value = os.path.join(base_dir, value)
+            if job_id:
+                _check_id(job_id)
+            jobs.append({"id": job_id or _input_id(value), "input": value})
+    return _unique_ids(jobs)
+
+
+def output_paths(output_dir, job_id, formats):
+    paths = {}
+    if "midi" in formats:
+        paths["midi"] = os.path.join(output_dir, f"{job_id}.mid")
+    if "notes" in formats:
+        paths["notes"] = os.path.join(output_dir, f"{job_id}.notes.json")
+    return paths
+
+
+def init_worker(threads=None):
+    """Process pool initializer: load the model once per worker process, unless an inference server holds it."""
+    if inference_client() is not None:
+        return
+    if threads:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    get_model()
+
+
+def _wav_seconds(path):
+    with wave.open(path, "rb") as wav:
+        return wav.getnframes() / float(wav.getframerate())
+
+
+def transcribe_file(job, output_dir, formats=OUTPUT_FORMATS, overwrite=False):
+    """
+    Decode one input, transcribe it with the same pipeline as transcribe_to_midi and write its outputs.
+
+    Never raises; failures are reported in the result.
+
+    Returns:
+        dict: id, input, status ("done", "skipped" or "failed"), audioSeconds,
+        seconds (wall time), notes and outputs, or error
+    """
+    result = {"id": job["id"], "input": job["input"], "audioSeconds": 0.0, "pid": os.getpid()}
+    paths = output_paths(output_dir, job["id"], formats)
+    if not overwrite and all(os.path.exists(path) for path in paths.values()):
+        return {**result, "status": "skipped", "seconds": 0.0, "outputs": paths}
+
+    started = time.monotonic()
+    temp_dir = tempfile.mkdtemp(prefix="batch-transcribe-")
+    try:
+        if _is_url(job["input"]):
+            wav_path = download_hls_audio(job["input"], temp_dir, "input")
+        else:
+            wav_path = decode_to_wav(job["input"], os.path.join(temp_dir, "input.wav"))
+        result["audioSeconds"] = _wav_seconds(wav_path)
+
+        note_events = predict_note_events(wav_path)
+        for path in paths.values():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if "midi" in paths:
+            with open(paths["midi"], "wb") as f:
+                f.write(note_events_to_midi_bytes(note_events))
+        if "notes" in paths:
+            with open(paths["notes"], "w", encoding="utf-8") as f:
+                json.dump({"notes": note_events_to_json(note_events), "duration": result["audioSeconds"]}, f)
+        return {**result, "status": "done", "seconds": time.monotonic() - started,
+                "notes": len(note_events), "outputs": paths}
+    except Exception as e:
+        return {**result, "status": "failed", "seconds": time.monotonic() - started, "error": str(e)}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def summarize(results, wall_seconds, workers):
+    """Aggregate per-file results into throughput figures."""
+    done = [r for r in results if r["status"] == "done"]
+    audio_seconds = sum(r["audioSeconds"] for r in done)
+    busy_seconds = sum(r["seconds"] for r in done)
+    return {
+        "files": len(results),
+        "done": len(done),
+        "skipped": sum(1 for r in results if r["status"] == "skipped"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "workers": workers,
+        "wallSeconds": wall_seconds,
+        "audioSeconds": audio_seconds,
+        "filesPerSecond": len(done) / wall_seconds if wall_seconds else 0.0,
+        "audioSecondsPerSecond": audio_seconds / wall_seconds if wall_seconds else 0.0,
+        # Audio seconds per second of one worker's time, i.e. speed-up over realtime per worker
+        "realtimeFactorPerWorker": audio_seconds / busy_seconds if busy_seconds else 0.0
+    }
+
+
+def format_summary(summary):
+    return "\n".join([
+        f"Files: {summary['files']} ({summary['done']} done, {summary['skipped']} skipped, "
+        f"{summary['failed']} failed) with {summary['workers']} workers",
+        f"Wall time: {summary['wallSeconds']:.1f}s for {summary['audioSeconds']:.1f}s of audio",
+        f"Throughput: {summary['filesPerSecond']:.3f} files/s, "
+        f"{summary['audioSecondsPerSecond']:.2f} audio-seconds/s "
+        f"({summary['realtimeFactorPerWorker']:.2f}x realtime per worker)"
+    ])
@@ -0,0 +1 @@
+# Offline load-testing harness for the HTTP functions. See loadtest/__main__.py.
@@ -0,0 +1,246 @@
+"""
+Offline load test for transcribe_to_midi and health_check.
+
+    python -m loadtest --concurrency 8 --requests 200 --mix cached=4,short=2,repeat=2,full=1,health=1
+
+Starts a local HLS fixture server and a function server process (see
+loadtest/server.py) that uses in-memory Firestore and Storage, drives the
+requested mix of calls against it and reports throughput, latency
+percentiles, error rates and the RSS of the function process (and any
+ffmpeg children) over time. Needs no network access or credentials; the
+"short", "repeat" and "full" kinds also need ffmpeg to build the fixture.
+
+Request kinds:
+    health   GET health_check
+    cached   a 5-20 s range of a track with a stored transcription
+    short    a random 5-15 s range transcribed on demand
+    repeat   the same 10 s range every time (exercises request coalescing)
+    full     a whole track transcribed on demand
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from loadtest.fixtures import build_hls_fixture, serve_directory
+from loadtest.report import format_report, parse_mix, summarize
+from loadtest.server import LOAD_VIDEO_ID
+
+REQUEST_KINDS = ("health", "cached", "short", "repeat", "full")
+
+# Kinds that download the HLS fixture
+ON_DEMAND_KINDS = ("short", "repeat", "full")
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_bytes(pid):
+    """Resident set size of a process from /proc; None once it has exited."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    return None
+
+
+def _child_pids(pid):
+    children = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children += [int(child) for child in f.read().split()]
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return children
+
+
+def sample_rss(pid, interval, stop, samples, started):
+    """Record the RSS of pid and its children every interval seconds until stop is set."""
+    while not stop.is_set():
+        per_pid = {}
+        for process in [pid, *_child_pids(pid)]:
+            rss = _rss_bytes(process)
+            if rss is not None:
+                per_pid[process] = rss
+        samples.append((time.monotonic() - started, per_pid))
+        stop.wait(interval)
+
+
+def build_request(kind, rng, track_seconds, response_mode):
+    """Return (method, function name, JSON body) for one request of a kind."""
+    if kind == "health":
+        return "GET", "health_check", None
+
+    body = {"responseMode": response_mode}
+    if kind == "cached":
+        length = rng.uniform(5, 20)
+        start = rng.uniform(0, max(track_seconds - length, 0))
+        body.update(trackId=f"{LOAD_VIDEO_ID}/pretranscribed", startTime=round(start, 2), endTime=round(start + length, 2))
+    elif kind == "short":
+        length = rng.uniform(5, 15)
+        start = rng.uniform(0, max(track_seconds - length, 0))
+        body.update(trackId=f"{LOAD_VIDEO_ID}/original", startTime=round(start, 2), endTime=round(start + length, 2))
+    elif kind == "repeat":
+        body.update(trackId=f"{LOAD_VIDEO_ID}/original", startTime=0, endTime=min(10, track_seconds))
+    elif kind == "full":
+        body.update(trackId=f"{LOAD_VIDEO_ID}/original")
+    else:
+        raise ValueError(f"Unknown request kind: {kind}")
+    return "POST", "transcribe_to_midi", body
+
+
+def wait_until_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Function server exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/health_check", timeout=2).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("Function server did not become ready")
+
+
+def run_load(base_url, args, weights):
+    """Drive the request mix from args.concurrency workers; returns the per-request results."""
+    kinds = list(weights)
+    kind_weights = [weights[kind] for kind in kinds]
+    results = []
+    results_lock = threading.Lock()
+    issued = [0]
+    deadline = time.monotonic() + args.duration if args.duration else None
+
+    def next_slot():
+        with results_lock:
+            if deadline is None and issued[0] >= args.requests:
+                return False
+            issued[0] += 1
+        return deadline is None or time.monotonic() < deadline
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        session = requests.Session()
+        while next_slot():
+            kind = rng.choices(kinds, kind_weights)[0]
+            method, function, body = build_request(kind, rng, args.track_seconds, args.response_mode)
+            started = time.monotonic()
+            try:
+                response = session.request(method, f"{base_url}/{function}", json=body, timeout=args.timeout)
+                status, size = response.status_code, len(response.content)
+            except requests.RequestException as e:
+                print(f"{kind} request failed: {e}", file=sys.stderr)
+                status, size = None, 0
+            with results_lock:
+                results.append({
+                    "kind": kind,
+                    "status": status,
+                    "latency": time.monotonic() - started,
+                    "bytes": size
+                })
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline load test for the HTTP functions",
+        epilog="Request kinds: " + ", ".join(REQUEST_KINDS)
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="Total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Run for this many seconds instead")
+    parser.add_argument("--mix", default="cached=4,short=2,repeat=2,full=1,health=1",
+                        help="Relative weights of request kinds")
+    parser.add_argument("--track-seconds", type=float, default=60.0, help="Length of the fixture track")
+    parser.add_argument("--response-mode", default="binary", choices=("base64", "binary", "url"))
+    parser.add_argument("--fixture-dir", default=os.path.join(tempfile.gettempdir(), "echochamber-loadtest"),
+                        help="Where the HLS fixture is built (and reused)")
+    parser.add_argument("--firestore-latency-ms", type=float, default=0.0,
+                        help="Simulated latency of each Firestore call")
+    parser.add_argument("--storage-latency-ms", type=float, default=0.0,
+                        help="Simulated latency of each Storage call")
+    parser.add_argument("--rss-interval", type=float, default=0.5, help="Seconds between RSS samples")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the full summary (with RSS samples) to this file")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    unknown = set(weights) - set(REQUEST_KINDS)
+    if unknown:
+        parser.error(f"Unknown request kinds: {', '.join(sorted(unknown))}")
+
+    os.makedirs(args.fixture_dir, exist_ok=True)
+    if any(weights.get(kind) for kind in ON_DEMAND_KINDS):
+        print(f"Building HLS fixture in {args.fixture_dir}...")
+        build_hls_fixture(args.fixture_dir, "original", args.track_seconds)
+    fixture_server, hls_base_url = serve_directory(args.fixture_dir)
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen([
+        sys.executable, "-m", "loadtest.server",
+        "--port", str(port),
+        "--hls-base-url", hls_base_url,
+        "--track-seconds", str(args.track_seconds),
+        "--firestore-latency-ms", str(args.firestore_latency_ms),
+        "--storage-latency-ms", str(args.storage_latency_ms)
+    ], cwd=FUNCTIONS_DIR)
+
+    stop = threading.Event()
+    rss_samples = []
+    try:
+        print("Starting function server...")
+        wait_until_ready(base_url, process, timeout=300)
+
+        started = time.monotonic()
+        sampler = threading.Thread(
+            target=sample_rss, args=(process.pid, args.rss_interval, stop, rss_samples, started), daemon=True
+        )
+        sampler.start()
+        print(f"Running {args.duration or args.requests}{'s' if args.duration else ' requests'} "
+              f"with {args.concurrency} clients, mix {weights}")
+        results = run_load(base_url, args, weights)
+        wall_seconds = time.monotonic() - started
+        stop.set()
+        sampler.join()
+    finally:
+        stop.set()
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        fixture_server.shutdown()
+
+    summary = summarize(results, wall_seconds, rss_samples)
+    print()
+    print(format_report(summary))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+In-memory stand-ins for the Firestore client and Storage bucket.
+
+They implement only what the functions in spec/ use, so the functions can run
+unchanged and offline. install() must be called before spec is imported,
+because spec.config creates its clients at import time.
+"""
+import copy
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from google.cloud.firestore_v1 import transforms
+
+# Signed URLs point at the fake bucket's own (non-routable) host
+SIGNED_URL_BASE = "http://fake-storage.invalid"
+
+
+def _resolve(value, existing):
+    """Apply a Firestore field transform to the current field value."""
+    if value is transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, transforms.ArrayUnion):
+        current = list(existing or [])
+        return current + [v for v in value.values if v not in current]
+    if isinstance(value, transforms.ArrayRemove):
+        return [v for v in existing or [] if v not in value.values]
+    if isinstance(value, dict):
+        base = existing if isinstance(existing, dict) else {}
+        return {k: _resolve(v, base.get(k)) for k, v in value.items()}
+    return copy.deepcopy(value)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self.to_dict().get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, transaction=None):
+        return self._client._snapshot(self.path)
+
+    def set(self, data, merge=False):
+        self._client._write(self.path, data, merge=merge)
+
+    def update(self, data):
+        if self._client._snapshot(self.path)._data is None:
+            raise KeyError(f"No document to update: {self.path}")
+        self._client._write(self.path, data, merge=True)
+
+    def create(self, data):
+        if self._client._snapshot(self.path)._data is not None:
+            raise ValueError(f"Document already exists: {self.path}")
+        self._client._write(self.path, data)
+
+    def delete(self):
+        self._client._delete(self.path)
+
+
+class FakeCollectionReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        if "/" not in self.path:
+            return None
+        return FakeDocumentReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = f"auto{next(self._client._ids):012d}"
+        return FakeDocumentReference(self._client, f"{self.path}/{document_id}")
+
+    def list_documents(self):
+        return [self.document(doc_id) for doc_id in self._client._children(self.path)]
+
+    def stream(self):
+        return [doc.get() for doc in self.list_documents()]
+
+
+class FakeWriteBatch:
+    """Applies queued writes together under the client lock."""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(lambda: reference.set(data, merge=merge))
+
+    def update(self, reference, data):
+        self._writes.append(lambda: reference.update(data))
+
+    def create(self, reference, data):
+        self._writes.append(lambda: reference.create(data))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        with self._client._lock:
+            for write in self._writes:
+                write()
+        self._writes = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Serializable transaction: the client lock is held from begin to commit.
+
+    Implements the private hooks firestore.transactional drives, so
+    transactional functions run unchanged.
+    """
+
+    _read_only = False
+    _max_attempts = 1
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._id = None
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._lock.acquire()
+        self._id = next(self._client._ids)
+
+    def _commit(self):
+        try:
+            for write in self._writes:
+                write()
+        finally:
+            self._finish()
+        return []
+
+    def _rollback(self):
+        self._finish()
+
+    def _finish(self):
+        in_progress = self._id is not None
+        self._clean_up()
+        if in_progress:
+            self._client._lock.release()
+
+
+class FakeFirestore:
+    """Thread-safe in-memory document store keyed by document path."""
+
+    def __init__(self, latency=0.0):
+        # Added to every read and write to approximate network round-trips
+        self.latency = latency
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._ids = itertools.count(1)
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _snapshot(self, path):
+        self._wait()
+        with self._lock:
+            data, update_time = self._docs.get(path, (None, None))
+            return FakeSnapshot(FakeDocumentReference(self, path), copy.deepcopy(data), update_time)
+
+    def _write(self, path, data, merge=False):
+        self._wait()
+        with self._lock:
+            existing = self._docs.get(path, (None, None))[0] if merge else None
+            merged = dict(existing or {})
+            for field, value in data.items():
+                if "." in field and merge:
+                    # A field path updates one nested field, keeping its siblings
+                    *parents, leaf = field.split(".")
+                    parent = merged
+                    for name in parents:
+                        child = parent.get(name)
+                        parent[name] = dict(child) if isinstance(child, dict) else {}
+                        parent = parent[name]
+                    parent[leaf] = _resolve(value, parent.get(leaf))
+                else:
+                    merged[field] = _resolve(value, merged.get(field))
+            self._docs[path] = (merged, datetime.now(timezone.utc) + timedelta(microseconds=next(self._ids)))
+
+    def _delete(self, path):
+        self._wait()
+        with self._lock:
+            self._docs.pop(path, None)
+
+    def _children(self, collection_path):
+        prefix = collection_path + "/"
+        with self._lock:
+            return sorted({
+                path[len(prefix):] for path in self._docs
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            })
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def get_all(self, references, **kwargs):
+        return [reference.get() for reference in references]
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.cache_control = None
+        self.content_encoding = None
+        self.content_type = None
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bucket._wait()
+        with self.bucket._lock:
+            self.bucket._objects[self.name] = (bytes(data), content_type or "application/octet-stream")
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, "rb") as f:
+            self.upload_from_string(f.read(), content_type=content_type)
+
+    def download_as_bytes(self, **kwargs):
+        self.bucket._wait()
+        with self.bucket._lock:
+            if self.name not in self.bucket._objects:
+                raise FileNotFoundError(f"No such object: {self.name}")
+            return self.bucket._objects[self.name][0]
+
+    def download_as_text(self, **kwargs):
+        return self.download_as_bytes().decode("utf-8")
+
+    def exists(self, **kwargs):
+        with self.bucket._lock:
+            return self.name in self.bucket._objects
+
+    def delete(self, **kwargs):
+        with self.bucket._lock:
+            self.bucket._objects.pop(self.name, None)
+
+    def generate_signed_url(self, **kwargs):
+        return f"{SIGNED_URL_BASE}/{self.bucket.name}/{self.name}"
+
+
+class FakeBucket:
+    """In-memory object store keyed by object name."""
+
+    def __init__(self, name="loadtest-bucket", latency=0.0):
+        self.name = name
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._objects = {}
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=""):
+        with self._lock:
+            return [FakeBlob(self, name) for name in sorted(self._objects) if name.startswith(prefix)]
+
+    def object_count(self):
+        with self._lock:
+            return len(self._objects)
+
+
+def install(db, bucket):
+    """
+    Make firebase_admin hand out the given fakes and skip credential loading.
+
+    Returns:
+        list: The started patchers (left running for the life of the process)
+    """
+    patchers = [
+        patch("firebase_admin.credentials.Certificate"),
+        patch("firebase_admin.initialize_app"),
+        patch("firebase_admin.firestore.client", return_value=db),
+        patch("firebase_admin.storage.bucket", return_value=bucket),
+    ]
+    for patcher in patchers:
+        patcher.start()
+    return patchers
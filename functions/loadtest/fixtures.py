@@ -0,0 +1,99 @@
+"""Synthetic audio and a local HLS server for load tests."""
+import functools
+import os
+import subprocess
+import threading
+import wave
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+FIXTURE_SAMPLE_RATE = 44100
+
+# Segment length of the generated HLS renditions, as in production
+FIXTURE_SEGMENT_SECONDS = 6
+
+
+def synth_track(seconds, seed=0, sample_rate=FIXTURE_SAMPLE_RATE, silence_fraction=0.3):
+    """
+    Generate a melody of decaying harmonic tones with some silent bars.
+
+    Returns:
+        numpy.ndarray: int16 stereo samples of shape (n, 2)
+    """
+    rng = np.random.default_rng(seed)
+    mono = np.zeros(int(seconds * sample_rate), dtype=np.float32)
+    note_samples = sample_rate // 4
+    t = np.arange(note_samples) / sample_rate
+    envelope = np.exp(-4 * t)
+    bar = note_samples * 16
+    for bar_start in range(0, len(mono), bar):
+        # Whole silent bars, like the rests in a separated stem
+        if rng.random() < silence_fraction:
+            continue
+        for start in range(bar_start, min(bar_start + bar, len(mono) - note_samples), note_samples):
+            frequency = 110 * 2 ** (rng.integers(0, 36) / 12)
+            mono[start:start + note_samples] += sum(
+                np.sin(2 * np.pi * frequency * h * t) / h for h in (1, 2, 3)
+            ) * envelope
+    mono = mono / max(np.abs(mono).max(), 1e-6) * 16000
+    return np.repeat(mono.astype(np.int16)[:, None], 2, axis=1)
+
+
+def write_wav(path, samples, sample_rate=FIXTURE_SAMPLE_RATE):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+
+
+def build_hls_fixture(directory, name, seconds, seed=0):
+    """
+    Encode a synthetic track as an HLS rendition under directory/name.
+
+    Returns:
+        str: Path of the master playlist relative to directory
+    """
+    track_dir = os.path.join(directory, name)
+    os.makedirs(track_dir, exist_ok=True)
+    master_path = os.path.join(track_dir, "master.m3u8")
+    if os.path.exists(master_path):
+        return f"{name}/master.m3u8"
+
+    wav_path = os.path.join(track_dir, "source.wav")
+    write_wav(wav_path, synth_track(seconds, seed))
+    result = subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-i", wav_path,
+        "-c:a", "aac", "-b:a", "128k",
+        "-f", "hls",
+        "-hls_time", str(FIXTURE_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(track_dir, "segment_%03d.ts"),
+        os.path.join(track_dir, "playlist.m3u8")
+    ], capture_output=True, text=True)
+    os.remove(wav_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to build the HLS fixture: {result.stderr.strip()}")
+
+    with open(master_path, "w") as f:
+        f.write("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=128000,CODECS=\"mp4a.40.2\"\nplaylist.m3u8\n")
+    return f"{name}/master.m3u8"
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory, host="127.0.0.1", port=0):
+    """
+    Serve a directory over HTTP from a background thread.
+
+    Returns:
+        tuple: (server, base_url); call server.shutdown() to stop it
+    """
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,122 @@
+"""Load test statistics and the printed report."""
+import math
+from collections import Counter, defaultdict
+
+
+def parse_mix(spec):
+    """
+    Parse a request mix such as "cached=4,short=2,health=1" into weights.
+
+    Raises:
+        ValueError: If an entry is malformed or a weight is negative
+    """
+    weights = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, sep, weight = part.partition("=")
+        if not sep:
+            raise ValueError(f"Expected name=weight, got {part!r}")
+        weights[name.strip()] = float(weight)
+        if weights[name.strip()] < 0:
+            raise ValueError(f"Negative weight for {name.strip()}")
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("The request mix needs at least one positive weight")
+    return weights
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0-100) of a list of numbers; None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _latency_summary(latencies):
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else None
+    }
+
+
+def summarize(results, wall_seconds, rss_samples):
+    """
+    Aggregate request results and RSS samples.
+
+    Args:
+        results: dicts with kind, status (None on a transport error) and latency in seconds
+        wall_seconds: Duration of the run
+        rss_samples: (elapsed_seconds, {pid: rss_bytes}) tuples
+
+    Returns:
+        dict: JSON-serializable summary
+    """
+    by_kind = defaultdict(list)
+    for result in results:
+        by_kind[result["kind"]].append(result)
+
+    def group(items):
+        statuses = Counter(str(item["status"]) for item in items)
+        errors = sum(1 for item in items if item["status"] is None or
+                     (item["status"] >= 400 and item["status"] != 429))
+        return {
+            "requests": len(items),
+            "errors": errors,
+            "errorRate": errors / len(items) if items else 0.0,
+            "rejected": statuses.get("429", 0),
+            "statuses": dict(statuses),
+            "latency": _latency_summary([item["latency"] for item in items])
+        }
+
+    peaks = {}
+    for _, per_pid in rss_samples:
+        for pid, rss in per_pid.items():
+            peaks[pid] = max(peaks.get(pid, 0), rss)
+
+    return {
+        "wallSeconds": wall_seconds,
+        "throughput": len(results) / wall_seconds if wall_seconds else 0.0,
+        "overall": group(results),
+        "kinds": {kind: group(items) for kind, items in sorted(by_kind.items())},
+        "rss": {
+            "peakBytes": {str(pid): peak for pid, peak in peaks.items()},
+            "samples": [
+                {"t": round(t, 3), "bytes": {str(pid): rss for pid, rss in per_pid.items()}}
+                for t, per_pid in rss_samples
+            ]
+        }
+    }
+
+
+def _ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+
+def format_report(summary, timeline_rows=20):
+    lines = [
+        f"Duration {summary['wallSeconds']:.1f}s, {summary['overall']['requests']} requests, "
+        f"{summary['throughput']:.2f} req/s",
+        "",
+        f"{'kind':<14}{'reqs':>6}{'err%':>7}{'429':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    ]
+    for kind, stats in [*summary["kinds"].items(), ("all", summary["overall"])]:
+        latency = stats["latency"]
+        lines.append(
+            f"{kind:<14}{stats['requests']:>6}{stats['errorRate'] * 100:>7.1f}{stats['rejected']:>6}"
+            f"{_ms(latency['p50']):>9}{_ms(latency['p95']):>9}{_ms(latency['p99']):>9}{_ms(latency['max']):>9}"
+        )
+
+    samples = summary["rss"]["samples"]
+    if samples:
+        lines += ["", "RSS over time (MB, per process):"]
+        step = max(len(samples) // timeline_rows, 1)
+        for sample in samples[::step]:
+            per_pid = ", ".join(f"{pid}: {rss / 2**20:.0f}" for pid, rss in sample["bytes"].items())
+            lines.append(f"  {sample['t']:>7.1f}s  {per_pid}")
+        peaks = ", ".join(f"{pid}: {rss / 2**20:.0f}" for pid, rss in summary["rss"]["peakBytes"].items())
+        lines.append(f"  peak      {peaks}")
+    return "\n".join(lines)
@@ -0,0 +1,94 @@
+"""
+Serve the HTTP functions locally against in-memory Firestore and Storage.
+
+    python -m loadtest.server --port 8090 --hls-base-url http://127.0.0.1:8000
+
+Seeds video "load" with two audio tracks pointing at the HLS fixture:
+"original" (transcribed on demand) and "pretranscribed" (with a stored full
+transcription, so range requests are served from the note cache).
+"""
+import argparse
+import logging
+import numpy as np
+from loadtest import fakes
+
+LOAD_VIDEO_ID = "load"
+
+
+def synth_note_events(seconds, seed=0):
+    """Plausible note events (four notes a second) for a pretranscribed track."""
+    rng = np.random.default_rng(seed)
+    starts = np.arange(0, seconds - 0.25, 0.25)
+    return [
+        (float(start), float(start + 0.2), int(rng.integers(45, 81)), float(rng.uniform(0.3, 1.0)), None)
+        for start in starts
+    ]
+
+
+def seed_tracks(db, hls_base_url, track_seconds):
+    from spec.note_cache import store_transcription
+
+    master_url = f"{hls_base_url.rstrip('/')}/original/master.m3u8"
+    tracks = db.collection("videos").document(LOAD_VIDEO_ID).collection("audioTracks")
+    tracks.document("original").set({
+        "type": "original",
+        "masterPlaylistUrl": master_url,
+        "duration": track_seconds
+    })
+    transcription = store_transcription(
+        LOAD_VIDEO_ID, "pretranscribed", synth_note_events(track_seconds), track_seconds
+    )
+    tracks.document("pretranscribed").set({
+        "type": "other",
+        "masterPlaylistUrl": master_url,
+        "duration": track_seconds,
+        "transcription": transcription
+    })
+
+
+def create_app():
+    from flask import Flask, request
+    from spec import health_check, mix_stems, transcribe_to_midi
+
+    functions = {
+        "health_check": health_check,
+        "transcribe_to_midi": transcribe_to_midi,
+        "mix_stems": mix_stems
+    }
+    app = Flask("loadtest")
+
+    @app.route("/<name>", methods=["GET", "POST", "OPTIONS"])
+    def call(name):
+        function = functions.get(name)
+        if function is None:
+            return {"success": False, "error": f"Unknown function: {name}"}, 404
+        return function(request)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--hls-base-url", required=True, help="Base URL of the HLS fixture server")
+    parser.add_argument("--track-seconds", type=float, default=60.0)
+    parser.add_argument("--firestore-latency-ms", type=float, default=0.0)
+    parser.add_argument("--storage-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    db = fakes.FakeFirestore(latency=args.firestore_latency_ms / 1000)
+    bucket = fakes.FakeBucket(latency=args.storage_latency_ms / 1000)
+    fakes.install(db, bucket)
+
+    seed_tracks(db, args.hls_base_url, args.track_seconds)
+    app = create_app()
+
+    from werkzeug.serving import run_simple
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    print(f"Serving functions on http://{args.host}:{args.port}", flush=True)
+    run_simple(args.host, args.port, app, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,27 @@
 # Welcome to Cloud Functions for Firebase for Python!
 # Deploy with `firebase deploy`
 
-from spec import health_check, transcribe_to_midi
+from spec import (
+    health_check,
+    transcribe_to_midi,
+    ingest_audio_track,
+    ingest_upgraded_audio_track,
+    mix_stems,
+    extract_audio_and_split_v2,
+    separate_stem_chunk,
+    stem_segment,
+    search_melody
+)
 
 # Export the functions
 __all__ = [
     'health_check',               # Health check endpoint that returns success status
     'transcribe_to_midi',         # Transcribes audio track to MIDI using basic-pitch
+    'ingest_audio_track',         # Transcribes new audio tracks in the background
+    'ingest_upgraded_audio_track', # Ingests stems once full quality replaces the preview
+    'mix_stems',                  # Renders cached single-stream stem mixes
+    'extract_audio_and_split_v2', # Starts distributed stem separation of a video
+    'separate_stem_chunk',        # Task queue worker separating one chunk of stems
+    'stem_segment',               # Serves lazily separated stem segments, separating on first play
+    'search_melody',              # Finds videos containing a typed or hummed melody
 ]
\ No newline at end of file
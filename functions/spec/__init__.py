@@ -1,13 +1,30 @@
 # This file makes the spec directory a Python package
+from . import startup
+from .config import app, db, bucket, OPENSHOT_API_URL, OPENSHOT_HEADERS
+startup.mark("config")
 from .health_check import health_check
-from .extract_audio_and_split import extract_audio_and_split_v2
+startup.mark("health_check")
+from .extract_audio_and_split import extract_audio_and_split_v2, separate_stem_chunk, stem_segment
+startup.mark("stem_separation")
 from .transcribe import transcribe_to_midi
-from .config import app, db, bucket, OPENSHOT_API_URL, OPENSHOT_HEADERS
+startup.mark("transcribe")
+from .audio_track_ingest import ingest_audio_track, ingest_upgraded_audio_track
+startup.mark("audio_track_ingest")
+from .stem_mix import mix_stems
+startup.mark("stem_mix")
+from .melody_search import search_melody
+startup.mark("melody_search")
 
 __all__ = [
     'health_check',
     'extract_audio_and_split_v2',
+    'separate_stem_chunk',
+    'stem_segment',
     'transcribe_to_midi',
+    'ingest_audio_track',
+    'ingest_upgraded_audio_track',
+    'mix_stems',
+    'search_melody',
     'app',
     'db',
     'bucket',
@@ -0,0 +1,194 @@
+import collections
+import contextlib
+import math
+import os
+import threading
+import time
+
+# Memory the transcription path may commit at once on one instance. The 1 GB
+# instance also holds the Python runtime, TensorFlow and the model weights.
+MEMORY_BUDGET_BYTES = int(os.getenv('TRANSCRIBE_MEMORY_BUDGET_MB', '640')) * 1024 * 1024
+
+# Requests allowed to wait for memory before new ones are rejected with 429
+MAX_QUEUE_DEPTH = int(os.getenv('TRANSCRIBE_MAX_QUEUE', '8'))
+
+# Longest a queued request waits for admission before it is rejected
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv('TRANSCRIBE_MAX_QUEUE_WAIT', '60'))
+
+# Full track decoded to 44.1 kHz stereo 16-bit PCM, held both as the WAV in
+# /tmp (memory-backed on Cloud Functions) and as a pydub AudioSegment
+BYTES_PER_DECODED_SECOND = 44100 * 2 * 2 * 2
+
+# Transcribed range: the exported slice plus basic-pitch's 22.05 kHz float32
+# input windows and per-frame note/onset/contour activations
+BYTES_PER_INFERENCE_SECOND = 44100 * 2 * 2 + 22050 * 4 + 86 * 264 * 4 * 3
+
+# Fixed per-inference overhead (TensorFlow graph execution buffers)
+INFERENCE_OVERHEAD_BYTES = 96 * 1024 * 1024
+
+# Track length assumed when neither the range nor the track duration is known
+DEFAULT_TRACK_SECONDS = 300
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_transcription_cost(range_seconds, track_seconds=None):
+    """
+    Estimate the peak memory in bytes of transcribing range_seconds of audio.
+
+    The whole track is downloaded and decoded before slicing, so the full
+    track length counts towards the decode cost when it is known.
+    """
+    if range_seconds is None:
+        range_seconds = track_seconds if track_seconds is not None else DEFAULT_TRACK_SECONDS
+    if track_seconds is None:
+        track_seconds = range_seconds
+    return int(
+        track_seconds * BYTES_PER_DECODED_SECOND
+        + range_seconds * BYTES_PER_INFERENCE_SECOND
+        + INFERENCE_OVERHEAD_BYTES
+    )
+
+
+class AdmissionController:
+    """
+    Weighted semaphore over a memory budget with a bounded FIFO wait queue.
+
+    Requests are admitted in arrival order while their estimated cost fits in
+    the remaining budget; max_queue bounds only the requests that have to
+    wait for it. When the queue is full, or a request waits longer
+    than max_wait, AdmissionRejected is raised so the caller can answer with
+    a fast 429 instead of overcommitting memory.
+    """
+
+    def __init__(self, capacity=MEMORY_BUDGET_BYTES, max_queue=MAX_QUEUE_DEPTH,
+                 max_wait=MAX_QUEUE_WAIT_SECONDS):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._available = capacity
+        self._queue = collections.deque()
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        # Moving average of how long admitted work holds its reservation
+        self._avg_service_time = 10.0
+
+    def _retry_after(self):
+        """Seconds a rejected client should wait, from queue depth and service time."""
+        slots = max(1, self._in_flight)
+        estimate = self._avg_service_time * (len(self._queue) + 1) / slots
+        return int(min(max(math.ceil(estimate), 1), 120))
+
+    @contextlib.contextmanager
+    def admit(self, cost):
+        """
+        Reserve cost bytes for the duration of the with-block.
+
+        A request larger than the whole budget is clamped to it, so it runs
+        alone rather than never running.
+
+        Yields:
+            float: Seconds spent waiting in the queue
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        cost = min(cost, self.capacity)
+        with self._cond:
+            queued_at = time.monotonic()
+            if self._queue or self._available < cost:
+                # Only requests that would have to wait count against the queue limit
+                if len(self._queue) >= self.max_queue:
+                    self._rejected += 1
+                    raise AdmissionRejected("Transcription queue is full", self._retry_after())
+
+                ticket = object()
+                self._queue.append(ticket)
+                deadline = queued_at + self.max_wait
+
+                while self._queue[0] is not ticket or self._available < cost:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue.remove(ticket)
+                        self._rejected += 1
+                        self._cond.notify_all()
+                        raise AdmissionRejected("Timed out waiting for transcription capacity",
+                                                self._retry_after())
+                    self._cond.wait(remaining)
+
+                self._queue.popleft()
+            self._available -= cost
+            self._in_flight += 1
+            self._admitted += 1
+            waited = time.monotonic() - queued_at
+            self._total_wait += waited
+            self._max_wait_seen = max(self._max_wait_seen, waited)
+            # Let the next queued request check whether it also fits
+            self._cond.notify_all()
+
+        started_at = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._release(cost, started_at)
+
+    @contextlib.contextmanager
+    def admit_if_idle(self, cost):
+        """
+        Reserve cost bytes only if no request is waiting and the cost fits now.
+
+        For low-priority work that may only use leftover capacity: it never
+        queues, so it can't delay requests that arrive later than it.
+
+        Raises:
+            AdmissionRejected: If the reservation would have to wait
+        """
+        cost = min(cost, self.capacity)
+        with self._cond:
+            if self._queue or self._available < cost:
+                raise AdmissionRejected("No spare transcription capacity", self._retry_after())
+            self._available -= cost
+            self._in_flight += 1
+
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(cost, started_at)
+
+    def _release(self, cost, started_at):
+        with self._cond:
+            self._available += cost
+            self._in_flight -= 1
+            service_time = time.monotonic() - started_at
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            self._cond.notify_all()
+
+    def queue_depth(self):
+        """Number of requests currently waiting for admission."""
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        """Snapshot of queue and budget counters for logging and health checks."""
+        with self._cond:
+            return {
+                "inFlight": self._in_flight,
+                "queueDepth": len(self._queue),
+                "capacityBytes": self.capacity,
+                "availableBytes": self._available,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "avgWaitSeconds": self._total_wait / self._admitted if self._admitted else 0.0,
+                "maxWaitSeconds": self._max_wait_seen
+            }
@@ -0,0 +1,319 @@
+from firebase_functions import firestore_fn, options
+from firebase_admin import firestore
+import gc
+import shutil
+import tempfile
+import time
+import wave
+from audio.fingerprint import compute_fingerprint
+from audio.peaks import compute_peaks
+from audio.pipeline import download_hls_audio, predict_note_events, read_wav_mono
+from spec.config import db
+from spec.fingerprint_index import find_match, store_fingerprint
+from spec.melody_index import index_melody
+from spec.note_cache import store_transcription
+from spec.storage_upload import upload_objects
+from spec.track_cache import get_track
+
+# Fraction of a track that must lie inside a matched track for the match's
+# transcription to be reused (and of both tracks for them to be identical)
+DEDUPE_MIN_COVERAGE = 0.95
+
+
+def _wav_duration(path):
+    """Duration of a WAV file in seconds, read from its header."""
+    with wave.open(path, "rb") as wav:
+        return wav.getnframes() / float(wav.getframerate())
+
+
+def peaks_base_path(video_id, track_id, track_data):
+    """Storage prefix for a track's peak files, next to its HLS output."""
+    hls_base_path = track_data.get("hlsBasePath")
+    if hls_base_path:
+        return f"{hls_base_path.rstrip('/')}/peaks"
+    return f"videos/{video_id}/audioTracks/{track_id}/peaks"
+
+
+def generate_waveform_peaks(video_id, track_id, track_data, samples, sample_rate, track_ref):
+    """
+    Compute multi-resolution waveform peaks for a track and store them in Storage.
+
+    Each zoom level is written as a raw file of interleaved int8 min/max pairs
+    and listed under the track document's "waveformPeaks" field, so clients can
+    draw a waveform from a few KB instead of decoding the audio.
+    """
+    try:
+        peaks = compute_peaks(samples)
+
+        base_path = peaks_base_path(video_id, track_id, track_data)
+        levels = [
+            {
+                "samplesPerPeak": samples_per_peak,
+                "length": len(data) // 2,
+                "path": f"{base_path}/peaks_{samples_per_peak}.bin"
+            }
+            for samples_per_peak, data in peaks.items()
+        ]
+        upload_objects({level["path"]: peaks[level["samplesPerPeak"]].tobytes() for level in levels})
+
+        track_ref.update({
+            "waveformPeaks": {
+                "status": "complete",
+                "format": "int8-minmax",
+                "sampleRate": sample_rate,
+                "levels": levels
+            }
+        })
+        print(f"Stored waveform peaks for {video_id}/{track_id}")
+    except Exception as e:
+        print(f"Error generating waveform peaks for {video_id}/{track_id}: {e}")
+        track_ref.update({
+            "waveformPeaks": {
+                "status": "failed",
+                "error": str(e)
+            }
+        })
+
+
+def _link_stems(video_id, match):
+    """
+    Copy the stem tracks of a matched video that this video doesn't have yet.
+
+    Preview stems are left out: only the matched video's own documents are
+    upgraded when its full-quality stems are published, so a copy would
+    stay a preview. Without linked stems this video separates its own.
+    """
+    videos = db.collection("videos")
+    existing = {doc.id for doc in videos.document(video_id).collection("audioTracks").stream()}
+    linked_from_video = videos.document(match["videoId"])
+    batch = db.batch()
+    linked = []
+    for doc in linked_from_video.collection("audioTracks").stream():
+        stem_data = doc.to_dict()
+        if doc.id in existing or stem_data.get("type") == "original":
+            continue
+        if (stem_data.get("metadata") or {}).get("quality") == "preview":
+            continue
+        stem_data["linkedFrom"] = f"{match['videoId']}/{doc.id}"
+        batch.set(videos.document(video_id).collection("audioTracks").document(doc.id), stem_data)
+        linked.append(doc.id)
+    batch.set(videos.document(video_id), {
+        "audioDedupe": {
+            "status": "matched",
+            "videoId": match["videoId"],
+            "trackId": match["trackId"],
+            "offsetSeconds": match["offsetSeconds"],
+            "linkedStems": linked
+        }
+    }, merge=True)
+    batch.commit()
+    return linked
+
+
+def _linked_fields(video_id, track_data, match, duration):
+    """Track document fields that can be taken from a matched track instead of recomputed."""
+    matched_data = get_track(match["videoId"], match["trackId"]) or {}
+    linked_from = f"{match['videoId']}/{match['trackId']}"
+    contained = match["coverage"] >= DEDUPE_MIN_COVERAGE and match["offsetFrames"] >= -1
+    identical = contained and match["matchCoverage"] >= DEDUPE_MIN_COVERAGE and abs(match["offsetFrames"]) <= 1
+
+    fields = {}
+    transcription = matched_data.get("transcription") or {}
+    if contained and transcription.get("status") == "complete":
+        # Same notes, read through a window starting where this track starts
+        fields["transcription"] = {
+            **transcription,
+            "offset": transcription.get("offset", 0.0) + max(match["offsetSeconds"], 0.0),
+            "duration": duration,
+            "linkedFrom": linked_from
+        }
+
+    peaks = matched_data.get("waveformPeaks") or {}
+    if identical and peaks.get("status") == "complete":
+        fields["waveformPeaks"] = {**peaks, "linkedFrom": linked_from}
+
+    if identical and track_data.get("type") == "original" and matched_data.get("type") == "original":
+        linked = _link_stems(video_id, match)
+        print(f"Linked {len(linked)} stems of {linked_from} to {video_id}")
+    return fields
+
+
+def deduplicate_track(video_id, track_id, track_data, samples, sample_rate, track_ref):
+    """
+    Fingerprint a track and reuse the work already done for the same audio.
+
+    The fingerprint is stored and indexed so later uploads can match this
+    track. If an indexed track contains this one (e.g. the same song
+    uploaded twice, or a clip of it), its transcription is linked with a time
+    offset; if the two are identical its waveform peaks are linked too and,
+    for original tracks, its stems are copied to this video.
+
+    Returns:
+        dict: The fields linked onto the track document, which need not be computed
+    """
+    try:
+        sub_fingerprints, landmarks = compute_fingerprint(samples, sample_rate)
+        match = find_match(video_id, track_id, sub_fingerprints, landmarks)
+        fingerprint = store_fingerprint(video_id, track_id, sub_fingerprints, landmarks)
+        fields = {}
+        if match:
+            print(f"{video_id}/{track_id} matches {match['videoId']}/{match['trackId']} "
+                  f"at {match['offsetSeconds']:.2f}s (BER {match['bitErrorRate']:.3f})")
+            fingerprint["match"] = match
+            fields = _linked_fields(video_id, track_data, match, len(samples) / float(sample_rate))
+        track_ref.update({"fingerprint": fingerprint, **fields})
+        return fields
+    except Exception as e:
+        print(f"Error deduplicating {video_id}/{track_id}: {e}")
+        track_ref.update({
+            "fingerprint": {
+                "status": "failed",
+                "error": str(e)
+            }
+        })
+        return {}
+
+
+def pretranscribe_track(video_id, track_id, audio_path, track_ref):
+    """
+    Transcribe a whole audio track and store its notes for range queries.
+
+    Progress is recorded in the track document's "transcription" field, which
+    transcribe_to_midi checks before falling back to on-demand inference.
+
+    Returns:
+        list | None: The note events, or None if transcription failed
+    """
+    track_ref.update({"transcription": {"status": "processing"}})
+    try:
+        duration = _wav_duration(audio_path)
+        print(f"Transcribing full track {video_id}/{track_id} ({duration:.1f}s)...")
+        note_events = predict_note_events(audio_path)
+
+        transcription = store_transcription(video_id, track_id, note_events, duration)
+        transcription["completedAt"] = firestore.SERVER_TIMESTAMP
+        track_ref.update({"transcription": transcription})
+        print(f"Stored {len(note_events)} notes for {video_id}/{track_id}")
+        return note_events
+    except Exception as e:
+        print(f"Error pre-transcribing {video_id}/{track_id}: {e}")
+        track_ref.update({
+            "transcription": {
+                "status": "failed",
+                "error": str(e)
+            }
+        })
+        return None
+
+
+def index_track_melody(video_id, track_id, note_events, track_ref):
+    """
+    Add a transcribed track's melody to the catalog-wide search index.
+
+    Progress is recorded in the track document's "melodyIndex" field.
+    """
+    try:
+        melody_index = index_melody(video_id, track_id, note_events)
+        melody_index["completedAt"] = firestore.SERVER_TIMESTAMP
+        track_ref.update({"melodyIndex": melody_index})
+        print(f"Indexed {melody_index['ngrams']} melody n-grams for {video_id}/{track_id}")
+    except Exception as e:
+        print(f"Error indexing melody of {video_id}/{track_id}: {e}")
+        track_ref.update({
+            "melodyIndex": {
+                "status": "failed",
+                "error": str(e)
+            }
+        })
+
+
+def ingest_track(video_id, track_id, track_data, track_ref):
+    """
+    Download an audio track once and then:
+    - fingerprint it and match it against earlier tracks, linking whatever
+      can be reused from a match instead of recomputing it
+    - compute waveform peaks so clients can draw it without decoding audio
+    - transcribe the whole track so later transcribe_to_midi requests for
+      any range are served by slicing the stored notes, and index its
+      melody for search_melody
+    """
+    master_url = track_data.get("masterPlaylistUrl")
+    if not master_url:
+        print(f"Audio track {video_id}/{track_id} has no masterPlaylistUrl; skipping ingest")
+        return
+
+    if all((track_data.get(field) or {}).get("status") == "complete"
+           for field in ("waveformPeaks", "transcription")):
+        # Stem linked from a duplicate upload, with everything already in place
+        print(f"Audio track {video_id}/{track_id} is already processed; skipping ingest")
+        return
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        try:
+            audio_path = download_hls_audio(master_url, temp_dir, f"{time.monotonic()}")
+        except Exception as e:
+            print(f"Error downloading {video_id}/{track_id} for ingest: {e}")
+            track_ref.update({"ingestError": str(e)})
+            return
+
+        samples, sample_rate = read_wav_mono(audio_path)
+        linked = deduplicate_track(video_id, track_id, track_data, samples, sample_rate, track_ref)
+        if "waveformPeaks" not in linked:
+            generate_waveform_peaks(video_id, track_id, track_data, samples, sample_rate, track_ref)
+        del samples
+        if "transcription" not in linked:
+            note_events = pretranscribe_track(video_id, track_id, audio_path, track_ref)
+            if note_events is not None:
+                index_track_melody(video_id, track_id, note_events, track_ref)
+    finally:
+        gc.collect()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@firestore_fn.on_document_created(
+    document="videos/{videoId}/audioTracks/{trackId}",
+    region="us-central1",
+    memory=options.MemoryOption.GB_1,
+    timeout_sec=540
+)
+def ingest_audio_track(event: firestore_fn.Event[firestore_fn.DocumentSnapshot | None]) -> None:
+    """
+    Background processing for a newly created audio track document (see ingest_track).
+
+    Preview stems are ingested once their full-quality replacement is
+    published (see ingest_upgraded_audio_track), and lazily separated stems
+    not at all, since downloading them would separate every chunk.
+    """
+    snapshot = event.data
+    if snapshot is None:
+        return
+
+    video_id = event.params["videoId"]
+    track_id = event.params["trackId"]
+    track_data = snapshot.to_dict() or {}
+    metadata = track_data.get("metadata") or {}
+    if metadata.get("separationMode") == "lazy":
+        print(f"Audio track {video_id}/{track_id} is separated lazily; skipping ingest")
+        return
+    if metadata.get("quality") == "preview":
+        print(f"Audio track {video_id}/{track_id} is a preview; ingesting once it is replaced")
+        return
+    ingest_track(video_id, track_id, track_data, snapshot.reference)
+
+
+@firestore_fn.on_document_updated(
+    document="videos/{videoId}/audioTracks/{trackId}",
+    region="us-central1",
+    memory=options.MemoryOption.GB_1,
+    timeout_sec=540
+)
+def ingest_upgraded_audio_track(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]]) -> None:
+    """Ingest a stem when its full-quality separation replaces the preview."""
+    before = (event.data.before.to_dict() or {}) if event.data.before else {}
+    after_snapshot = event.data.after
+    after = (after_snapshot.to_dict() or {}) if after_snapshot else {}
+    if (before.get("metadata") or {}).get("quality") != "preview" or \
+            (after.get("metadata") or {}).get("quality") != "full":
+        return
+    ingest_track(event.params["videoId"], event.params["trackId"], after, after_snapshot.reference)
@@ -0,0 +1,109 @@
+from firebase_functions import https_fn
+from datetime import timedelta
+import gzip
+import json
+from spec.config import bucket
+
+# How long signed result URLs stay valid
+SIGNED_URL_TTL = timedelta(hours=1)
+
+# Results are per-user downloads, so only private caches may keep them, and
+# for less time than the signed URL lives
+RESULT_CACHE_CONTROL = "private, max-age=3000"
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+# How a result is returned:
+#   base64   - JSON body with the MIDI base64-encoded (original behaviour)
+#   binary   - raw audio/midi bytes (or the notes JSON) as the body
+#   url      - JSON body with a signed Storage URL for the result
+#   redirect - 302 to the signed Storage URL
+RESPONSE_MODES = ("base64", "binary", "url", "redirect")
+
+# What is returned: a Standard MIDI File or JSON note events
+RESPONSE_FORMATS = ("midi", "notes")
+
+
+def response_options(req, request_json):
+    """
+    Read the requested response mode and format.
+
+    Both may be given in the JSON body or the query string. Without an
+    explicit mode, an Accept header of audio/midi selects binary.
+
+    Returns:
+        tuple: (mode, format)
+
+    Raises:
+        ValueError: If either value is not supported
+    """
+    mode = request_json.get("responseMode") or req.args.get("responseMode")
+    if not mode:
+        accept = req.headers.get("Accept") or ""
+        mode = "binary" if "audio/midi" in accept else "base64"
+    response_format = request_json.get("format") or req.args.get("format") or "midi"
+
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"Invalid responseMode. Expected one of: {', '.join(RESPONSE_MODES)}")
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Invalid format. Expected one of: {', '.join(RESPONSE_FORMATS)}")
+    return mode, response_format
+
+
+def accepts_gzip(req):
+    return "gzip" in (req.headers.get("Accept-Encoding") or "")
+
+
+def json_response(req, data, status=200, headers=None):
+    """JSON response, gzip-compressed when the client accepts it and it's worth it."""
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    headers = {"Content-Type": "application/json; charset=utf-8", "Vary": "Accept-Encoding", **(headers or {})}
+    if len(body) >= GZIP_MIN_BYTES and accepts_gzip(req):
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return https_fn.Response(body, status=status, headers=headers)
+
+
+def binary_response(data, filename, headers=None):
+    """
+    Raw MIDI response offered as a download named filename.
+
+    The functions answer with Access-Control-Allow-Origin: *, under which
+    browsers hide every response header that isn't exposed explicitly, so
+    web clients could not otherwise read the filename or queue headers.
+    """
+    headers = {
+        **(headers or {}),
+        "Content-Type": "audio/midi",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": RESULT_CACHE_CONTROL
+    }
+    exposed = ["Content-Disposition"] + [name for name in headers if name.startswith("X-")]
+    headers["Access-Control-Expose-Headers"] = ", ".join(exposed)
+    return https_fn.Response(data, status=200, headers=headers)
+
+
+def signed_result_url(path, data=None, content_type="audio/midi", compress=False):
+    """
+    Return a signed GET URL for a result object, uploading it first if data is given.
+
+    With compress=True the object is stored gzip-encoded; Storage serves it
+    decompressed to clients that don't send Accept-Encoding: gzip.
+    """
+    blob = bucket.blob(path)
+    if data is not None:
+        blob.cache_control = RESULT_CACHE_CONTROL
+        if compress:
+            blob.content_encoding = "gzip"
+            data = gzip.compress(data, compresslevel=6)
+        blob.upload_from_string(data, content_type=content_type)
+    return blob.generate_signed_url(version="v4", expiration=SIGNED_URL_TTL, method="GET")
+
+
+def redirect_response(url):
+    return https_fn.Response(
+        "",
+        status=302,
+        headers={"Location": url, "Cache-Control": RESULT_CACHE_CONTROL}
+    )
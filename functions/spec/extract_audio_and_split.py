@@ -1,24 +1,23 @@
-from firebase_functions import https_fn, options
+from firebase_functions import https_fn, tasks_fn, options
 import json
-# import requests
-# import os
-# import tempfile
-# import subprocess
-# import torch
-# from openunmix import predict
-# import soundfile as sf
-from spec.config import db, bucket
-from urllib.parse import urlparse
 from datetime import datetime, timezone
+from spec.stem_separation import (
+    SEPARATION_MODE,
+    SEPARATION_TASK,
+    SeparationError,
+    lazy_segment_url,
+    separate_chunk,
+    start_separation
+)
+from spec.storage_upload import IMMUTABLE_CACHE_CONTROL
+from spec.task_queue import register_task_handler
 
 
-# @https_fn.on_call(
-#     cors=options.CorsOptions(
-#         cors_origins=["*"],
-#         cors_methods=["POST"]
-#     )
-# )
-@https_fn.on_request()
+@https_fn.on_request(
+    region="us-central1",
+    memory=options.MemoryOption.GB_1,
+    timeout_sec=120
+)
 def extract_audio_and_split_v2(req: https_fn.Request) -> https_fn.Response:
     """
     Cloud Function to take a video that's already uploaded,
@@ -30,95 +29,153 @@ def extract_audio_and_split_v2(req: https_fn.Request) -> https_fn.Response:
     
     Expected request data:
     {
-        "videoId": string
+        "videoId": string,
+        "mode": "eager" | "lazy"  # Optional, default STEM_SEPARATION_MODE ("eager")
     }
+
+    This is the coordinator of a fan-out/fan-in job: the original audio
+    track's segments are split into chunks, each chunk is separated by its
+    own separate_stem_chunk task, and the task finishing the last chunk
+    writes the stem playlists and audio track documents. Progress is kept in
+    the video's "stemSeparation" field.
+
+    In lazy mode the stems are published immediately with playlists whose
+    segments point at stem_segment, and each chunk is only separated when
+    it is first played, so separation cost follows listening.
+
+    Returns:
+        202 with the job ID while the job runs, or 200 if the stems already
+        exist (including stems linked from a duplicate upload)
     """
     try:
-        response_data = {
-            "status": "success",
-            "message": "Cloud function successfully called",
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        
+        try:
+            request_json = req.get_json()
+            video_id = request_json.get("videoId")
+            mode = request_json.get("mode") or SEPARATION_MODE
+        except ValueError:
+            video_id = None
+        if not video_id:
+            return https_fn.Response(
+                json.dumps({
+                    "success": False,
+                    "error": "Missing required field: videoId"
+                }),
+                status=400,
+                headers={"Content-Type": "application/json"}
+            )
+
+        job = start_separation(video_id, mode=mode)
+        done = job.get("status") in ("complete", "linked")
         return https_fn.Response(
-            json.dumps(response_data),
-            status=200,
+            json.dumps({
+                "success": True,
+                "videoId": video_id,
+                **job,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }),
+            status=200 if done else 202,
+            headers={"Content-Type": "application/json"}
+        )
+    except SeparationError as e:
+        return https_fn.Response(
+            json.dumps({
+                "success": False,
+                "error": str(e)
+            }),
+            status=e.status,
             headers={"Content-Type": "application/json"}
         )
     except Exception as e:
-        error_response = {
-            "status": "error",
-            "message": str(e),
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
+        print(f"Error starting stem separation: {e}")
         return https_fn.Response(
-            json.dumps(error_response),
+            json.dumps({
+                "success": False,
+                "error": f"Error starting stem separation: {str(e)}"
+            }),
             status=500,
             headers={"Content-Type": "application/json"}
         )
 
-    # try:
-    #     # Get request data
-    #     # data = req.data
-    #     # video_id = data.get("videoId")
-    #     response_data = {
-    #         "status": "success",
-    #         "message": "Cloud function successfully called",
-    #         "timestamp": datetime.now(timezone.utc).isoformat()
-    #     }
-    #     return https_fn.Response(
-    #         json.dumps(response_data),
-    #         status=200,
-    #         headers={"Content-Type": "application/json"}
-    #     ) 
-    #     return https_fn.Response(
-    #         json.dumps(response_data),
-    #         status=200,
-    #         headers={"Content-Type": "application/json"}
-    #     ) 
-            
-    #     if not video_id:
-    #         raise ValueError("Missing required field: videoId")
-
-    #     # Return success for now - implementation to come
-    #     return {
-    #         "success": True,
-    #         "message": "Function shell created successfully",
-    #         "videoId": video_id
-    #     }
-        
-    # except Exception as e:
-    #     raise https_fn.HttpsError("internal", str(e))
-
-    # # except subprocess.CalledProcessError as e:
-    # #     error_message = f"FFmpeg processing error: {str(e)}"
-    # #     if hasattr(e, 'output'):
-    # #         error_message += f" - {e.output.decode()}"
-        
-    # #     db.collection("videos").document(video_id).update({
-    # #         "audioProcessingStatus": "failed",
-    # #         "audioProcessingError": error_message
-    # #     })
-        
-    # # except ValueError as e:
-    # #     error_message = str(e)
-    # #     print("error_message", error_message)
-    # #     print("video_id", video_id)
-    # #     if video_id:
-    # #         db.collection("videos").document(video_id).update({
-    # #             "audioProcessingStatus": "failed",
-    # #             "audioProcessingError": error_message
-    # #         })
-        
-    # #     raise https_fn.HttpsError("internal", error_message)
-        
-    # # except Exception as e:
-    # #     error_message = f"Error processing audio: {str(e)}"
-        
-    # #     if video_id:
-    # #         db.collection("videos").document(video_id).update({
-    # #             "audioProcessingStatus": "failed",
-    # #             "audioProcessingError": error_message
-    # #         })
-        
-    # #     raise https_fn.HttpsError("internal", error_message)
+
+@tasks_fn.on_task_dispatched(
+    region="us-central1",
+    memory=options.MemoryOption.GB_4,
+    timeout_sec=540,
+    retry_config=options.RetryConfig(max_attempts=3, min_backoff_seconds=30),
+    rate_limits=options.RateLimits(max_concurrent_dispatches=100)
+)
+def separate_stem_chunk(req: tasks_fn.CallableRequest) -> None:
+    """Task queue worker separating one chunk of a job started by extract_audio_and_split_v2."""
+    separate_chunk(req.data)
+
+
+@https_fn.on_request(
+    region="us-central1",
+    memory=options.MemoryOption.GB_4,
+    timeout_sec=300,
+    cors=options.CorsOptions(
+        cors_origins=["*"],
+        cors_methods=["GET", "OPTIONS"]
+    )
+)
+def stem_segment(req: https_fn.Request) -> https_fn.Response:
+    """
+    Cloud Function serving a segment of a lazily separated stem.
+
+    Query parameters: videoId, jobId, stem and segment (the segment index),
+    as written into the stem playlists by extract_audio_and_split_v2 in lazy
+    mode.
+
+    The first request for a segment separates its chunk and queues the
+    chunks after it; later requests find it separated.
+
+    Returns:
+        302 to the separated segment in Storage
+    """
+    try:
+        video_id = req.args.get("videoId")
+        job_id = req.args.get("jobId")
+        stem = req.args.get("stem")
+        try:
+            index = int(req.args.get("segment", ""))
+        except ValueError:
+            index = None
+        if not video_id or not job_id or not stem or index is None:
+            return https_fn.Response(
+                json.dumps({
+                    "success": False,
+                    "error": "Missing required query parameters: videoId, jobId, stem and segment"
+                }),
+                status=400,
+                headers={"Content-Type": "application/json"}
+            )
+
+        url = lazy_segment_url(video_id, job_id, stem, index)
+        # A separated segment never changes, so the redirect can be cached
+        return https_fn.Response(
+            "",
+            status=302,
+            headers={"Location": url, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        )
+    except SeparationError as e:
+        return https_fn.Response(
+            json.dumps({
+                "success": False,
+                "error": str(e)
+            }),
+            status=e.status,
+            headers={"Content-Type": "application/json"}
+        )
+    except Exception as e:
+        print(f"Error serving stem segment: {e}")
+        return https_fn.Response(
+            json.dumps({
+                "success": False,
+                "error": f"Error serving stem segment: {str(e)}"
+            }),
+            status=500,
+            headers={"Content-Type": "application/json"}
+        )
+
+
+register_task_handler(SEPARATION_TASK, separate_chunk)
@@ -0,0 +1,134 @@
+from collections import Counter
+import numpy as np
+from audio.fingerprint import FRAMES_PER_SECOND, bit_error_rate
+from spec.config import db, bucket
+from spec.postings import add_postings
+
+# One document per landmark hash listing "videoId/trackId@frame" postings
+INDEX_COLLECTION = "audioFingerprintIndex"
+
+# Postings kept per landmark hash (about 250 KB); hashes found in more
+# places than this are too common to identify a track
+MAX_POSTINGS_PER_HASH = 5000
+
+# Landmark hits needed at one alignment before a candidate is verified
+MIN_MATCH_VOTES = 8
+
+# Unrelated audio differs in about half of the fingerprint bits; re-encoded
+# copies of the same audio stay well under this
+MAX_MATCH_BIT_ERROR_RATE = 0.35
+
+# Shortest overlap accepted as a match
+MIN_MATCH_SECONDS = 10.0
+
+# Candidates verified against their stored fingerprint, best voted first
+MAX_CANDIDATES = 3
+
+
+def fingerprint_path(video_id, track_id):
+    return f"fingerprints/{video_id}/{track_id}.fp"
+
+
+def store_fingerprint(video_id, track_id, sub_fingerprints, landmarks):
+    """
+    Store a track's fingerprint in Storage and add its landmarks to the index.
+
+    Hashes already posted MAX_POSTINGS_PER_HASH times are left out of the
+    index (see add_postings).
+
+    Returns:
+        dict: The metadata to record under the track document's "fingerprint" field
+    """
+    path = fingerprint_path(video_id, track_id)
+    bucket.blob(path).upload_from_string(
+        sub_fingerprints.astype("<u4").tobytes(),
+        content_type="application/octet-stream"
+    )
+
+    postings = {}
+    for landmark, frame in landmarks:
+        postings.setdefault(str(landmark), []).append(f"{video_id}/{track_id}@{frame}")
+    full = add_postings(INDEX_COLLECTION, postings, MAX_POSTINGS_PER_HASH)
+
+    return {
+        "status": "complete",
+        "path": path,
+        "frames": len(sub_fingerprints),
+        "landmarks": len(landmarks),
+        "fullHashes": full
+    }
+
+
+def _load_fingerprint(track_path):
+    video_id, track_id = track_path.split("/", 1)
+    data = bucket.blob(fingerprint_path(video_id, track_id)).download_as_bytes()
+    return np.frombuffer(data, dtype="<u4").astype(np.uint32)
+
+
+def _verify(sub_fingerprints, reference, offset):
+    """Best (bit_error_rate, overlap, offset) within a frame of the voted offset."""
+    return min(
+        bit_error_rate(sub_fingerprints, reference, candidate) + (candidate,)
+        for candidate in (offset - 1, offset, offset + 1)
+    )
+
+
+def find_match(video_id, track_id, sub_fingerprints, landmarks):
+    """
+    Find an indexed track that fully or partially contains the same audio.
+
+    Index postings vote for (track, alignment) pairs; the most voted
+    candidates are then verified by bit error rate over their overlap.
+
+    Returns:
+        dict | None: The match, where offsetSeconds is how far into the matched
+        track this one starts (negative if it starts before it) and the
+        coverage fields are the fraction of each track inside the overlap
+    """
+    if not landmarks:
+        return None
+
+    frames_by_hash = {}
+    for landmark, frame in landmarks:
+        frames_by_hash.setdefault(landmark, []).append(frame)
+
+    index = db.collection(INDEX_COLLECTION)
+    own_path = f"{video_id}/{track_id}"
+    votes = Counter()
+    refs = [index.document(str(landmark)) for landmark in frames_by_hash]
+    for doc in db.get_all(refs):
+        if not doc.exists:
+            continue
+        query_frames = frames_by_hash[int(doc.id)]
+        for posting in doc.to_dict().get("postings", []):
+            track_path, _, frame = posting.rpartition("@")
+            if track_path == own_path:
+                continue
+            for query_frame in query_frames:
+                votes[(track_path, int(frame) - query_frame)] += 1
+
+    checked = set()
+    for (track_path, offset), count in votes.most_common():
+        if count < MIN_MATCH_VOTES or len(checked) >= MAX_CANDIDATES:
+            break
+        if track_path in checked:
+            continue
+        checked.add(track_path)
+
+        reference = _load_fingerprint(track_path)
+        ber, overlap, offset = _verify(sub_fingerprints, reference, offset)
+        if ber > MAX_MATCH_BIT_ERROR_RATE or overlap < MIN_MATCH_SECONDS * FRAMES_PER_SECOND:
+            continue
+
+        match_video_id, match_track_id = track_path.split("/", 1)
+        return {
+            "videoId": match_video_id,
+            "trackId": match_track_id,
+            "offsetSeconds": offset / FRAMES_PER_SECOND,
+            "offsetFrames": offset,
+            "coverage": overlap / len(sub_fingerprints),
+            "matchCoverage": overlap / len(reference),
+            "bitErrorRate": ber,
+            "votes": count
+        }
+    return None
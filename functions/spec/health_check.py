@@ -1,10 +1,91 @@
 from firebase_functions import https_fn
 import json
+import os
+import shutil
+import tempfile
 from datetime import datetime, timezone
 
+# Query parameter values that select the deep health check
+DEEP_VALUES = ("1", "true", "yes")
+
+
+def _memory_usage():
+    """Current and peak resident set size of this process, from /proc."""
+    usage = {"rssBytes": None, "peakRssBytes": None}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    usage["rssBytes"] = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    usage["peakRssBytes"] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+def _tmp_usage():
+    """
+    Usage of the temporary directory's filesystem.
+
+    On Cloud Functions /tmp is memory-backed, so this counts against the
+    instance's memory limit alongside the RSS.
+    """
+    usage = shutil.disk_usage(tempfile.gettempdir())
+    return {"path": tempfile.gettempdir(), "usedBytes": usage.used, "totalBytes": usage.total}
+
+
+def deep_status():
+    """
+    Warm state and resource usage of this instance.
+
+    The modules are imported here rather than at the top so the plain
+    health check stays as cheap as it was.
+    """
+    from audio.inference import server_stats
+    from audio.pipeline import is_model_loaded, model_load_seconds
+    from spec import startup, stem_mix, transcribe
+    from spec.note_cache import note_store_stats
+    from spec.track_cache import cache_stats
+
+    return {
+        "model": {
+            "loaded": is_model_loaded(),
+            "loadSeconds": model_load_seconds(),
+            "inferenceServer": server_stats()
+        },
+        "caches": {
+            **cache_stats(),
+            "noteStores": note_store_stats()
+        },
+        "requests": {
+            "transcriptions": {
+                "inFlight": transcribe._inflight.in_flight(),
+                "coalesced": transcribe._inflight.waiting(),
+                "admission": transcribe._admission.stats(),
+                "prefetch": transcribe._prefetcher.stats()
+            },
+            "mixes": {
+                "inFlight": stem_mix._inflight.in_flight(),
+                "coalesced": stem_mix._inflight.waiting()
+            }
+        },
+        "memory": _memory_usage(),
+        "tmp": _tmp_usage(),
+        "startup": startup.startup_timings(),
+        "pid": os.getpid()
+    }
+
+
 @https_fn.on_request()
 def health_check(request: https_fn.Request) -> https_fn.Response:
     """Simple test function to verify cloud functions are working.
+
+    With ?deep=1 the response also has a "deep" field describing this
+    instance: whether the transcription model is loaded, cache sizes and
+    hit ratios, in-flight and queued requests, RSS and /tmp usage, uptime
+    and startup timings. It is meant for warm-pool checks and capacity
+    dashboards; the default response is unchanged.
     
     Returns:
         https_fn.Response: JSON response indicating successful function call
@@ -14,9 +95,12 @@ def health_check(request: https_fn.Request) -> https_fn.Response:
         "message": "Cloud function successfully called",
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
+
+    if str(request.args.get("deep", "")).lower() in DEEP_VALUES:
+        response_data["deep"] = deep_status()
     
     return https_fn.Response(
         json.dumps(response_data),
         status=200,
         headers={"Content-Type": "application/json"}
-    ) 
\ No newline at end of file
+    ) 
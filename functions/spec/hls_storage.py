@@ -0,0 +1,67 @@
+import os
+from urllib.parse import parse_qs, urlencode, urlparse
+from audio.hls import (
+    is_master_playlist,
+    parse_master_playlist,
+    parse_media_playlist,
+    resolve_segment_path,
+    storage_path_from_url
+)
+from spec.config import bucket
+
+# Lazily separated stems list each segment as a URL of the stem_segment
+# function until it is separated (see spec.stem_separation)
+STEM_SEGMENT_PROXY_URL = os.getenv('STEM_SEGMENT_PROXY_URL') or (
+    f"https://us-central1-{os.getenv('GCLOUD_PROJECT', 'echo-chamber-8fb5f')}.cloudfunctions.net/stem_segment"
+)
+
+
+def bucket_name():
+    return bucket.name.replace("gs://", "")
+
+
+def media_playlist_path(track_data):
+    """Storage path of the highest-bitrate media playlist of a track."""
+    variants = track_data.get("variants") or []
+    if variants:
+        best = max(variants, key=lambda v: v.get("bitrate") or 0)
+        return storage_path_from_url(best["playlistUrl"])
+
+    master_path = storage_path_from_url(track_data["masterPlaylistUrl"])
+    text = bucket.blob(master_path).download_as_text()
+    if not is_master_playlist(text):
+        return master_path
+    _, uri = max(parse_master_playlist(text), key=lambda v: v[0])
+    return resolve_segment_path(master_path, uri)
+
+
+def stem_segment_proxy_url(video_id, job_id, stem, index):
+    """URL of the stem_segment function for a segment that may not be separated yet."""
+    query = urlencode({"videoId": video_id, "jobId": job_id, "stem": stem, "segment": index})
+    return f"{STEM_SEGMENT_PROXY_URL}?{query}"
+
+
+def _proxied_segment_index(uri):
+    """Segment index of a stem_segment URL, or None for any other URI."""
+    if not uri.startswith(f"{STEM_SEGMENT_PROXY_URL}?"):
+        return None
+    return int(parse_qs(urlparse(uri).query)["segment"][0])
+
+
+def track_segments(track_data):
+    """
+    Storage paths and durations of a track's segments, in order.
+
+    Segments of a lazily separated stem are listed at the path they are
+    stored at once separated.
+    """
+    playlist_path = media_playlist_path(track_data)
+    playlist = bucket.blob(playlist_path).download_as_text()
+    segments = []
+    for duration, uri in parse_media_playlist(playlist):
+        index = _proxied_segment_index(uri)
+        if index is not None:
+            segments.append((duration, f"{track_data['hlsBasePath'].rstrip('/')}/segment_{index:05d}.ts"))
+        else:
+            segments.append((duration, resolve_segment_path(playlist_path, uri)))
+    return segments
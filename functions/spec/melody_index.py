@@ -0,0 +1,101 @@
+from collections import Counter
+from audio.melody import interval_ngrams, melody_contour
+from spec.config import db
+from spec.postings import add_postings
+
+# One document per interval n-gram listing "videoId/trackId@noteIndex@centiseconds" postings
+MELODY_INDEX_COLLECTION = "melodyIndex"
+
+# Occurrences of one n-gram indexed per track. A riff repeated throughout a
+# song would otherwise fill the n-gram's document with one track's postings.
+MAX_POSTINGS_PER_TRACK = 16
+
+# Postings kept per n-gram document (about 250 KB). Intervals common to
+# most melodies stop being indexed once full; rarer n-grams still match.
+MAX_POSTINGS_PER_NGRAM = 5000
+
+# Matching n-grams needed at one alignment for a track to be a result
+MIN_SEARCH_VOTES = 2
+
+
+def index_melody(video_id, track_id, note_events):
+    """
+    Add a track's melody n-grams to the inverted index.
+
+    Returns:
+        dict: The metadata to record under the track document's "melodyIndex" field
+    """
+    contour = melody_contour(note_events)
+    postings = {}
+    for key, note_index, onset in interval_ngrams(contour):
+        entries = postings.setdefault(key, [])
+        if len(entries) < MAX_POSTINGS_PER_TRACK:
+            entries.append(f"{video_id}/{track_id}@{note_index}@{int(round(onset * 100))}")
+
+    full = add_postings(MELODY_INDEX_COLLECTION, postings, MAX_POSTINGS_PER_NGRAM)
+
+    return {
+        "status": "complete",
+        "melodyNotes": len(contour),
+        "ngrams": len(postings),
+        "fullNgrams": full
+    }
+
+
+def search_melody_index(query_contour, limit=10):
+    """
+    Find indexed tracks containing a melody, in any key.
+
+    Only the index documents of the query's own n-grams are read, so the
+    cost depends on the query and how common its n-grams are, not on the
+    size of the catalog. Postings vote for (track, alignment) pairs, where
+    the alignment is the track's note index minus the query's; a track's
+    score is its best alignment's share of the query n-grams.
+
+    Returns:
+        list: Up to limit results (best first, one per video) with videoId,
+        trackId, timestamp (seconds into the track where the match starts),
+        score and matchedNgrams
+    """
+    ngrams = interval_ngrams(query_contour)
+    if not ngrams:
+        return []
+
+    positions_by_key = {}
+    for key, note_index, _ in ngrams:
+        positions_by_key.setdefault(key, []).append(note_index)
+
+    index = db.collection(MELODY_INDEX_COLLECTION)
+    votes = Counter()
+    starts = {}
+    refs = [index.document(key) for key in positions_by_key]
+    for doc in db.get_all(refs):
+        if not doc.exists:
+            continue
+        query_positions = positions_by_key[doc.id]
+        for posting in doc.to_dict().get("postings", []):
+            track_path, note_index, centiseconds = posting.rsplit("@", 2)
+            for query_position in query_positions:
+                alignment = (track_path, int(note_index) - query_position)
+                votes[alignment] += 1
+                # The match starts at the earliest n-gram hit on the alignment
+                onset = int(centiseconds) / 100.0
+                starts[alignment] = min(starts.get(alignment, onset), onset)
+
+    results = []
+    seen_videos = set()
+    for (track_path, alignment), count in votes.most_common():
+        if count < min(MIN_SEARCH_VOTES, len(ngrams)) or len(results) >= limit:
+            break
+        video_id, track_id = track_path.split("/", 1)
+        if video_id in seen_videos:
+            continue
+        seen_videos.add(video_id)
+        results.append({
+            "videoId": video_id,
+            "trackId": track_id,
+            "timestamp": starts[(track_path, alignment)],
+            "score": round(min(count / len(ngrams), 1.0), 4),
+            "matchedNgrams": count
+        })
+    return results
@@ -0,0 +1,128 @@
+from firebase_functions import https_fn, options
+from datetime import datetime, timezone
+import base64
+import binascii
+import json
+import os
+import shutil
+import tempfile
+import wave
+from audio.melody import melody_contour, note_name_to_pitch
+from audio.pipeline import predict_note_events
+from spec.melody_index import search_melody_index
+
+# Results returned by default and at most
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+# Most notes in a typed query; each of its n-grams is one index read
+MAX_QUERY_NOTES = 64
+
+# Longest hummed query transcribed, as base64 WAV (about 60 s of 16 kHz mono)
+MAX_QUERY_AUDIO_BYTES = 2 * 1024 * 1024
+
+
+def _json_response(data, status=200):
+    return https_fn.Response(
+        json.dumps(data),
+        status=status,
+        headers={"Content-Type": "application/json"}
+    )
+
+
+def _typed_contour(pitches):
+    """Contour of a typed melody: MIDI pitches or note names, one per note."""
+    if isinstance(pitches, str):
+        pitches = pitches.replace(",", " ").split()
+    if len(pitches) > MAX_QUERY_NOTES:
+        raise ValueError(f"pitches must have at most {MAX_QUERY_NOTES} notes")
+    notes = [
+        (float(i), float(i) + 1.0, pitch if isinstance(pitch, int) else note_name_to_pitch(str(pitch)), 1.0, None)
+        for i, pitch in enumerate(pitches)
+    ]
+    return melody_contour(notes)
+
+
+def _hummed_contour(audio_base64):
+    """Contour of a hummed melody, transcribed with basic-pitch."""
+    try:
+        audio = base64.b64decode(audio_base64, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("audio must be base64-encoded WAV")
+    if len(audio) > MAX_QUERY_AUDIO_BYTES:
+        raise ValueError(f"audio must be at most {MAX_QUERY_AUDIO_BYTES} bytes")
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        audio_path = os.path.join(temp_dir, "query.wav")
+        with open(audio_path, "wb") as f:
+            f.write(audio)
+        try:
+            return melody_contour(predict_note_events(audio_path))
+        except (wave.Error, EOFError):
+            raise ValueError("audio must be a 16-bit PCM WAV file")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@https_fn.on_request(
+    region="us-central1",
+    memory=options.MemoryOption.GB_1,
+    cors=options.CorsOptions(
+        cors_origins=["*"],
+        cors_methods=["POST", "OPTIONS"]
+    )
+)
+def search_melody(req: https_fn.Request) -> https_fn.Response:
+    """
+    Cloud Function to find videos containing a melody.
+
+    Expected request body (one of "pitches" or "audio"):
+    {
+        "pitches": [int | string] | string,  # MIDI pitches or note names, e.g. "E4 D4 C4 D4 E4 E4"
+        "audio": string,                     # Base64 16-bit PCM WAV of a hummed or sung melody
+        "limit": int                         # Optional, default 10
+    }
+
+    The melody is matched by its pitch intervals, so it may be in any key.
+    Tracks are indexed as they are transcribed by ingest_audio_track (see
+    spec.melody_index).
+
+    Returns:
+        JSON response with the matching videos, best first, each with the
+        track and the timestamp in seconds where the melody starts
+    """
+    try:
+        request_json = req.get_json(silent=True)
+        if not isinstance(request_json, dict):
+            return _json_response({"success": False, "error": "Invalid JSON in request body"}, 400)
+
+        try:
+            limit = min(max(int(request_json.get("limit") or DEFAULT_SEARCH_LIMIT), 1), MAX_SEARCH_LIMIT)
+            if request_json.get("pitches"):
+                contour = _typed_contour(request_json["pitches"])
+            elif request_json.get("audio"):
+                contour = _hummed_contour(request_json["audio"])
+            else:
+                return _json_response({
+                    "success": False,
+                    "error": "Missing required field: pitches or audio"
+                }, 400)
+        except (TypeError, ValueError) as e:
+            return _json_response({"success": False, "error": str(e)}, 400)
+
+        results = search_melody_index(contour, limit=limit)
+        print(f"Melody search with {len(contour)} notes returned {len(results)} results")
+        return _json_response({
+            "success": True,
+            "query": {"notes": len(contour), "pitches": [pitch for _, pitch in contour]},
+            "results": results,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        })
+
+    except Exception as e:
+        print(f"Error searching melodies: {e}")
+        return _json_response({
+            "success": False,
+            "error": f"Error searching melodies: {str(e)}"
+        }, 500)
@@ -0,0 +1,155 @@
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+import uuid
+from audio.note_store import NoteStore, encode_note_store
+from spec.config import bucket
+from spec.storage_upload import IMMUTABLE_CACHE_CONTROL, upload_object
+
+# Format of transcriptions written by store_transcription
+NOTE_STORE_FORMAT = "columnar-v1"
+
+# Note stores downloaded by this instance are kept here and memory-mapped
+NOTE_STORE_DIR = os.path.join(tempfile.gettempdir(), "note-stores")
+
+# Open note stores kept per instance (least recently used are dropped)
+NOTE_STORE_CACHE_ENTRIES = int(os.getenv('NOTE_STORE_CACHE_ENTRIES', '32'))
+
+_stores = collections.OrderedDict()
+_stores_lock = threading.Lock()
+_store_hits = 0
+_store_misses = 0
+
+
+def notes_base_path(video_id, track_id):
+    """Storage prefix holding a track's full transcription."""
+    return f"transcriptions/{video_id}/{track_id}/notes"
+
+
+def store_transcription(video_id, track_id, note_events, duration):
+    """
+    Write a full-track transcription to Storage as a columnar note store.
+
+    The object name includes a digest of its contents, so a stored note
+    store never changes and can be cached anywhere without invalidation.
+
+    Returns:
+        dict: The metadata to record under the track document's
+        "transcription" field so ranges can be read back with load_note_range
+    """
+    data = encode_note_store(note_events)
+    store = NoteStore(data)
+    path = f"{notes_base_path(video_id, track_id)}/notes-{hashlib.sha1(data).hexdigest()[:16]}.bin"
+    upload_object(path, data, cache_control=IMMUTABLE_CACHE_CONTROL)
+
+    return {
+        "status": "complete",
+        "format": NOTE_STORE_FORMAT,
+        "notesPath": path,
+        "maxNoteDuration": store.max_note_duration,
+        "noteCount": len(store),
+        "duration": duration
+    }
+
+
+def _local_store_path(path):
+    return os.path.join(NOTE_STORE_DIR, path.replace("/", "_"))
+
+
+def _cache_store(path):
+    """Memory-map a downloaded note store and cache it; the caller holds _stores_lock."""
+    store = NoteStore.open(_local_store_path(path))
+    _stores[path] = store
+    _stores.move_to_end(path)
+    while len(_stores) > NOTE_STORE_CACHE_ENTRIES:
+        evicted, _ = _stores.popitem(last=False)
+        # /tmp is memory-backed; mappings still open keep their pages
+        try:
+            os.remove(_local_store_path(evicted))
+        except FileNotFoundError:
+            pass
+    return store
+
+
+def open_note_store(path):
+    """
+    Return the note store at a Storage path, memory-mapped from the instance's warm cache.
+
+    The first use downloads the object to NOTE_STORE_DIR; later uses only
+    look it up. Local files are only checked, opened and evicted under the
+    cache lock, so an eviction can't remove a file between another
+    thread's check and its open.
+    """
+    global _store_hits, _store_misses
+    local_path = _local_store_path(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is not None:
+            _stores.move_to_end(path)
+            _store_hits += 1
+            return store
+        _store_misses += 1
+        if os.path.exists(local_path):
+            return _cache_store(path)
+
+    os.makedirs(NOTE_STORE_DIR, exist_ok=True)
+    partial_path = f"{local_path}.{uuid.uuid4().hex}.partial"
+    with open(partial_path, "wb") as f:
+        f.write(bucket.blob(path).download_as_bytes())
+    with _stores_lock:
+        os.replace(partial_path, local_path)
+        return _cache_store(path)
+
+
+def note_store_stats():
+    """Counters of the warm note store cache, for health checks."""
+    with _stores_lock:
+        lookups = _store_hits + _store_misses
+        entries = len(_stores)
+        hits = _store_hits
+    local_bytes = 0
+    if os.path.isdir(NOTE_STORE_DIR):
+        for name in os.listdir(NOTE_STORE_DIR):
+            try:
+                local_bytes += os.path.getsize(os.path.join(NOTE_STORE_DIR, name))
+            except FileNotFoundError:
+                pass
+    return {
+        "entries": entries,
+        "hits": hits,
+        "misses": lookups - hits,
+        "hitRatio": hits / lookups if lookups else 0.0,
+        "localBytes": local_bytes
+    }
+
+
+def load_note_range(transcription, start_time, end_time):
+    """
+    Read the notes sounding in [start_time, end_time) from a stored transcription.
+
+    A transcription linked from a longer duplicate track carries the
+    "offset" at which this track starts inside it.
+
+    Returns:
+        list: Note event tuples re-timed so the range starts at 0
+    """
+    offset = transcription.get("offset", 0.0)
+    start_time, end_time = start_time + offset, end_time + offset
+    return open_note_store(transcription["notesPath"]).slice(start_time, end_time)
+
+
+def load_note_range_midi(transcription, start_time, end_time):
+    """
+    Read the notes sounding in [start_time, end_time) as a MIDI file.
+
+    The range is encoded straight from the note table; the result is the
+    same as encoding load_note_range's notes.
+
+    Returns:
+        bytes: The MIDI file, re-timed so the range starts at 0
+    """
+    offset = transcription.get("offset", 0.0)
+    store = open_note_store(transcription["notesPath"])
+    return store.midi(start_time + offset, end_time + offset)
@@ -0,0 +1,49 @@
+from firebase_admin import firestore
+from spec.config import db
+
+# Firestore limits a batched write to 500 operations
+INDEX_BATCH_SIZE = 400
+
+
+def add_postings(collection_name, postings, max_postings):
+    """
+    Append postings to an inverted index, keeping at most max_postings per document.
+
+    Each document holds one key's "postings"; the array's own length is the
+    count, so re-ingesting a track neither duplicates nor over-counts its
+    postings. A key whose document is full is skipped: it is common enough
+    that it no longer tells tracks apart, and its document stays well under
+    Firestore's 1 MiB limit and stops taking writes. Concurrent ingests can
+    overshoot the cap by at most their own postings.
+
+    Args:
+        postings: Document id to the posting strings to add
+
+    Returns:
+        int: Keys skipped or truncated because their document is full
+    """
+    index = db.collection(collection_name)
+    refs = [index.document(key) for key in postings]
+    existing = {
+        doc.id: set((doc.to_dict() or {}).get("postings", []))
+        for doc in db.get_all(refs, field_paths=["postings"]) if doc.exists
+    }
+
+    writes = []
+    full = 0
+    for ref, (key, entries) in zip(refs, postings.items()):
+        present = existing.get(key, set())
+        entries = [entry for entry in dict.fromkeys(entries) if entry not in present]
+        room = max_postings - len(present)
+        if room < len(entries):
+            full += 1
+            entries = entries[:max(room, 0)]
+        if entries:
+            writes.append((ref, entries))
+
+    for start in range(0, len(writes), INDEX_BATCH_SIZE):
+        batch = db.batch()
+        for ref, entries in writes[start:start + INDEX_BATCH_SIZE]:
+            batch.set(ref, {"postings": firestore.ArrayUnion(entries)}, merge=True)
+        batch.commit()
+    return full
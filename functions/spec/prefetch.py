@@ -0,0 +1,212 @@
+import collections
+import os
+import threading
+import time
+from spec.admission import AdmissionRejected
+from spec.single_flight import run_with_lease
+
+# Windows after a requested range that are transcribed speculatively
+PREFETCH_WINDOWS = int(os.getenv('TRANSCRIBE_PREFETCH_WINDOWS', '1'))
+
+# Audio seconds an instance may transcribe speculatively per budget period;
+# 0 turns prefetching off
+PREFETCH_BUDGET_SECONDS = float(os.getenv('TRANSCRIBE_PREFETCH_BUDGET_SECONDS', '300'))
+PREFETCH_BUDGET_PERIOD_SECONDS = 600
+
+# Longer ranges aren't prefetched; their follow-ups are less predictable and
+# the work is too large to waste
+MAX_PREFETCH_RANGE_SECONDS = 60
+
+# Prefetch jobs waiting for the worker; older ones are dropped first
+MAX_PENDING_PREFETCHES = 4
+
+# Keys recently prefetched by this instance, not scheduled again
+RECENT_PREFETCH_KEYS = 256
+
+
+class PrefetchCancelled(Exception):
+    """Raised inside a prefetch job when a real request preempts it."""
+
+
+def adjacent_windows(start_time, end_time, track_seconds=None, count=PREFETCH_WINDOWS):
+    """
+    The ranges following [start_time, end_time), of the same length.
+
+    Returns:
+        list: (start, end) pairs, stopping at the end of the track if known
+    """
+    if start_time is None or end_time is None:
+        return []
+    length = end_time - start_time
+    if length <= 0 or length > MAX_PREFETCH_RANGE_SECONDS:
+        return []
+
+    windows = []
+    for i in range(1, count + 1):
+        start = start_time + i * length
+        if track_seconds is not None and start >= track_seconds:
+            break
+        windows.append((round(start, 3), round(start + length, 3)))
+    return windows
+
+
+class _Job:
+    def __init__(self, key, audio_seconds, cost, compute):
+        self.key = key
+        self.audio_seconds = audio_seconds
+        self.cost = cost
+        self.compute = compute
+        self.cancel_event = threading.Event()
+        # Set once a real request waits on this job's result
+        self.promoted = False
+
+
+class Prefetcher:
+    """
+    Runs speculative transcriptions on one background thread.
+
+    A job only starts if the admission controller has spare capacity right
+    now (see AdmissionController.admit_if_idle) and the per-instance budget
+    of speculative audio seconds isn't used up; otherwise it is dropped. Its
+    result goes through the same single-flight and lease as a real request
+    with the same key, so a follow-up request joins a running prefetch or
+    reads its stored result. A real request for any other key cancels the
+    running job at its next checkpoint.
+
+    Background work after the response is only fast where the function's
+    CPU stays allocated between requests; elsewhere it just runs slowly.
+    """
+
+    def __init__(self, admission, inflight, budget_seconds=PREFETCH_BUDGET_SECONDS,
+                 budget_period=PREFETCH_BUDGET_PERIOD_SECONDS, clock=time.monotonic):
+        self._admission = admission
+        self._inflight = inflight
+        self.budget_seconds = budget_seconds
+        self.budget_period = budget_period
+        self._clock = clock
+        self._lock = threading.Condition()
+        self._pending = collections.deque()
+        self._running = None
+        self._spent = collections.deque()
+        self._recent = collections.OrderedDict()
+        self._thread = None
+        self._stats = collections.Counter()
+
+    def _budget_left(self):
+        cutoff = self._clock() - self.budget_period
+        while self._spent and self._spent[0][0] < cutoff:
+            self._spent.popleft()
+        return self.budget_seconds - sum(seconds for _, seconds in self._spent)
+
+    def schedule(self, key, audio_seconds, cost, compute):
+        """
+        Queue a speculative job.
+
+        Args:
+            compute: Called with a cancelled() callable; returns the
+                (midi_data, audio_duration) result and should raise
+                PrefetchCancelled when cancelled() becomes true
+
+        Returns:
+            bool: Whether the job was queued
+        """
+        with self._lock:
+            if key in self._recent or any(job.key == key for job in self._pending) or \
+                    (self._running is not None and self._running.key == key):
+                return False
+            if self._budget_left() < audio_seconds:
+                self._stats["overBudget"] += 1
+                return False
+            if len(self._pending) >= MAX_PENDING_PREFETCHES:
+                self._pending.popleft()
+                self._stats["dropped"] += 1
+            self._pending.append(_Job(key, audio_seconds, cost, compute))
+            self._stats["scheduled"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_forever, name="prefetch", daemon=True)
+                self._thread.start()
+            self._lock.notify()
+            return True
+
+    def preempt(self, key):
+        """
+        Make way for a real request for key.
+
+        A pending or running job for the same key is kept and can no longer
+        be cancelled, since the request will wait for its result; every
+        other running job is cancelled and pending jobs are dropped.
+        """
+        with self._lock:
+            kept = [job for job in self._pending if job.key == key]
+            self._stats["dropped"] += len(self._pending) - len(kept)
+            self._pending = collections.deque(kept)
+            for job in kept:
+                job.promoted = True
+            running = self._running
+            if running is not None:
+                if running.key == key:
+                    running.promoted = True
+                elif not running.promoted:
+                    running.cancel_event.set()
+
+    def _run_forever(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+                job = self._pending.popleft()
+                self._running = job
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running = None
+
+    def _run(self, job):
+        def cancelled():
+            return job.cancel_event.is_set() and not job.promoted
+
+        def lease_compute():
+            if cancelled():
+                raise PrefetchCancelled(job.key)
+            return job.compute(cancelled)
+
+        def prefetch():
+            result = run_with_lease(job.key, lease_compute, wait=False)
+            if result is None:
+                # Another instance is transcribing it; requests joined here retry
+                raise PrefetchCancelled(f"{job.key} is being transcribed elsewhere")
+            return result
+
+        try:
+            with self._admission.admit_if_idle(job.cost):
+                with self._lock:
+                    self._spent.append((self._clock(), job.audio_seconds))
+                    self._recent[job.key] = True
+                    while len(self._recent) > RECENT_PREFETCH_KEYS:
+                        self._recent.popitem(last=False)
+                started = time.monotonic()
+                self._inflight.do(job.key, prefetch)
+                self._stats["completed"] += 1
+                print(f"Prefetched {job.key} in {time.monotonic() - started:.2f}s")
+        except AdmissionRejected:
+            self._stats["skippedBusy"] += 1
+        except PrefetchCancelled:
+            self._stats["cancelled"] += 1
+            with self._lock:
+                self._recent.pop(job.key, None)
+            print(f"Cancelled prefetch of {job.key}")
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"Prefetch of {job.key} failed: {e}")
+
+    def stats(self):
+        """Counters and budget of speculative work, for health checks."""
+        with self._lock:
+            return {
+                **{name: self._stats[name] for name in
+                   ("scheduled", "completed", "cancelled", "dropped", "skippedBusy", "overBudget", "failed")},
+                "pending": len(self._pending),
+                "running": self._running.key if self._running else None,
+                "budgetLeftSeconds": max(self._budget_left(), 0.0)
+            }
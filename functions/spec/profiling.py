@@ -0,0 +1,163 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from spec.config import bucket
+
+# Request header that turns profiling on for one request
+PROFILE_HEADER = "X-Profile"
+
+# Secret the header must carry. Unset (the default) ignores the header, so
+# anonymous clients can't turn on process-wide tracing or write to Storage.
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+
+# Fraction of all requests profiled without the header
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+
+# Storage prefix for profile artifacts, one folder per request ID
+PROFILE_PREFIX = "profiles"
+
+# Frames kept per traced allocation, and allocation sites reported
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 40
+
+# Functions listed in the text summary of the CPU profile
+TOP_FUNCTIONS = 60
+
+# tracemalloc is process-wide; it runs while any profiled request does
+_tracing_lock = threading.Lock()
+_tracing_requests = 0
+
+
+def profile_request_id(req):
+    """
+    Decide whether to profile a request.
+
+    The X-Profile header is only honoured when the PROFILE_TOKEN environment
+    variable is set and the header carries its value; PROFILE_SAMPLE_RATE
+    profiles a random fraction of requests regardless.
+
+    Returns:
+        str | None: A new request ID if the request is to be profiled
+    """
+    header = req.headers.get(PROFILE_HEADER)
+    if header:
+        if not PROFILE_TOKEN or header != PROFILE_TOKEN:
+            print(f"Ignoring {PROFILE_HEADER} header without a valid PROFILE_TOKEN")
+            return None
+        return uuid.uuid4().hex
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return uuid.uuid4().hex
+    return None
+
+
+def _start_tracing():
+    global _tracing_requests
+    with _tracing_lock:
+        if _tracing_requests == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracing_requests += 1
+
+
+def _stop_tracing():
+    """Snapshot allocations and stop tracing if no other profiled request is running."""
+    global _tracing_requests
+    with _tracing_lock:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _tracing_requests -= 1
+        if _tracing_requests == 0:
+            tracemalloc.stop()
+    return snapshot, peak
+
+
+def _allocation_report(snapshot):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    lines = []
+    for stat in snapshot.statistics("traceback")[:TOP_ALLOCATIONS]:
+        lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+        lines.extend(f"    {line}" for line in stat.traceback.format())
+    return "\n".join(lines) + "\n"
+
+
+def _store_profile(name, request_id, profile, snapshot, metadata):
+    base_path = f"{PROFILE_PREFIX}/{name}/{request_id}"
+
+    # Raw stats for pstats / snakeviz, written via a file as cProfile requires
+    with tempfile.NamedTemporaryFile(suffix=".prof") as f:
+        profile.dump_stats(f.name)
+        bucket.blob(f"{base_path}/cpu.prof").upload_from_filename(f.name, content_type="application/octet-stream")
+
+    text = io.StringIO()
+    pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    bucket.blob(f"{base_path}/cpu.txt").upload_from_string(text.getvalue(), content_type="text/plain")
+    bucket.blob(f"{base_path}/allocations.txt").upload_from_string(
+        _allocation_report(snapshot), content_type="text/plain"
+    )
+    bucket.blob(f"{base_path}/metadata.json").upload_from_string(
+        json.dumps(metadata), content_type="application/json"
+    )
+    return base_path
+
+
+def profile_requests(name):
+    """
+    Decorator adding opt-in profiling to an HTTP function.
+
+    A request is profiled when it carries the X-Profile header set to
+    PROFILE_TOKEN (the header is ignored while PROFILE_TOKEN is unset) or is
+    picked by PROFILE_SAMPLE_RATE. It then
+    runs under cProfile and tracemalloc, and the CPU profile, the top
+    allocation sites and some metadata are written to Storage under
+    profiles/{name}/{request_id}/. The request ID is returned in the
+    X-Profile-Id response header. Other requests only pay for the check.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(req):
+            request_id = profile_request_id(req)
+            if request_id is None:
+                return handler(req)
+
+            print(f"Profiling {name} request {request_id}")
+            profile = cProfile.Profile()
+            _start_tracing()
+            started = time.monotonic()
+            response = None
+            try:
+                profile.enable()
+                try:
+                    response = handler(req)
+                finally:
+                    profile.disable()
+            finally:
+                wall_seconds = time.monotonic() - started
+                snapshot, peak = _stop_tracing()
+                try:
+                    path = _store_profile(name, request_id, profile, snapshot, {
+                        "requestId": request_id,
+                        "function": name,
+                        "wallSeconds": wall_seconds,
+                        "peakTracedBytes": peak,
+                        "status": getattr(response, "status_code", None),
+                        "request": req.get_json(silent=True)
+                    })
+                    print(f"Stored profile for {name} request {request_id} under {path}")
+                except Exception as e:
+                    print(f"Warning: Failed to store profile {request_id}: {e}")
+
+            response.headers["X-Profile-Id"] = request_id
+            return response
+        return wrapper
+    return decorator
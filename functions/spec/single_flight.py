@@ -0,0 +1,214 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from firebase_admin import firestore
+from spec.config import db, bucket
+
+# Firestore collection holding cross-instance transcription leases
+LEASE_COLLECTION = "transcriptionLeases"
+
+# Timeout of the transcribe_to_midi function, which waits on leases
+TRANSCRIBE_TIMEOUT_SECONDS = int(os.getenv("TRANSCRIBE_TIMEOUT_SECONDS", "300"))
+
+# How long a leader may hold a lease before another instance may take over.
+# Must be longer than the slowest expected transcription.
+LEASE_TTL_SECONDS = TRANSCRIBE_TIMEOUT_SECONDS
+
+# How long a completed lease serves its stored result before it is recomputed
+LEASE_DONE_TTL_SECONDS = int(os.getenv("LEASE_DONE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# How often followers re-read the lease document while waiting
+LEASE_POLL_INTERVAL_SECONDS = 1.0
+
+# Upper bound on how long a follower waits for another instance's result;
+# leaves the follower time to answer before its own function times out
+LEASE_WAIT_TIMEOUT_SECONDS = TRANSCRIBE_TIMEOUT_SECONDS - 30
+
+
+def transcription_key(track_id, start_time=None, end_time=None, source_url=None):
+    """
+    Build the coalescing key for a transcription request.
+
+    Times are rounded to whole milliseconds so that requests which differ
+    only by float noise share a key. Passing the track's master playlist URL
+    ties the key to that audio, so results transcribed before the track's
+    audio was replaced (e.g. preview stems upgraded to full ones) are not
+    served for the new audio.
+    """
+    start = "start" if start_time is None else str(int(round(float(start_time) * 1000)))
+    end = "end" if end_time is None else str(int(round(float(end_time) * 1000)))
+    if source_url is None:
+        return f"{track_id}:{start}:{end}"
+    version = hashlib.sha1(source_url.encode("utf-8")).hexdigest()[:12]
+    return f"{track_id}:{version}:{start}:{end}"
+
+
+def transcription_result_path(key):
+    """Storage path where the shared MIDI result for a key is kept."""
+    track_id, *version, start, end = key.split(":")
+    ranges = "/".join(["ranges"] + version)
+    return f"transcriptions/{track_id}/{ranges}/{start}_{end}.mid"
+
+
+class _Call:
+    """A single in-flight computation and the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key inside one process.
+
+    The first caller for a key runs the function; callers that arrive while it
+    is running block until it finishes and receive the same result (or the
+    same exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Run fn() once per concurrent key.
+
+        Returns:
+            tuple: (result, shared) where shared is True if the result was
+            produced by another caller's invocation.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self):
+        """Number of distinct keys currently being computed."""
+        with self._lock:
+            return len(self._calls)
+
+    def waiting(self):
+        """Number of callers currently waiting on another caller's result."""
+        with self._lock:
+            return sum(call.waiters for call in self._calls.values())
+
+
+@firestore.transactional
+def _acquire_lease(transaction, lease_ref, owner, key):
+    """
+    Try to take the lease for key.
+
+    Returns:
+        tuple: (acquired, lease_data) where lease_data is the existing lease
+        when it could not be acquired.
+    """
+    snapshot = lease_ref.get(transaction=transaction)
+    now = time.time()
+    if snapshot.exists:
+        lease = snapshot.to_dict()
+        if lease.get("status") in ("done", "running") and lease.get("expiresAt", 0) > now:
+            return False, lease
+
+    transaction.set(lease_ref, {
+        "key": key,
+        "owner": owner,
+        "status": "running",
+        "expiresAt": now + LEASE_TTL_SECONDS,
+        "updatedAt": firestore.SERVER_TIMESTAMP
+    })
+    return True, None
+
+
+def _lease_ref(key):
+    doc_id = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return db.collection(LEASE_COLLECTION).document(doc_id)
+
+
+def _read_result(lease):
+    blob = bucket.blob(lease["resultPath"])
+    return blob.download_as_bytes(), lease.get("audioDuration")
+
+
+def run_with_lease(key, compute, wait=True):
+    """
+    Run compute() at most once across instances for key.
+
+    compute() must return a (midi_data, audio_duration) tuple. The leader
+    stores midi_data in Storage and marks the lease done; other instances poll
+    the lease and read the stored result instead of recomputing. A completed
+    lease also serves later identical requests for LEASE_DONE_TTL_SECONDS.
+
+    With wait=False, None is returned instead of waiting when another
+    instance holds the lease.
+
+    Returns:
+        tuple: (midi_data, audio_duration)
+    """
+    lease_ref = _lease_ref(key)
+    owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    deadline = time.monotonic() + LEASE_WAIT_TIMEOUT_SECONDS
+
+    while True:
+        acquired, lease = _acquire_lease(db.transaction(), lease_ref, owner, key)
+
+        if acquired:
+            break
+        if lease.get("status") == "done":
+            print(f"Reusing transcription result for {key}")
+            return _read_result(lease)
+        if not wait:
+            return None
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for transcription lease on {key}")
+
+        time.sleep(LEASE_POLL_INTERVAL_SECONDS)
+
+    try:
+        midi_data, audio_duration = compute()
+        result_path = transcription_result_path(key)
+        bucket.blob(result_path).upload_from_string(midi_data, content_type="audio/midi")
+        lease_ref.update({
+            "status": "done",
+            "resultPath": result_path,
+            "audioDuration": audio_duration,
+            "expiresAt": time.time() + LEASE_DONE_TTL_SECONDS,
+            "updatedAt": firestore.SERVER_TIMESTAMP
+        })
+    except BaseException:
+        # Release the lease so a waiting instance can take over immediately
+        try:
+            lease_ref.delete()
+        except Exception as e:
+            print(f"Warning: Failed to release transcription lease: {e}")
+        raise
+    return midi_data, audio_duration
@@ -0,0 +1,49 @@
+import os
+import time
+
+# Wall-clock time at which this module, the first of spec, was imported
+IMPORT_STARTED = time.time()
+
+_last_mark = time.monotonic()
+_phases = {}
+
+
+def _process_start_time():
+    """When this process started, from /proc (falls back to IMPORT_STARTED)."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            boot_uptime = float(f.read().split()[0])
+        return time.time() - boot_uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return IMPORT_STARTED
+
+
+PROCESS_STARTED = _process_start_time()
+
+
+def mark(phase):
+    """Record the time taken since the previous mark (or this module's import) as a startup phase."""
+    global _last_mark
+    now = time.monotonic()
+    _phases[phase] = now - _last_mark
+    _last_mark = now
+
+
+def startup_timings():
+    """
+    Process age and how long each startup phase took.
+
+    Returns:
+        dict: processStartedAt and uptimeSeconds for the process,
+        importSeconds for the spec package and its per-module phases
+    """
+    return {
+        "processStartedAt": PROCESS_STARTED,
+        "uptimeSeconds": time.time() - PROCESS_STARTED,
+        "beforeImportSeconds": IMPORT_STARTED - PROCESS_STARTED,
+        "importSeconds": sum(_phases.values()),
+        "phases": dict(_phases)
+    }
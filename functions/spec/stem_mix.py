@@ -0,0 +1,197 @@
+from firebase_functions import https_fn, options
+from firebase_admin import firestore
+from datetime import datetime, timezone
+import json
+import os
+import tempfile
+import time
+from audio.hls import build_media_playlist, parse_media_playlist, storage_download_url
+from audio.mixing import mix_key, quantize_gains, render_mix
+from spec.config import db, bucket
+from spec.hls_storage import bucket_name, track_segments
+from spec.single_flight import SingleFlight
+from spec.stem_separation import queue_lazy_separation
+from spec.storage_upload import IMMUTABLE_CACHE_CONTROL, upload_tree
+from spec.track_cache import list_tracks
+
+# A mix left "processing" for longer than this is assumed abandoned
+MIX_STALE_SECONDS = 600
+
+# Coalesces identical mix requests running on this instance
+_inflight = SingleFlight()
+
+
+def _json_response(data, status=200, headers=None):
+    return https_fn.Response(
+        json.dumps(data),
+        status=status,
+        headers={"Content-Type": "application/json", **(headers or {})}
+    )
+
+
+def build_stem_mix(video_id, stems, gains, mix_id):
+    """
+    Render a mix of stem tracks into one HLS rendition in Storage.
+
+    Each stem's segments are decoded as one continuous stream, and the mix
+    is encoded in one pass and cut into segments as it is written, so
+    segment boundaries carry no encoder priming or padding.
+
+    Args:
+        stems: Stem name to track document data
+        gains: Stem name to gain, matching stems
+
+    Returns:
+        str: Storage path of the mix's media playlist
+    """
+    names = sorted(gains)
+    segment_lists = [track_segments(stems[name]) for name in names]
+    segment_count = min(len(segments) for segments in segment_lists)
+    if segment_count == 0:
+        raise Exception(f"Stems of {video_id} have no segments")
+    if any(len(segments) != segment_count for segments in segment_lists):
+        print(f"Warning: stems of {video_id} have different segment counts; mixing {segment_count}")
+
+    def download(segments):
+        for _, path in segments[:segment_count]:
+            yield bucket.blob(path).download_as_bytes()
+
+    base_path = f"videos/{video_id}/mixes/{mix_id}"
+    with tempfile.TemporaryDirectory() as temp_dir:
+        playlist_path = render_mix(
+            [download(segments) for segments in segment_lists],
+            [gains[name] for name in names],
+            temp_dir,
+            segment_lists[0][0][0]
+        )
+        with open(playlist_path) as f:
+            encoded = parse_media_playlist(f.read())
+        # Stored playlists reference segments by download URL
+        with open(playlist_path, "w") as f:
+            f.write(build_media_playlist([
+                (duration, storage_download_url(bucket_name(), f"{base_path}/{filename}"))
+                for duration, filename in encoded
+            ]))
+
+        # A mix id names one set of gains over one set of stem renditions, so
+        # nothing under it ever changes; upload_tree writes the playlist last
+        upload_tree(temp_dir, base_path, cache_control=IMMUTABLE_CACHE_CONTROL)
+    return f"{base_path}/{os.path.basename(playlist_path)}"
+
+
+@https_fn.on_request(
+    region="us-central1",
+    memory=options.MemoryOption.GB_1,
+    timeout_sec=540,
+    cors=options.CorsOptions(
+        cors_origins=["*"],
+        cors_methods=["POST", "OPTIONS"]
+    )
+)
+def mix_stems(req: https_fn.Request) -> https_fn.Response:
+    """
+    Cloud Function returning a single HLS rendition of a custom stem mix.
+
+    Expected request body:
+    {
+        "videoId": string,
+        "gains": {string: float}  # Stem type (e.g. "vocals") to gain, 0 mutes
+    }
+
+    Gains are quantized before lookup so that common mixes share one cached
+    rendition under videos/{videoId}/mixes/{mixId}. The mix id also covers
+    the stems' playlists, so a mix of preview stems is rendered again once
+    they are replaced by full-quality ones. Clients stream the returned
+    playlist instead of one playlist per stem.
+
+    Returns:
+        JSON response with the mix's playlistUrl, or 202 while another
+        instance is still rendering the same mix or lazily separated stems
+        are still being separated
+    """
+    try:
+        try:
+            request_json = req.get_json()
+            video_id = request_json.get("videoId")
+            gains = request_json.get("gains") or {}
+        except ValueError:
+            return _json_response({"success": False, "error": "Invalid JSON in request body"}, 400)
+
+        if not video_id or not isinstance(gains, dict):
+            return _json_response({"success": False, "error": "Missing required fields: videoId and gains"}, 400)
+
+        quantized = quantize_gains(gains)
+        if not quantized:
+            return _json_response({"success": False, "error": "At least one stem must have a gain above 0"}, 400)
+
+        video_ref = db.collection("videos").document(video_id)
+        stems = {
+            track_data.get("type", track_id): track_data
+            for track_id, track_data in list_tracks(video_id).items()
+        }
+        missing = [name for name in quantized if name not in stems]
+        if missing:
+            return _json_response({
+                "success": False,
+                "error": f"Audio tracks not found for video {video_id}: {', '.join(missing)}"
+            }, 404)
+
+        if queue_lazy_separation(video_id, [stems[name] for name in quantized]):
+            # Mixing needs every segment, so lazily separated stems are finished first
+            return _json_response(
+                {"success": True, "status": "separating", "gains": quantized},
+                202,
+                {"Retry-After": "30"}
+            )
+
+        # Keyed by the stems' playlists too, so upgraded stems are mixed afresh
+        mix_id = mix_key(quantized, [stems[name].get("masterPlaylistUrl", "") for name in quantized])
+        mix_ref = video_ref.collection("stemMixes").document(mix_id)
+
+        def build():
+            mix_doc = mix_ref.get()
+            mix_data = mix_doc.to_dict() if mix_doc.exists else {}
+            if mix_data.get("status") == "complete":
+                return mix_data, True
+            if mix_data.get("status") == "processing" and \
+                    time.time() - mix_data.get("startedAt", 0) < MIX_STALE_SECONDS:
+                return mix_data, False
+
+            mix_ref.set({"status": "processing", "gains": quantized, "startedAt": time.time()})
+            try:
+                playlist_path = build_stem_mix(video_id, stems, quantized, mix_id)
+            except Exception as e:
+                mix_ref.set({"status": "failed", "gains": quantized, "error": str(e)})
+                raise
+            mix_data = {
+                "status": "complete",
+                "gains": quantized,
+                "playlistPath": playlist_path,
+                "playlistUrl": storage_download_url(bucket_name(), playlist_path),
+                "completedAt": firestore.SERVER_TIMESTAMP
+            }
+            mix_ref.set(mix_data)
+            return mix_data, False
+
+        (mix_data, cached), _ = _inflight.do(mix_id, build)
+
+        if mix_data.get("status") != "complete":
+            return _json_response(
+                {"success": True, "status": "processing", "mixId": mix_id, "gains": quantized},
+                202,
+                {"Retry-After": "10"}
+            )
+
+        return _json_response({
+            "success": True,
+            "status": "complete",
+            "mixId": mix_id,
+            "gains": quantized,
+            "playlistUrl": mix_data["playlistUrl"],
+            "cached": cached,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        })
+
+    except Exception as e:
+        print(f"Error mixing stems: {e}")
+        return _json_response({"success": False, "error": f"Error mixing stems: {str(e)}"}, 500)
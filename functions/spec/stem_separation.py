@@ -0,0 +1,654 @@
+import collections
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from firebase_admin import firestore
+from audio.hls import build_master_playlist, build_media_playlist, storage_download_url
+from audio.mixing import MIX_BITRATE, decode_segments, encode_segments
+from audio.separation import SEPARATION_MODELS, STEM_TYPES, separate_stems
+from spec.config import db, bucket
+from spec.hls_storage import bucket_name, stem_segment_proxy_url, track_segments
+from spec.single_flight import SingleFlight
+from spec.storage_upload import upload_objects
+from spec.task_queue import enqueue
+from spec.track_cache import invalidate_tracks, list_tracks
+
+# Task queue function that separates one chunk
+SEPARATION_TASK = "separate_stem_chunk"
+
+# Segments per chunk, i.e. per worker invocation. With 6 s segments a chunk
+# is 30 s of audio, which one worker separates well within its timeout.
+CHUNK_SEGMENTS = int(os.getenv('STEM_CHUNK_SEGMENTS', '5'))
+
+# Neighbouring segments decoded on each side of a chunk and discarded after
+# separation, so chunk boundaries don't get STFT edge artifacts
+CONTEXT_SEGMENTS = 1
+
+# A job left running for longer than this is assumed abandoned
+JOB_STALE_SECONDS = 3600
+
+# Stems encoded concurrently within a worker
+ENCODE_WORKERS = max(os.cpu_count() or 1, 2)
+
+# Eager jobs first separate a quick preview of every stem (see
+# audio.separation.SEPARATION_MODELS) and publish it, then replace it with
+# full-quality stems
+STEM_PREVIEW = os.getenv('STEM_PREVIEW', '1') != '0'
+
+# Encoding bitrate of stem segments by separation quality
+STEM_BITRATES = {"full": MIX_BITRATE, "preview": "64k"}
+
+# How stems are separated:
+#   eager - task queue workers separate every chunk as soon as the job
+#           starts, and the stems are published once all are done
+#   lazy  - the stems are published at once, with their segments listed as
+#           stem_segment URLs, and a chunk is only separated when one of its
+#           segments is first requested
+SEPARATION_MODES = ("eager", "lazy")
+SEPARATION_MODE = os.getenv('STEM_SEPARATION_MODE', 'eager')
+
+# Chunks after a requested one that lazy separation queues ahead of playback
+LAZY_LOOKAHEAD_CHUNKS = int(os.getenv('STEM_LAZY_LOOKAHEAD_CHUNKS', '1'))
+
+# A lazy chunk claimed for longer than this is assumed abandoned
+CHUNK_CLAIM_SECONDS = 300
+
+# How often, and for how long, a segment request polls a chunk that another
+# instance is separating
+CHUNK_POLL_INTERVAL_SECONDS = 1.0
+CHUNK_WAIT_TIMEOUT_SECONDS = 240
+
+# Lazy jobs whose layout and separated chunks this instance remembers, so
+# requests for separated segments are redirected without reading the job
+LAZY_JOB_CACHE_ENTRIES = 64
+
+# Coalesces requests for segments of the same lazy chunk on this instance
+_chunks_inflight = SingleFlight()
+
+_lazy_jobs = collections.OrderedDict()
+_lazy_jobs_lock = threading.Lock()
+
+
+class SeparationError(Exception):
+    """Raised when separation cannot start; carries an HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def stems_base_path(video_id, track_data, stem):
+    """Storage prefix of a stem's HLS output, next to the original track's."""
+    hls_base_path = track_data.get("hlsBasePath")
+    if hls_base_path:
+        return f"{hls_base_path.rstrip('/').rsplit('/', 1)[0]}/{stem}"
+    return f"videos/{video_id}/audio/{stem}"
+
+
+def _bandwidth(quality):
+    return int(STEM_BITRATES[quality].rstrip("k")) * 1000
+
+
+def _stem_dir(job, stem, quality="full"):
+    """Storage prefix of one quality of a stem; previews are kept in a subfolder."""
+    base_path = job["stemPaths"][stem]
+    return base_path if quality == "full" else f"{base_path}/{quality}"
+
+
+def _segment_path(job, stem, index, quality="full"):
+    return f"{_stem_dir(job, stem, quality)}/segment_{index:05d}.ts"
+
+
+def _job_ref(video_id, job_id):
+    return db.collection("videos").document(video_id).collection("stemJobs").document(job_id)
+
+
+@firestore.transactional
+def _claim_separation(transaction, video_ref, job_id):
+    """
+    Record a new job on the video unless one is complete or still running.
+
+    Returns:
+        tuple: (claimed, current) where current is the existing stemSeparation state
+    """
+    snapshot = video_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise SeparationError("Video not found", status=404)
+    current = (snapshot.to_dict() or {}).get("stemSeparation") or {}
+    if current.get("status") == "complete":
+        return False, current
+    if current.get("status") in ("running", "finalizing") and \
+            time.time() - current.get("startedAt", 0) < JOB_STALE_SECONDS:
+        return False, current
+
+    transaction.update(video_ref, {
+        "stemSeparation": {"status": "running", "jobId": job_id, "startedAt": time.time()}
+    })
+    return True, None
+
+
+def start_separation(video_id, chunk_segments=CHUNK_SEGMENTS, mode=SEPARATION_MODE, preview=STEM_PREVIEW):
+    """
+    Split a video's original audio into chunks and enqueue one task per chunk.
+
+    With preview, eager jobs run twice over the chunks: the preview phase
+    publishes low-fidelity stems as soon as it completes, and the full phase
+    then replaces them (see finalize_separation). In lazy mode no task is
+    enqueued; the stems are published at once and their chunks are
+    separated as they are played (see lazy_segment_url).
+    Nothing is separated when the audio was matched to an earlier upload whose
+    stems were linked at ingest (see deduplicate_track), or when a job is
+    already complete or running.
+
+    Returns:
+        dict: The job state (status, jobId, chunkCount, and mode for lazy jobs)
+
+    Raises:
+        SeparationError: If the mode is unknown, or the video or its original
+        audio track doesn't exist
+    """
+    if mode not in SEPARATION_MODES:
+        raise SeparationError(f"Invalid mode. Expected one of: {', '.join(SEPARATION_MODES)}")
+
+    video_ref = db.collection("videos").document(video_id)
+    video = video_ref.get()
+    if not video.exists:
+        raise SeparationError(f"Video {video_id} not found", status=404)
+
+    dedupe = (video.to_dict() or {}).get("audioDedupe") or {}
+    if dedupe.get("status") == "matched" and dedupe.get("linkedStems"):
+        return {"status": "linked", "linkedFrom": dedupe["videoId"], "stems": dedupe["linkedStems"]}
+
+    original = next(
+        (data for data in list_tracks(video_id).values() if data.get("type") == "original"),
+        None
+    )
+    if original is None:
+        raise SeparationError(f"Video {video_id} has no original audio track", status=404)
+
+    job_id = uuid.uuid4().hex[:12]
+    claimed, current = _claim_separation(db.transaction(), video_ref, job_id)
+    if not claimed:
+        return current
+
+    segments = track_segments(original)
+    if not segments:
+        raise SeparationError(f"Original audio of {video_id} has no segments")
+    chunk_count = math.ceil(len(segments) / chunk_segments)
+    job = {
+        "status": "running" if mode == "eager" else "lazy",
+        "mode": mode,
+        "phase": "preview" if preview and mode == "eager" else "full",
+        "segments": [{"duration": duration, "path": path} for duration, path in segments],
+        "chunkSegments": chunk_segments,
+        "chunkCount": chunk_count,
+        "completedChunks": [],
+        "chunkClaims": {},
+        "stemPaths": {stem: stems_base_path(video_id, original, stem) for stem in STEM_TYPES},
+        "startedAt": time.time()
+    }
+    _job_ref(video_id, job_id).set({**job, "createdAt": firestore.SERVER_TIMESTAMP})
+
+    if mode == "lazy":
+        separation = {
+            "status": "complete",
+            "mode": "lazy",
+            "jobId": job_id,
+            "chunkCount": chunk_count,
+            "startedAt": job["startedAt"]
+        }
+        _publish_stems(video_id, job_id, job, _lazy_segment_url(video_id, job_id, job, set()), separation)
+        print(f"Published {chunk_count} lazily separated chunks for {video_id} (job {job_id})")
+        return {"status": "complete", "mode": "lazy", "jobId": job_id, "chunkCount": chunk_count}
+
+    video_ref.update({"stemSeparation.chunkCount": chunk_count, "stemSeparation.phase": job["phase"]})
+    _enqueue_phase(video_id, job_id, chunk_count, job["phase"])
+    return {"status": "running", "jobId": job_id, "chunkCount": chunk_count, "phase": job["phase"]}
+
+
+def _enqueue_phase(video_id, job_id, chunk_count, phase, completed=()):
+    indices = [index for index in range(chunk_count) if index not in completed]
+    for index in indices:
+        enqueue(SEPARATION_TASK, {"videoId": video_id, "jobId": job_id, "chunkIndex": index, "phase": phase})
+    print(f"Enqueued {len(indices)} {phase} separation chunks for {video_id} (job {job_id})")
+
+
+def _enqueue_pending_phase(video_id, job_id, job):
+    """Enqueue the unfinished chunks of a job's new phase and mark it enqueued."""
+    _enqueue_phase(video_id, job_id, job["chunkCount"], job["phase"], set(job.get("completedChunks", [])))
+    _job_ref(video_id, job_id).update({"enqueuePending": False})
+
+
+@firestore.transactional
+def _complete_chunk(transaction, job_ref, index, phase):
+    """
+    Mark a chunk of the job's current phase done.
+
+    Returns:
+        bool: True for exactly one caller, the one completing the last chunk
+    """
+    job = job_ref.get(transaction=transaction).to_dict()
+    if job.get("phase", "full") != phase:
+        return False
+    completed = sorted(set(job.get("completedChunks", [])) | {index})
+    finalize = len(completed) >= job["chunkCount"] and job["status"] == "running"
+    update = {"completedChunks": completed}
+    if finalize:
+        update["status"] = "finalizing"
+    transaction.update(job_ref, update)
+    return finalize
+
+
+@firestore.transactional
+def _reset_finalizing(transaction, job_ref, phase):
+    """Return a job whose finalizer failed to running, so a retried chunk task finalizes it again."""
+    job = job_ref.get(transaction=transaction).to_dict()
+    if job.get("status") == "finalizing" and job.get("phase", "full") == phase:
+        transaction.update(job_ref, {"status": "running"})
+
+
+def _separate_segments(video_id, job, index, quality="full"):
+    """
+    Separate one chunk of segments and upload each stem's segments.
+
+    The chunk and CONTEXT_SEGMENTS of context on each side are decoded as
+    one stream and separated in one pass. Each stem is then encoded in one
+    pass over the same span and cut back into the original segmentation, so
+    the stem segments line up with the original track's and the encoder
+    carries its state across their boundaries; the context segments are
+    discarded.
+    """
+    segments = job["segments"]
+    start = index * job["chunkSegments"]
+    end = min(start + job["chunkSegments"], len(segments))
+    low = max(start - CONTEXT_SEGMENTS, 0)
+    high = min(end + CONTEXT_SEGMENTS, len(segments))
+    durations = [segment["duration"] for segment in segments[low:high]]
+    ts_offset = sum(segment["duration"] for segment in segments[:low])
+
+    samples = decode_segments(bucket.blob(segment["path"]).download_as_bytes() for segment in segments[low:high])
+    stems = separate_stems(samples, quality)
+    del samples
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        def encode(stem):
+            output_dir = os.path.join(temp_dir, stem)
+            os.makedirs(output_dir)
+            paths = encode_segments(stems[stem], durations, ts_offset, output_dir, bitrate=STEM_BITRATES[quality])
+            return [(_segment_path(job, stem, i, quality), paths[i - low]) for i in range(start, end)]
+
+        with ThreadPoolExecutor(max_workers=ENCODE_WORKERS) as executor:
+            encoded = [item for items in executor.map(encode, STEM_TYPES) for item in items]
+        objects = {}
+        for path, filename in encoded:
+            with open(filename, "rb") as f:
+                objects[path] = f.read()
+    upload_objects(objects)
+    print(f"Separated {quality} chunk {index} (segments {start}-{end - 1}) of {video_id}")
+
+
+def separate_chunk(data):
+    """
+    Worker: separate one chunk of a job.
+
+    The worker that completes the last chunk of an eager job's phase runs
+    the finalizer; if that fails, the job goes back to running so the
+    task's retry runs it again. Tasks left over from an earlier phase are
+    skipped, unless the job's next phase was not fully enqueued, in which
+    case they enqueue the rest. Chunks of lazy jobs are queued ahead of
+    playback and are skipped if a segment request got to them first.
+    """
+    video_id, job_id, index = data["videoId"], data["jobId"], int(data["chunkIndex"])
+    phase = data.get("phase", "full")
+    job_ref = _job_ref(video_id, job_id)
+    job = job_ref.get().to_dict()
+    if job and job.get("mode") == "lazy":
+        _separate_lazy_chunk(video_id, job_id, index, wait=False)
+        return
+    if job and job.get("enqueuePending") and job.get("phase", "full") != phase:
+        # The finalizer of the previous phase switched phases but failed to
+        # enqueue every chunk of the new one; this is its task's retry
+        _enqueue_pending_phase(video_id, job_id, job)
+        return
+    if not job or job["status"] not in ("running", "finalizing") or job.get("phase", "full") != phase:
+        print(f"Skipping {phase} chunk {index} of job {job_id}: job is {job and job['status']}")
+        return
+
+    if index not in job.get("completedChunks", []):
+        _separate_segments(video_id, job, index, phase)
+
+    if _complete_chunk(db.transaction(), job_ref, index, phase):
+        try:
+            finalize_separation(video_id, job_id)
+        except Exception:
+            # The task queue retries this chunk, which then finalizes again
+            _reset_finalizing(db.transaction(), job_ref, phase)
+            raise
+
+
+def _media_playlists(job, segment_url, quality="full"):
+    """Each stem's media playlist, with segment URIs from segment_url(stem, index)."""
+    return {
+        f"{_stem_dir(job, stem, quality)}/playlist.m3u8": build_media_playlist([
+            (segment["duration"], segment_url(stem, i)) for i, segment in enumerate(job["segments"])
+        ])
+        for stem in job["stemPaths"]
+    }
+
+
+def _publish_stems(video_id, job_id, job, segment_url, separation, job_update=None, quality="full",
+                   replace_preview=False):
+    """
+    Write the stem playlists and create or update an audio track document per stem.
+
+    Creating the documents starts ingest_audio_track for each stem. With
+    replace_preview, the documents of a published preview are switched to
+    the new playlists instead, all in the same batch as the job and video
+    updates, so clients never see a mix of preview and full-quality stems.
+
+    Args:
+        segment_url: Called with (stem, segment index); returns the segment's URI
+        separation: The video's new "stemSeparation" state
+        job_update: Fields to update on the job document in the same batch
+        quality: The separation quality the playlists point at
+    """
+    name = bucket_name()
+    objects = _media_playlists(job, segment_url, quality)
+    tracks = {}
+    for stem, base_path in job["stemPaths"].items():
+        stem_dir = _stem_dir(job, stem, quality)
+        master_path = f"{stem_dir}/master.m3u8"
+        playlist_url = storage_download_url(name, f"{stem_dir}/playlist.m3u8")
+        objects[master_path] = build_master_playlist([(_bandwidth(quality), playlist_url)])
+        tracks[stem] = {
+            "masterPlaylistUrl": storage_download_url(name, master_path),
+            "variants": [{
+                "quality": "high" if quality == "full" else "low",
+                "bitrate": _bandwidth(quality),
+                "playlistUrl": playlist_url
+            }],
+            "lastModified": firestore.SERVER_TIMESTAMP
+        }
+        if not replace_preview:
+            tracks[stem].update({
+                "videoId": video_id,
+                "type": stem,
+                "hlsBasePath": f"{base_path}/",
+                "createdAt": firestore.SERVER_TIMESTAMP
+            })
+    upload_objects(objects)
+
+    video_ref = db.collection("videos").document(video_id)
+    batch = db.batch()
+    for stem, track in tracks.items():
+        track_ref = video_ref.collection("audioTracks").document(stem)
+        separated_by = f"openunmix-{SEPARATION_MODELS[quality][0]}"
+        if replace_preview:
+            batch.update(track_ref, {**track, "metadata.quality": quality, "metadata.separatedBy": separated_by})
+        else:
+            track["metadata"] = {
+                "separatedBy": separated_by,
+                "jobId": job_id,
+                "separationMode": job.get("mode", "eager"),
+                "quality": quality
+            }
+            batch.set(track_ref, track)
+    if job_update:
+        batch.update(_job_ref(video_id, job_id), job_update)
+    batch.update(video_ref, {"stemSeparation": separation})
+    batch.commit()
+    invalidate_tracks(video_id)
+
+
+def finalize_separation(video_id, job_id):
+    """
+    Publish the stems of an eager job's phase once every chunk of it is separated.
+
+    After the preview phase, the preview stems are published and the full
+    phase is enqueued; the job stays marked enqueuePending until every full
+    chunk is queued, so if enqueueing fails the retried preview task queues
+    the rest (see separate_chunk). After the full phase, the stems are
+    published, or replace the preview.
+    """
+    job = _job_ref(video_id, job_id).get().to_dict()
+    name = bucket_name()
+    phase = job.get("phase", "full")
+    seconds = time.time() - job["startedAt"]
+
+    def segment_url(stem, i):
+        return storage_download_url(name, _segment_path(job, stem, i, phase))
+
+    if phase == "preview":
+        _publish_stems(
+            video_id,
+            job_id,
+            job,
+            segment_url,
+            {
+                "status": "running",
+                "jobId": job_id,
+                "chunkCount": job["chunkCount"],
+                "startedAt": job["startedAt"],
+                "phase": "full",
+                "previewSeconds": seconds
+            },
+            job_update={
+                "status": "running",
+                "phase": "full",
+                "completedChunks": [],
+                "previewSeconds": seconds,
+                "enqueuePending": True
+            },
+            quality="preview"
+        )
+        print(f"Published preview stems for {video_id} (job {job_id}) in {seconds:.1f}s")
+        _enqueue_pending_phase(video_id, job_id, {**job, "phase": "full", "completedChunks": []})
+        return
+
+    _publish_stems(
+        video_id,
+        job_id,
+        job,
+        segment_url,
+        {
+            "status": "complete",
+            "jobId": job_id,
+            "chunkCount": job["chunkCount"],
+            "startedAt": job["startedAt"],
+            "seconds": seconds,
+            **({"previewSeconds": job["previewSeconds"]} if "previewSeconds" in job else {})
+        },
+        job_update={"status": "complete", "completedAt": firestore.SERVER_TIMESTAMP},
+        replace_preview="previewSeconds" in job
+    )
+    print(f"Finalized stems for {video_id} (job {job_id}) in {seconds:.1f}s")
+
+
+def _lazy_segment_url(video_id, job_id, job, separated):
+    """segment_url for lazy playlists: Storage for separated chunks, stem_segment otherwise."""
+    name = bucket_name()
+
+    def segment_url(stem, index):
+        if index // job["chunkSegments"] in separated:
+            return storage_download_url(name, _segment_path(job, stem, index))
+        return stem_segment_proxy_url(video_id, job_id, stem, index)
+    return segment_url
+
+
+def _chunk_claimed(job, index):
+    claimed_at = (job.get("chunkClaims") or {}).get(str(index), 0)
+    return time.time() - claimed_at < CHUNK_CLAIM_SECONDS
+
+
+@firestore.transactional
+def _claim_chunk(transaction, job_ref, index):
+    """
+    Take a lazy chunk unless it is separated or another caller is separating it.
+
+    Returns:
+        tuple: (claimed, job)
+    """
+    job = job_ref.get(transaction=transaction).to_dict()
+    if index in job.get("completedChunks", []) or _chunk_claimed(job, index):
+        return False, job
+    claims = {**(job.get("chunkClaims") or {}), str(index): time.time()}
+    transaction.update(job_ref, {"chunkClaims": claims})
+    return True, job
+
+
+@firestore.transactional
+def _release_chunk(transaction, job_ref, index, completed):
+    """
+    Drop the claim on a lazy chunk, recording it as separated if completed.
+
+    Returns:
+        list: The job's separated chunks
+    """
+    job = job_ref.get(transaction=transaction).to_dict()
+    claims = dict(job.get("chunkClaims") or {})
+    claims.pop(str(index), None)
+    separated = set(job.get("completedChunks", []))
+    if completed:
+        separated.add(index)
+    update = {"chunkClaims": claims, "completedChunks": sorted(separated)}
+    if len(separated) >= job["chunkCount"]:
+        update["status"] = "complete"
+        update["completedAt"] = firestore.SERVER_TIMESTAMP
+    transaction.update(job_ref, update)
+    return update["completedChunks"]
+
+
+def _separate_lazy_chunk(video_id, job_id, index, wait=True):
+    """
+    Separate a chunk of a lazy job unless it already is.
+
+    Callers on other instances find the chunk claimed and, with wait=True,
+    poll the job until it is separated. Once it is, the stem playlists are
+    rewritten so its segments point straight at Storage. Playlists written
+    concurrently for different chunks may miss each other's chunks, whose
+    segments are then still redirected by stem_segment.
+
+    Returns:
+        dict: The job document as read when claiming the chunk
+    """
+    job_ref = _job_ref(video_id, job_id)
+    deadline = time.monotonic() + CHUNK_WAIT_TIMEOUT_SECONDS
+    while True:
+        claimed, job = _claim_chunk(db.transaction(), job_ref, index)
+        if claimed or index in job.get("completedChunks", []) or not wait:
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for chunk {index} of job {job_id}")
+        time.sleep(CHUNK_POLL_INTERVAL_SECONDS)
+    if not claimed:
+        return job
+
+    try:
+        _separate_segments(video_id, job, index)
+    except BaseException:
+        _release_chunk(db.transaction(), job_ref, index, completed=False)
+        raise
+    separated = _release_chunk(db.transaction(), job_ref, index, completed=True)
+    upload_objects(_media_playlists(job, _lazy_segment_url(video_id, job_id, job, set(separated))))
+    return job
+
+
+def _queue_chunks(video_id, job_id, job, indices):
+    """Enqueue separation tasks for the chunks among indices that aren't separated or claimed."""
+    queued = 0
+    for index in indices:
+        if index in job.get("completedChunks", []) or _chunk_claimed(job, index):
+            continue
+        enqueue(SEPARATION_TASK, {"videoId": video_id, "jobId": job_id, "chunkIndex": index})
+        queued += 1
+    return queued
+
+
+def _remember_separated(job_id, job, index):
+    with _lazy_jobs_lock:
+        entry = _lazy_jobs.get(job_id)
+        if entry is None:
+            entry = {
+                "stemPaths": job["stemPaths"],
+                "chunkSegments": job["chunkSegments"],
+                "segmentCount": len(job["segments"]),
+                "separated": set(job.get("completedChunks", []))
+            }
+            _lazy_jobs[job_id] = entry
+        entry["separated"].add(index)
+        _lazy_jobs.move_to_end(job_id)
+        while len(_lazy_jobs) > LAZY_JOB_CACHE_ENTRIES:
+            _lazy_jobs.popitem(last=False)
+
+
+def _known_segment_path(job_id, stem, index):
+    """Storage path of a segment this instance knows is separated, or None."""
+    with _lazy_jobs_lock:
+        entry = _lazy_jobs.get(job_id)
+        if entry is None or stem not in entry["stemPaths"] or not 0 <= index < entry["segmentCount"]:
+            return None
+        if index // entry["chunkSegments"] not in entry["separated"]:
+            return None
+        _lazy_jobs.move_to_end(job_id)
+        return _segment_path(entry, stem, index)
+
+
+def lazy_segment_url(video_id, job_id, stem, index):
+    """
+    Storage URL of a segment of a lazily separated stem, separating its chunk first if needed.
+
+    Concurrent requests for segments of one chunk share one separation, on
+    this instance through single-flight and across instances through a claim
+    on the job document. The following LAZY_LOOKAHEAD_CHUNKS chunks are
+    queued for task queue workers so playback doesn't wait at every chunk.
+
+    Raises:
+        SeparationError: If the job, stem or segment doesn't exist
+    """
+    name = bucket_name()
+    path = _known_segment_path(job_id, stem, index)
+    if path is not None:
+        return storage_download_url(name, path)
+
+    snapshot = _job_ref(video_id, job_id).get()
+    job = snapshot.to_dict() if snapshot.exists else None
+    if not job or job.get("mode") != "lazy":
+        raise SeparationError(f"Lazy stem job {job_id} not found for video {video_id}", status=404)
+    if stem not in job["stemPaths"] or not 0 <= index < len(job["segments"]):
+        raise SeparationError(f"Segment {index} of stem {stem} not found", status=404)
+
+    chunk = index // job["chunkSegments"]
+    if chunk not in job.get("completedChunks", []):
+        _chunks_inflight.do(f"{job_id}:{chunk}", lambda: _separate_lazy_chunk(video_id, job_id, chunk))
+    _remember_separated(job_id, job, chunk)
+    _queue_chunks(video_id, job_id, job, range(chunk + 1, min(chunk + 1 + LAZY_LOOKAHEAD_CHUNKS, job["chunkCount"])))
+    return storage_download_url(name, _segment_path(job, stem, index))
+
+
+def queue_lazy_separation(video_id, tracks):
+    """
+    Queue every unseparated chunk of the lazily separated stems among tracks.
+
+    For callers that need whole stems in Storage rather than played segments.
+
+    Returns:
+        bool: Whether any of the stems isn't fully separated yet
+    """
+    job_ids = {
+        (track.get("metadata") or {}).get("jobId")
+        for track in tracks
+        if (track.get("metadata") or {}).get("separationMode") == "lazy"
+    }
+    pending = False
+    for job_id in job_ids:
+        job = _job_ref(video_id, job_id).get().to_dict()
+        if job["status"] == "complete":
+            continue
+        pending = True
+        queued = _queue_chunks(video_id, job_id, job, range(job["chunkCount"]))
+        print(f"Queued {queued} remaining chunks of lazy job {job_id} for {video_id}")
+    return pending
@@ -0,0 +1,152 @@
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+from audio.hls import is_master_playlist
+from spec.config import bucket
+
+# Outputs stored under content-addressed names (e.g. a digest of their data
+# or of what they were built from) never change once written, so CDNs and
+# clients may keep them forever. Callers opt in per upload.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Other objects live at fixed paths that may be written again (re-separated
+# stem segments, recomputed peaks), so they are only cached for a while
+OBJECT_CACHE_CONTROL = "public, max-age=3600"
+
+# Playlists are the entry points readers poll and may be replaced (e.g. a
+# preview rendition upgraded to full quality), so they are cached briefly
+PLAYLIST_CACHE_CONTROL = "public, max-age=60"
+
+# Concurrent uploads; each one is mostly waiting on the network
+UPLOAD_WORKERS = int(os.getenv('STORAGE_UPLOAD_WORKERS', '16'))
+
+# Files at least this large are sent as resumable uploads in chunks of
+# RESUMABLE_CHUNK_BYTES (a multiple of 256 KiB), so a failed request only
+# resends one chunk
+RESUMABLE_THRESHOLD_BYTES = 8 * 1024 * 1024
+RESUMABLE_CHUNK_BYTES = 8 * 1024 * 1024
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".aac": "audio/aac",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".m4a": "audio/mp4",
+    ".vtt": "text/vtt",
+    ".json": "application/json",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".bin": "application/octet-stream",
+    ".mid": "audio/midi"
+}
+
+
+def content_type_for(path):
+    extension = os.path.splitext(path)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def _is_playlist(path):
+    return path.lower().endswith(".m3u8")
+
+
+def upload_object(path, data=None, filename=None, content_type=None, cache_control=None):
+    """
+    Upload bytes (data) or a local file (filename) to Storage.
+
+    The content type is derived from the path unless given. The cache
+    policy defaults to PLAYLIST_CACHE_CONTROL for playlists and
+    OBJECT_CACHE_CONTROL otherwise; pass IMMUTABLE_CACHE_CONTROL only for
+    content-addressed paths.
+    """
+    blob = bucket.blob(path)
+    blob.cache_control = cache_control or (PLAYLIST_CACHE_CONTROL if _is_playlist(path) else OBJECT_CACHE_CONTROL)
+    content_type = content_type or content_type_for(path)
+    if filename is not None:
+        if os.path.getsize(filename) >= RESUMABLE_THRESHOLD_BYTES:
+            blob.chunk_size = RESUMABLE_CHUNK_BYTES
+        blob.upload_from_filename(filename, content_type=content_type)
+    else:
+        blob.upload_from_string(data, content_type=content_type)
+    return path
+
+
+def _upload_rank(path, read):
+    """0 for segments and other files, 1 for media playlists, 2 for master playlists."""
+    if not _is_playlist(path):
+        return 0
+    return 2 if is_master_playlist(read(path)) else 1
+
+
+def _upload_in_order(paths, read, upload, workers):
+    """
+    Upload paths with bounded parallelism, one rank at a time.
+
+    Each rank finishes before the next starts, so a playlist never
+    references an object that hasn't been written yet.
+    """
+    ranks = {}
+    for path in paths:
+        ranks.setdefault(_upload_rank(path, read), []).append(path)
+
+    uploaded = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for rank in sorted(ranks):
+            uploaded.extend(executor.map(upload, ranks[rank]))
+    return uploaded
+
+
+def upload_objects(objects, workers=UPLOAD_WORKERS, cache_control=None):
+    """
+    Upload in-memory objects concurrently, playlists last.
+
+    Args:
+        objects: Storage path to bytes (or str for playlists)
+        cache_control: Cache policy for every object instead of the
+            defaults (see upload_object)
+
+    Returns:
+        list: The uploaded paths, in upload order
+    """
+    def read(path):
+        data = objects[path]
+        return data.decode("utf-8", errors="ignore") if isinstance(data, bytes) else data
+
+    return _upload_in_order(
+        list(objects), read,
+        lambda path: upload_object(path, objects[path], cache_control=cache_control),
+        workers
+    )
+
+
+def upload_tree(local_dir, prefix, workers=UPLOAD_WORKERS, cache_control=None):
+    """
+    Upload a local output tree (e.g. an HLS rendition ladder) under a Storage prefix.
+
+    Segments and other files go first with bounded parallelism, then media
+    playlists, then master playlists, so readers never see a playlist that
+    points at objects which don't exist yet. cache_control applies to every
+    file, as in upload_objects.
+
+    Returns:
+        list: The uploaded Storage paths, in upload order
+    """
+    files = {}
+    for root, _, names in os.walk(local_dir):
+        for name in names:
+            local_path = os.path.join(root, name)
+            relative = os.path.relpath(local_path, local_dir).replace(os.sep, "/")
+            files[f"{prefix.rstrip('/')}/{relative}"] = local_path
+
+    def read(path):
+        with open(files[path], encoding="utf-8", errors="ignore") as f:
+            return f.read()
+
+    return _upload_in_order(
+        list(files), read,
+        lambda path: upload_object(path, filename=files[path], cache_control=cache_control),
+        workers
+    )
@@ -0,0 +1,98 @@
+import collections
+import copy
+import os
+import threading
+from firebase_admin import functions
+
+# Region the task queue functions are deployed to
+TASK_QUEUE_LOCATION = "us-central1"
+
+# Attempts the local queue makes per task, like the functions' RetryConfig
+LOCAL_MAX_ATTEMPTS = 3
+
+# Plain-Python task handlers by function name, for the local queue
+_handlers = {}
+
+# When set, tasks go to this in-process queue instead of Cloud Tasks
+_local_queue = None
+
+
+def register_task_handler(function_name, handler):
+    """Register the plain function behind a task queue function, for local dispatch."""
+    _handlers[function_name] = handler
+
+
+class LocalTaskQueue:
+    """
+    In-process stand-in for Cloud Tasks, for tests and local runs.
+
+    Tasks are queued in order and run by drain(), or by a background thread
+    with autorun=True. Payloads are deep-copied as they would be serialized.
+    A failing task is retried up to LOCAL_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, autorun=False):
+        self._tasks = collections.deque()
+        self._condition = threading.Condition()
+        self.completed = []
+        self.failed = []
+        if autorun:
+            threading.Thread(target=self._run_forever, daemon=True).start()
+
+    def enqueue(self, function_name, payload):
+        with self._condition:
+            self._tasks.append((function_name, copy.deepcopy(payload), 1))
+            self._condition.notify()
+        return f"local-{function_name}-{len(self.completed) + len(self._tasks)}"
+
+    def _run(self, function_name, payload, attempt):
+        try:
+            _handlers[function_name](payload)
+            self.completed.append((function_name, payload))
+        except Exception as e:
+            if attempt < LOCAL_MAX_ATTEMPTS:
+                with self._condition:
+                    self._tasks.append((function_name, payload, attempt + 1))
+            else:
+                print(f"Task {function_name} failed after {attempt} attempts: {e}")
+                self.failed.append((function_name, payload, e))
+
+    def drain(self):
+        """Run queued tasks, including ones they enqueue, until none are left."""
+        while True:
+            with self._condition:
+                if not self._tasks:
+                    return
+                task = self._tasks.popleft()
+            self._run(*task)
+
+    def _run_forever(self):
+        while True:
+            with self._condition:
+                while not self._tasks:
+                    self._condition.wait()
+                task = self._tasks.popleft()
+            self._run(*task)
+
+
+def set_local_queue(queue):
+    """Send tasks to queue (a LocalTaskQueue) instead of Cloud Tasks; None restores Cloud Tasks."""
+    global _local_queue
+    _local_queue = queue
+
+
+def enqueue(function_name, payload):
+    """
+    Enqueue a task for a task queue function.
+
+    Returns:
+        str: The task ID
+    """
+    if _local_queue is not None:
+        return _local_queue.enqueue(function_name, payload)
+    queue = functions.task_queue(f"locations/{TASK_QUEUE_LOCATION}/functions/{function_name}")
+    return queue.enqueue(payload)
+
+
+if os.getenv('TASK_QUEUE_BACKEND') == 'local':
+    set_local_queue(LocalTaskQueue(autorun=True))
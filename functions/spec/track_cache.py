@@ -0,0 +1,175 @@
+import collections
+import os
+import threading
+import time
+from spec.config import db
+
+# How long a cached audio track document is served without re-reading it.
+# Other instances are not told about changes, so for up to this long they
+# may serve a track's previous masterPlaylistUrl (e.g. a preview stem after
+# its upgrade). Anything derived from a track's audio must therefore be
+# cached by that URL, as transcription leases and stem mixes are, so a
+# stale read never stores a result under the new audio's key.
+TRACK_CACHE_TTL_SECONDS = float(os.getenv('TRACK_CACHE_TTL_SECONDS', '30'))
+
+# How long a missing track document is remembered. Kept short so a request
+# arriving just before the document is created doesn't 404 for a full TTL.
+TRACK_MISS_TTL_SECONDS = float(os.getenv('TRACK_MISS_TTL_SECONDS', '2'))
+
+# Track documents (and per-video track listings) kept per instance
+TRACK_CACHE_MAX_ENTRIES = int(os.getenv('TRACK_CACHE_MAX_ENTRIES', '512'))
+
+
+class DocumentCache:
+    """
+    Thread-safe TTL/LRU cache of Firestore document data.
+
+    Each entry remembers the document's update_time, and a put never replaces
+    an entry with data from an older version of the document, so a slow read
+    that started before a faster one cannot roll the cache back.
+    """
+
+    def __init__(self, ttl=TRACK_CACHE_TTL_SECONDS, max_entries=TRACK_CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        """Return (found, value) for a fresh entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() - entry[2] > entry[3]:
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return True, entry[0]
+
+    def put(self, key, value, update_time=None, ttl=None):
+        """Store value, fresh for ttl seconds (the cache's TTL by default)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and update_time is not None and entry[1] is not None and update_time < entry[1]:
+                return
+            self._entries[key] = (value, update_time, self._clock(), self._ttl if ttl is None else ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None, prefix=None):
+        """Drop one entry, the entries whose keys start with prefix, or everything."""
+        with self._lock:
+            if key is not None:
+                self._entries.pop(key, None)
+            elif prefix is not None:
+                for stale in [k for k in self._entries if k.startswith(prefix)]:
+                    del self._entries[stale]
+            else:
+                self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hitRatio": self._hits / lookups if lookups else 0.0
+            }
+
+
+# Audio track data keyed by "videoId/trackId" (None for missing documents),
+# and track ids keyed by video id
+_tracks = DocumentCache()
+_track_lists = DocumentCache()
+
+
+def _tracks_collection(video_id):
+    return db.collection("videos").document(video_id).collection("audioTracks")
+
+
+def _cache_snapshot(video_id, snapshot):
+    if not snapshot.exists:
+        _tracks.put(f"{video_id}/{snapshot.id}", None, ttl=TRACK_MISS_TTL_SECONDS)
+        return None
+    data = snapshot.to_dict()
+    _tracks.put(f"{video_id}/{snapshot.id}", data, getattr(snapshot, "update_time", None))
+    return data
+
+
+def get_tracks(track_paths):
+    """
+    Read several audio track documents, fetching all cache misses in one batch.
+
+    Args:
+        track_paths: "videoId/trackId" strings
+
+    Returns:
+        dict: Track path to document data, or None if the document doesn't exist
+    """
+    tracks = {}
+    missing = []
+    for path in track_paths:
+        found, data = _tracks.get(path)
+        if found:
+            tracks[path] = data
+        else:
+            missing.append(path)
+
+    if missing:
+        refs = []
+        for path in missing:
+            video_id, track_id = path.split("/", 1)
+            refs.append(_tracks_collection(video_id).document(track_id))
+        for snapshot in db.get_all(refs):
+            video_id = snapshot.reference.parent.parent.id
+            tracks[f"{video_id}/{snapshot.id}"] = _cache_snapshot(video_id, snapshot)
+    return tracks
+
+
+def get_track(video_id, track_id):
+    """Read one audio track document through the cache; None if it doesn't exist."""
+    path = f"{video_id}/{track_id}"
+    found, data = _tracks.get(path)
+    if found:
+        return data
+    return _cache_snapshot(video_id, _tracks_collection(video_id).document(track_id).get())
+
+
+def list_tracks(video_id):
+    """
+    Read all audio tracks of a video.
+
+    A cold read streams the collection; while the listing is cached only
+    expired track documents are re-read, in one batched get_all.
+
+    Returns:
+        dict: Track id to document data
+    """
+    found, track_ids = _track_lists.get(video_id)
+    if found:
+        tracks = get_tracks([f"{video_id}/{track_id}" for track_id in track_ids])
+        return {path.split("/", 1)[1]: data for path, data in tracks.items() if data is not None}
+
+    tracks = {}
+    for snapshot in _tracks_collection(video_id).stream():
+        tracks[snapshot.id] = _cache_snapshot(video_id, snapshot)
+    _track_lists.put(video_id, sorted(tracks))
+    return tracks
+
+
+def invalidate_tracks(video_id, track_id=None):
+    """Forget cached data for one track, or for every track of a video."""
+    _track_lists.invalidate(video_id)
+    if track_id is not None:
+        _tracks.invalidate(f"{video_id}/{track_id}")
+    else:
+        _tracks.invalidate(prefix=f"{video_id}/")
+
+
+def cache_stats():
+    return {"tracks": _tracks.stats(), "trackLists": _track_lists.stats()}
@@ -3,16 +3,30 @@ import json
 import tempfile
 import os
 from datetime import datetime, timezone
-import yt_dlp
-import requests
-from basic_pitch.inference import predict_and_save
-from basic_pitch import ICASSP_2022_MODEL_PATH
-from spec.config import db, bucket
+from audio.midi import note_events_to_midi_bytes
+from audio.pipeline import download_hls_audio, midi_bytes_to_note_events, predict_note_events
+from audio.notes import note_events_to_json
+from spec.delivery import (
+    SIGNED_URL_TTL,
+    binary_response,
+    json_response,
+    redirect_response,
+    response_options,
+    signed_result_url
+)
+from spec.note_cache import load_note_range, load_note_range_midi
+from spec.prefetch import PrefetchCancelled, Prefetcher, adjacent_windows
+from spec.profiling import profile_requests
+from spec.single_flight import (
+    TRANSCRIBE_TIMEOUT_SECONDS,
+    SingleFlight,
+    run_with_lease,
+    transcription_key,
+    transcription_result_path
+)
+from spec.track_cache import get_track
+from spec.admission import AdmissionController, AdmissionRejected, estimate_transcription_cost
 from pydub import AudioSegment
-import sys
-import subprocess
-import contextlib
-import io
 import gc
 import base64
 import time
@@ -20,25 +34,197 @@ import time
 # Set Python's IO encoding to UTF-8
 os.environ['PYTHONIOENCODING'] = 'utf-8'
 
-@contextlib.contextmanager
-def utf8_stdout():
-    old_stdout = sys.stdout
-    wrapper = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='ignore')
-    sys.stdout = wrapper
+# Coalesces identical transcription requests running on this instance
+_inflight = SingleFlight()
+
+# Bounds the memory committed to concurrent transcriptions on this instance
+_admission = AdmissionController()
+
+# Transcribes the ranges after answered ones with leftover capacity
+_prefetcher = Prefetcher(_admission, _inflight)
+
+
+class TranscriptionError(Exception):
+    """Error raised by the transcription pipeline, carrying the HTTP status to return."""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+def _track_duration(track_data):
+    """Duration of the track in seconds if the track document records it."""
+    duration = track_data.get("duration") or (track_data.get("metadata") or {}).get("duration")
+    return float(duration) if duration else None
+
+
+def _estimate_request_cost(track_data, start_time, end_time):
+    """Estimate the memory a transcription of the requested range will need."""
+    track_seconds = _track_duration(track_data)
+    range_start = start_time if start_time is not None else 0
+    range_end = end_time if end_time is not None else track_seconds
+    range_seconds = max(range_end - range_start, 0) if range_end is not None else None
+    return estimate_transcription_cost(range_seconds, track_seconds)
+
+
+def _load_pretranscribed_range(transcription, start_time, end_time, as_midi=False):
+    """
+    Read the notes for a range from a track's stored full transcription.
+
+    Args:
+        as_midi: Return the range encoded as a MIDI file instead of note events
+
+    Returns:
+        tuple: (note_events or MIDI bytes, audio_duration) with note times
+        relative to the start of the range
+    """
+    duration = transcription["duration"]
+    range_start = max(start_time, 0) if start_time is not None else 0
+    range_end = min(end_time, duration) if end_time is not None else duration
+    if range_start >= range_end:
+        raise TranscriptionError(
+            "Invalid time range: start_time must be less than end_time",
+            status=400
+        )
+
+    if as_midi:
+        return load_note_range_midi(transcription, range_start, range_end), range_end - range_start
+    return load_note_range(transcription, range_start, range_end), range_end - range_start
+
+
+def _check_cancelled(cancelled):
+    if cancelled is not None and cancelled():
+        raise PrefetchCancelled("Speculative transcription preempted")
+
+
+def _transcribe_range(master_url, start_time, end_time, ts, cancelled=None):
+    """
+    Download an HLS audio track, slice it to the requested range and run basic-pitch.
+
+    Speculative transcriptions pass cancelled, which is checked between
+    stages; PrefetchCancelled is raised once it returns True.
+
+    Returns:
+        tuple: (midi_data, audio_duration) with the MIDI file bytes and the
+        duration in seconds of the audio that was transcribed
+
+    Raises:
+        TranscriptionError: If any stage of the pipeline fails
+    """
+    # Create temporary directory for processing
+    temp_dir = tempfile.mkdtemp()
+
     try:
-        yield
+        # Download audio file
+        try:
+            downloaded_audio_path = download_hls_audio(master_url, temp_dir, ts)
+        except Exception as e:
+            error_detail = str(e)
+            if hasattr(e, 'stderr'):
+                error_detail += f"\nFFmpeg stderr: {e.stderr}"
+            if hasattr(e, 'stdout'):
+                error_detail += f"\nFFmpeg stdout: {e.stdout}"
+            raise TranscriptionError(f"Error downloading audio: {error_detail}")
+        _check_cancelled(cancelled)
+
+        # Load and process audio file
+        audio = None
+        audio_duration = None
+        try:
+            print("Loading audio file...")
+            audio = AudioSegment.from_wav(downloaded_audio_path)
+            audio_duration = len(audio) / 1000.0  # Store duration in seconds
+
+            if start_time is not None or end_time is not None:
+                print("Applying time slicing...")
+                start_ms = int(start_time * 1000) if start_time is not None else 0
+                end_ms = int(end_time * 1000) if end_time is not None else len(audio)
+
+                if start_ms < 0:
+                    start_ms = 0
+                if end_ms > len(audio):
+                    end_ms = len(audio)
+                if start_ms >= end_ms:
+                    raise TranscriptionError(
+                        "Invalid time range: start_time must be less than end_time",
+                        status=400
+                    )
+
+                audio = audio[start_ms:end_ms]
+                audio_duration = len(audio) / 1000.0  # Update duration after slicing
+
+            processed_audio_path = os.path.join(temp_dir, f"{ts}_processed_audio.wav")
+            print(f"Exporting processed audio to: {processed_audio_path}")
+            audio.export(processed_audio_path, format="wav")
+            print("Audio export completed")
+
+        finally:
+            if audio:
+                print("Cleaning up audio resources...")
+                if hasattr(audio, '_data'):
+                    print("Clearing audio data")
+                    audio._data = None
+                if hasattr(audio, 'converter'):
+                    print(f"Audio converter type: {type(audio.converter)}")
+                    if hasattr(audio.converter, 'cleanup'):
+                        print("Cleaning up audio converter")
+                        try:
+                            audio.converter.cleanup()
+                        except Exception as e:
+                            print(f"Warning: Failed to cleanup audio converter: {e}")
+                audio = None
+                print("Audio resources cleanup completed")
+
+        _check_cancelled(cancelled)
+
+        # Generate MIDI
+        try:
+            print("Generating MIDI...")
+            # Silent spans of the range are skipped (see predict_note_events)
+            note_events = predict_note_events(processed_audio_path)
+            midi_data = note_events_to_midi_bytes(note_events)
+
+            return midi_data, audio_duration
+
+        except TranscriptionError:
+            raise
+        except Exception as e:
+            error_msg = str(e)
+            error_msg = ''.join(c for c in error_msg if ord(c) < 128)
+            raise TranscriptionError(f"Error generating MIDI: {error_msg}")
     finally:
-        wrapper.detach()  # Prevent closing the underlying buffer
-        sys.stdout = old_stdout
+        gc.collect()
+
+        try:
+            import shutil
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir)
+        except Exception as e:
+            print(f"Warning: Failed to clean up temporary directory: {e}")
+
+def _schedule_prefetch(track_id, master_url, track_data, start_time, end_time):
+    """Queue speculative transcriptions of the windows following an answered range."""
+    for window_start, window_end in adjacent_windows(start_time, end_time, _track_duration(track_data)):
+        _prefetcher.schedule(
+            transcription_key(track_id, window_start, window_end, master_url),
+            window_end - window_start,
+            _estimate_request_cost(track_data, window_start, window_end),
+            lambda cancelled, s=window_start, e=window_end: _transcribe_range(
+                master_url, s, e, time.monotonic(), cancelled
+            )
+        )
+
 
 @https_fn.on_request(
     region="us-central1",
     memory=options.MemoryOption.GB_1,
+    timeout_sec=TRANSCRIBE_TIMEOUT_SECONDS,
     cors=options.CorsOptions(
         cors_origins=["*"],
         cors_methods=["POST", "OPTIONS"]
     )
 )
+@profile_requests("transcribe_to_midi")
 def transcribe_to_midi(req: https_fn.Request) -> https_fn.Response:
     """
     Cloud Function to transcribe an audio track to MIDI using basic-pitch.
@@ -47,11 +233,40 @@ def transcribe_to_midi(req: https_fn.Request) -> https_fn.Response:
     {
         "trackId": string,  # Format: "videoId/audioTrackId"
         "startTime": float | None,  # Optional start time in seconds
-        "endTime": float | None     # Optional end time in seconds
+        "endTime": float | None,    # Optional end time in seconds
+        "format": "midi" | "notes",  # Optional, default "midi"
+        "responseMode": "base64" | "binary" | "url" | "redirect"  # Optional, default "base64"
     }
+
+    format and responseMode may also be passed as query parameters, and an
+    Accept: audio/midi header selects the binary mode. "url" and "redirect"
+    store the result in Storage and return a signed URL (in JSON or as a
+    302) so large results don't pass through the function. JSON bodies are
+    gzip-compressed when the client accepts it.
     
+    Identical concurrent requests (same trackId and range) are coalesced:
+    within an instance the first request does the work and the others share
+    its result, and across instances a Firestore lease ensures only one
+    instance transcribes while the rest read the stored result.
+
+    The instance doing the work must first be admitted against a memory
+    budget sized from the requested range. When too many requests are
+    already waiting, a 429 with a Retry-After header is returned instead.
+
+    Tracks transcribed at upload by ingest_audio_track skip all of this: the
+    stored notes for the range are sliced and encoded directly.
+
+    After an on-demand range is answered, the following window of the same
+    length is transcribed in the background with leftover capacity, so the
+    likely next request finds its result ready (see spec.prefetch).
+
+    Sending an X-Profile header carrying PROFILE_TOKEN (or
+    PROFILE_SAMPLE_RATE) profiles the request; the X-Profile-Id response
+    header names its artifacts in Storage (see spec.profiling).
+
     Returns:
-        JSON response containing the MIDI file data as a base64 string
+        JSON response containing the MIDI file data as a base64 string, or
+        the result in the requested format and response mode
     """
     try:
         ts = time.monotonic()
@@ -73,6 +288,18 @@ def transcribe_to_midi(req: https_fn.Request) -> https_fn.Response:
                 headers={"Content-Type": "application/json"}
             )
         
+        try:
+            response_mode, response_format = response_options(req, request_json)
+        except ValueError as e:
+            return https_fn.Response(
+                json.dumps({
+                    "success": False,
+                    "error": str(e)
+                }),
+                status=400,
+                headers={"Content-Type": "application/json"}
+            )
+
         if not track_id:
             return https_fn.Response(
                 json.dumps({
@@ -96,10 +323,9 @@ def transcribe_to_midi(req: https_fn.Request) -> https_fn.Response:
                 headers={"Content-Type": "application/json"}
             )
 
-        # Get audio track info from Firestore
-        track_doc = db.collection("videos").document(video_id)\
-                     .collection("audioTracks").document(audio_track_id).get()
-        if not track_doc.exists:
+        # Get audio track info (cached per instance, see spec.track_cache)
+        track_data = get_track(video_id, audio_track_id)
+        if track_data is None:
             return https_fn.Response(
                 json.dumps({
                     "success": False,
@@ -108,8 +334,7 @@ def transcribe_to_midi(req: https_fn.Request) -> https_fn.Response:
                 status=404,
                 headers={"Content-Type": "application/json"}
             )
-            
-        track_data = track_doc.to_dict()
+
         master_url = track_data.get("masterPlaylistUrl")
         if not master_url:
             return https_fn.Response(
@@ -121,203 +346,133 @@ def transcribe_to_midi(req: https_fn.Request) -> https_fn.Response:
                 headers={"Content-Type": "application/json"}
             )
 
-        # Create temporary directory for processing
-        temp_dir = tempfile.mkdtemp()
-        
+        key = transcription_key(track_id, start_time, end_time, master_url)
+        cost = _estimate_request_cost(track_data, start_time, end_time)
+        queue_info = {}
+
+        def admitted_transcribe():
+            # Only the request that actually does the work takes memory budget
+            with _admission.admit(cost) as waited:
+                queue_info["waitSeconds"] = waited
+                print(f"Admitted transcription for {key} after {waited:.2f}s "
+                      f"(estimated {cost // (1024 * 1024)} MB, queue depth {_admission.queue_depth()})")
+                return _transcribe_range(master_url, start_time, end_time, ts)
+
+        transcription = track_data.get("transcription") or {}
+        note_events = None
         try:
-            # Download audio file
-            downloaded_audio_path = os.path.join(temp_dir, f"{ts}_downloaded_audio.wav")
-            try:
-                # First download as TS file
-                temp_ts_path = os.path.join(temp_dir, f"{ts}_temp.ts")
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'outtmpl': temp_ts_path,
-                    'verbose': False,
-                    'no_warnings': True,
-                    'encoding': None,
-                    'legacy_server_connect': False,
-                    'force_generic_extractor': True
-                }
-                
-                ydl = None
-                try:
-                    ydl = yt_dlp.YoutubeDL(ydl_opts)
-                    ydl.download([master_url])
-                finally:
-                    if ydl:
-                        print("Closing yt-dlp...")
-                        ydl.close()
-                        print("yt-dlp closed")
-                
-                # Convert TS to WAV using FFmpeg
-                print("Converting TS to WAV...")
-                ffmpeg_cmd = [
-                    'ffmpeg', '-y',
-                    '-i', temp_ts_path,
-                    '-acodec', 'pcm_s16le',
-                    '-ar', '44100',
-                    '-ac', '2',
-                    '-loglevel', 'error',
-                    downloaded_audio_path
-                ]
-                
-                result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise Exception(f"FFmpeg conversion failed with code: {result.returncode}")
-                
-                print("Audio conversion completed")
-
-            except Exception as e:
-                error_detail = str(e)
-                if hasattr(e, 'stderr'):
-                    error_detail += f"\nFFmpeg stderr: {e.stderr}"
-                if hasattr(e, 'stdout'):
-                    error_detail += f"\nFFmpeg stdout: {e.stdout}"
-                    
-                return https_fn.Response(
-                    json.dumps({
-                        "success": False,
-                        "error": f"Error downloading audio: {error_detail}"
-                    }, ensure_ascii=False).encode('utf-8'),
-                    status=500,
-                    headers={"Content-Type": "application/json; charset=utf-8"}
-                )
-
-            # Load and process audio file
-            audio = None
-            audio_duration = None
-            try:
-                print("Loading audio file...")
-                audio = AudioSegment.from_wav(downloaded_audio_path)
-                audio_duration = len(audio) / 1000.0  # Store duration in seconds
-                
-                if start_time is not None or end_time is not None:
-                    print("Applying time slicing...")
-                    start_ms = int(start_time * 1000) if start_time is not None else 0
-                    end_ms = int(end_time * 1000) if end_time is not None else len(audio)
-                    
-                    if start_ms < 0:
-                        start_ms = 0
-                    if end_ms > len(audio):
-                        end_ms = len(audio)
-                    if start_ms >= end_ms:
-                        return https_fn.Response(
-                            json.dumps({
-                                "success": False,
-                                "error": "Invalid time range: start_time must be less than end_time"
-                            }),
-                            status=400,
-                            headers={"Content-Type": "application/json"}
-                        )
-                    
-                    audio = audio[start_ms:end_ms]
-                    audio_duration = len(audio) / 1000.0  # Update duration after slicing
-                
-                processed_audio_path = os.path.join(temp_dir, f"{ts}_processed_audio.wav")
-                print(f"Exporting processed audio to: {processed_audio_path}")
-                audio.export(processed_audio_path, format="wav")
-                print("Audio export completed")
-                
-            finally:
-                if audio:
-                    print("Cleaning up audio resources...")
-                    if hasattr(audio, '_data'):
-                        print("Clearing audio data")
-                        audio._data = None
-                    if hasattr(audio, 'converter'):
-                        print(f"Audio converter type: {type(audio.converter)}")
-                        if hasattr(audio.converter, 'cleanup'):
-                            print("Cleaning up audio converter")
-                            try:
-                                audio.converter.cleanup()
-                            except Exception as e:
-                                print(f"Warning: Failed to cleanup audio converter: {e}")
-                    audio = None
-                    print("Audio resources cleanup completed")
-            
-            # Generate MIDI
-            try:
-                print("Generating MIDI...")
-                midi_path = os.path.join(temp_dir, f"{ts}_processed_audio_basic_pitch.mid")
-                print("processed_audio_path: ", processed_audio_path)
-                # Only use utf8_stdout for the MIDI generation
-                with utf8_stdout():
-                    predict_and_save(
-                        [processed_audio_path],
-                        temp_dir,
-                        model_or_model_path=ICASSP_2022_MODEL_PATH,
-                        save_midi=True,
-                        sonify_midi=False,
-                        save_model_outputs=False,
-                        save_notes=False
+            if transcription.get("status") == "complete":
+                # The whole track was transcribed at upload; slice the stored notes
+                if response_format == "midi":
+                    midi_data, audio_duration = _load_pretranscribed_range(
+                        transcription, start_time, end_time, as_midi=True
                     )
-                # Separate file check and reading from MIDI generation
-                if not os.path.exists(midi_path):
-                    return https_fn.Response(
-                        json.dumps({
-                            "success": False,
-                            "error": "MIDI file generation failed - output file not found"
-                        }, ensure_ascii=False).encode('utf-8'),
-                        status=500,
-                        headers={"Content-Type": "application/json; charset=utf-8"}
+                else:
+                    note_events, audio_duration = _load_pretranscribed_range(
+                        transcription, start_time, end_time
                     )
-                
-                # Read MIDI file with explicit file handling
+                    midi_data = None
+                shared = False
+            else:
+                # Speculative work for other ranges gives way to this request
+                _prefetcher.preempt(key)
                 try:
-                    with open(midi_path, "rb") as f:
-                        midi_data = f.read()
-                except IOError as e:
-                    return https_fn.Response(
-                        json.dumps({
-                            "success": False,
-                            "error": f"Failed to read generated MIDI file: {str(e)}"
-                        }, ensure_ascii=False).encode('utf-8'),
-                        status=500,
-                        headers={"Content-Type": "application/json; charset=utf-8"}
+                    (midi_data, audio_duration), shared = _inflight.do(
+                        key,
+                        lambda: run_with_lease(key, admitted_transcribe)
                     )
-                except Exception as e:
-                    print(f"Error reading MIDI file: {e}\n\nBUT WHOCARE???")
-                midi_base64 = base64.b64encode(midi_data).decode('utf-8')
-                
-                time_range = {
-                    "startTime": start_time if start_time is not None else 0,
-                    "endTime": end_time if end_time is not None else audio_duration
+                except PrefetchCancelled:
+                    # Joined a prefetch that gave up; do the work here instead
+                    (midi_data, audio_duration), shared = _inflight.do(
+                        key,
+                        lambda: run_with_lease(key, admitted_transcribe)
+                    )
+                _schedule_prefetch(track_id, master_url, track_data, start_time, end_time)
+        except AdmissionRejected as e:
+            print(f"Rejected transcription for {key}: {e} (stats: {_admission.stats()})")
+            return https_fn.Response(
+                json.dumps({
+                    "success": False,
+                    "error": str(e),
+                    "retryAfter": e.retry_after
+                }),
+                status=429,
+                headers={
+                    "Content-Type": "application/json",
+                    "Retry-After": str(e.retry_after)
                 }
-                
-                return https_fn.Response(
-                    json.dumps({
-                        "success": True,
-                        "midiData": midi_base64,
-                        "filename": f"{track_id.split('//')[0]}_{time_range['startTime']:.1f}_{time_range['endTime']:.1f}.mid",
-                        "timeRange": time_range,
-                        "timestamp": datetime.now(timezone.utc).isoformat()
-                    }, ensure_ascii=False).encode('utf-8'),
-                    status=200,
-                    headers={"Content-Type": "application/json; charset=utf-8"}
-                )
-                
-            except Exception as e:
-                error_msg = str(e)
-                error_msg = ''.join(c for c in error_msg if ord(c) < 128)
-                return https_fn.Response(
-                    json.dumps({
-                        "success": False,
-                        "error": f"Error generating MIDI: {error_msg}"
-                    }, ensure_ascii=False).encode('utf-8'),
-                    status=500,
-                    headers={"Content-Type": "application/json; charset=utf-8"}
-                )
-        finally:
-            gc.collect()
-            
-            try:
-                import shutil
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-            except Exception as e:
-                print(f"Warning: Failed to clean up temporary directory: {e}")
-                
+            )
+        except TranscriptionError as e:
+            return https_fn.Response(
+                json.dumps({
+                    "success": False,
+                    "error": str(e)
+                }, ensure_ascii=False).encode('utf-8'),
+                status=e.status,
+                headers={"Content-Type": "application/json; charset=utf-8"}
+            )
+        if shared:
+            print(f"Shared in-flight transcription result for {key}")
+
+        headers = {"X-Queue-Depth": str(_admission.queue_depth())}
+        if "waitSeconds" in queue_info:
+            headers["X-Queue-Wait-Ms"] = str(int(queue_info["waitSeconds"] * 1000))
+
+        time_range = {
+            "startTime": start_time if start_time is not None else 0,
+            "endTime": end_time if end_time is not None else audio_duration
+        }
+        filename = f"{track_id.split('//')[0]}_{time_range['startTime']:.1f}_{time_range['endTime']:.1f}.mid"
+        # Results computed on demand are already in Storage (see run_with_lease)
+        result_path = transcription_result_path(key)
+        result_stored = transcription.get("status") != "complete"
+
+        if response_format == "notes":
+            if note_events is None:
+                note_events = midi_bytes_to_note_events(midi_data)
+            notes_data = {
+                "success": True,
+                "notes": note_events_to_json(note_events),
+                "timeRange": time_range,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+            if response_mode not in ("url", "redirect"):
+                return json_response(req, notes_data, headers=headers)
+            url = signed_result_url(
+                result_path[:-len(".mid")] + ".notes.json",
+                json.dumps(notes_data).encode('utf-8'),
+                content_type="application/json",
+                compress=True
+            )
+        elif response_mode == "binary":
+            return binary_response(midi_data, filename, headers)
+        elif response_mode in ("url", "redirect"):
+            url = signed_result_url(result_path, None if result_stored else midi_data)
+        else:
+            midi_base64 = base64.b64encode(midi_data).decode('utf-8')
+            return https_fn.Response(
+                json.dumps({
+                    "success": True,
+                    "midiData": midi_base64,
+                    "filename": filename,
+                    "timeRange": time_range,
+                    "timestamp": datetime.now(timezone.utc).isoformat()
+                }, ensure_ascii=False).encode('utf-8'),
+                status=200,
+                headers={**headers, "Content-Type": "application/json; charset=utf-8"}
+            )
+
+        if response_mode == "redirect":
+            return redirect_response(url)
+        return json_response(req, {
+            "success": True,
+            "url": url,
+            "expiresIn": int(SIGNED_URL_TTL.total_seconds()),
+            "filename": filename if response_format == "midi" else None,
+            "timeRange": time_range,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }, headers=headers)
+
     except Exception as e:
         error_msg = str(e)
         # error_msg = ''.join(c for c in error_msg if ord(c) < 128)
@@ -0,0 +1,84 @@
+import threading
+import pytest
+from spec.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    estimate_transcription_cost,
+    INFERENCE_OVERHEAD_BYTES
+)
+
+
+def test_estimate_grows_with_range_length():
+    """Test that longer ranges are estimated to need more memory."""
+    short = estimate_transcription_cost(10, track_seconds=300)
+    long = estimate_transcription_cost(120, track_seconds=300)
+    assert INFERENCE_OVERHEAD_BYTES < short < long
+
+
+def test_estimate_without_range_uses_track_length():
+    """Test that an open-ended range is costed as the whole track."""
+    assert estimate_transcription_cost(None, track_seconds=60) == estimate_transcription_cost(60, 60)
+
+
+def test_admit_reserves_and_releases_budget():
+    """Test that admitted requests hold their cost until the block exits."""
+    controller = AdmissionController(capacity=100, max_queue=2, max_wait=1)
+    with controller.admit(60) as waited:
+        assert waited >= 0
+        stats = controller.stats()
+        assert stats["inFlight"] == 1
+        assert stats["availableBytes"] == 40
+    assert controller.stats()["availableBytes"] == 100
+    assert controller.stats()["admitted"] == 1
+
+
+def test_admit_rejects_when_queue_is_full():
+    """Test that requests beyond the queue bound fail fast with Retry-After."""
+    controller = AdmissionController(capacity=100, max_queue=0, max_wait=1)
+    with controller.admit(60):
+        with pytest.raises(AdmissionRejected) as exc_info:
+            with controller.admit(50):
+                pass
+    assert exc_info.value.retry_after >= 1
+    assert controller.stats()["rejected"] == 1
+
+
+def test_admit_without_queue_runs_requests_that_fit():
+    """Test that max_queue only limits requests that would have to wait."""
+    controller = AdmissionController(capacity=100, max_queue=0, max_wait=1)
+    with controller.admit(50) as waited:
+        with controller.admit(50):
+            assert controller.stats()["inFlight"] == 2
+    assert waited < 0.1
+    assert controller.stats()["rejected"] == 0
+
+
+def test_admit_times_out_when_budget_is_held():
+    """Test that a queued request gives up after max_wait."""
+    controller = AdmissionController(capacity=100, max_queue=4, max_wait=0.05)
+    with controller.admit(100):
+        with pytest.raises(AdmissionRejected):
+            with controller.admit(50):
+                pass
+    assert controller.queue_depth() == 0
+
+
+def test_queued_request_runs_after_release():
+    """Test that a waiting request is admitted once memory is released."""
+    controller = AdmissionController(capacity=100, max_queue=4, max_wait=5)
+    admitted = threading.Event()
+    holding = controller.admit(80)
+    holding.__enter__()
+
+    def waiter():
+        with controller.admit(50):
+            admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    while controller.queue_depth() == 0:
+        pass
+    assert not admitted.is_set()
+    holding.__exit__(None, None, None)
+    thread.join(5)
+    assert admitted.is_set()
@@ -0,0 +1,124 @@
+import json
+import os
+import subprocess
+import sys
+import wave
+import numpy as np
+import pytest
+from unittest.mock import patch
+from batch.jobs import discover_inputs, format_summary, summarize, transcribe_file
+
+NOTE_EVENTS = [(0.5, 1.0, 60, 0.5, None), (1.0, 1.5, 64, 0.75, [0, 1])]
+
+
+def _write_wav(path, seconds=2.0, sample_rate=44100):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.zeros(int(seconds * sample_rate) * 2, dtype="<i2").tobytes())
+    return path
+
+
+@pytest.fixture
+def pipeline():
+    def decode(input_path, output_path):
+        return _write_wav(output_path)
+
+    with patch("batch.jobs.decode_to_wav", side_effect=decode) as mock_decode, \
+            patch("batch.jobs.predict_note_events", return_value=NOTE_EVENTS) as mock_predict:
+        yield mock_decode, mock_predict
+
+
+def test_discover_inputs_from_directory(tmp_path):
+    """Test that audio files are found recursively and named by relative path."""
+    (tmp_path / "album").mkdir()
+    for name in ("b.mp3", "album/a.wav", "album/stream.m3u8", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    jobs = discover_inputs(str(tmp_path))
+    assert [job["id"] for job in jobs] == ["b", "album/a", "album/stream"]
+
+
+def test_discover_inputs_keeps_ids_unique(tmp_path):
+    """Test that inputs differing only by extension don't share outputs, and unsafe ids are rejected."""
+    for name in ("song.mp3", "song.wav", "other.wav"):
+        (tmp_path / name).write_bytes(b"")
+    assert sorted(job["id"] for job in discover_inputs(str(tmp_path))) == ["other", "song.mp3", "song.wav"]
+
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("a/take.wav\nb/take.wav\n")
+    assert [job["id"] for job in discover_inputs(str(manifest))] == ["take.wav", "take.wav-2"]
+    # A numeric suffix skips ids that other inputs already use
+    manifest.write_text("one\ta\ntwo\ta\nthree\ta-2\n")
+    assert [job["id"] for job in discover_inputs(str(manifest))] == ["a", "a-3", "a-2"]
+
+    for job_id in ("../escape", "/abs/out", "a/../../b"):
+        manifest.write_text(f"song.wav\t{job_id}\n")
+        with pytest.raises(ValueError):
+            discover_inputs(str(manifest))
+
+
+def test_discover_inputs_from_manifest(tmp_path):
+    """Test manifest lines with paths, ids, URLs and JSON entries."""
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(
+        "# corpus\n"
+        "songs/one.flac\n"
+        "songs/two.wav\tsecond\n"
+        "https://example.com/track/master.m3u8\n"
+        '{"input": "/abs/three.mp3", "id": "third"}\n'
+    )
+    jobs = discover_inputs(str(manifest))
+    assert jobs[0] == {"id": "one", "input": str(tmp_path / "songs/one.flac")}
+    assert jobs[1]["id"] == "second"
+    assert jobs[2]["id"].startswith("url_") and jobs[2]["input"].startswith("https://")
+    assert jobs[3] == {"id": "third", "input": "/abs/three.mp3"}
+
+
+def test_transcribe_file_writes_outputs(tmp_path, pipeline):
+    """Test that MIDI and notes are written and existing outputs are skipped."""
+    job = {"id": "album/a", "input": str(tmp_path / "a.mp3")}
+    result = transcribe_file(job, str(tmp_path / "out"))
+
+    assert result["status"] == "done"
+    assert result["audioSeconds"] == pytest.approx(2.0)
+    assert result["notes"] == 2
+    with open(tmp_path / "out/album/a.mid", "rb") as f:
+        assert f.read(4) == b"MThd"
+    with open(tmp_path / "out/album/a.notes.json") as f:
+        assert json.load(f)["notes"][1]["pitchBends"] == [0, 1]
+
+    assert transcribe_file(job, str(tmp_path / "out"))["status"] == "skipped"
+    assert pipeline[1].call_count == 1
+
+
+def test_transcribe_file_reports_failures(tmp_path, pipeline):
+    """Test that a failing input is reported rather than raised."""
+    pipeline[0].side_effect = Exception("FFmpeg decoding failed")
+    result = transcribe_file({"id": "bad", "input": "bad.mp3"}, str(tmp_path), formats=("midi",))
+    assert result["status"] == "failed"
+    assert "FFmpeg" in result["error"]
+
+
+def test_summarize_throughput():
+    """Test files/s and audio-seconds/s over the wall time."""
+    results = [
+        {"status": "done", "audioSeconds": 60.0, "seconds": 10.0},
+        {"status": "done", "audioSeconds": 120.0, "seconds": 20.0},
+        {"status": "failed", "audioSeconds": 0.0, "seconds": 1.0},
+        {"status": "skipped", "audioSeconds": 0.0, "seconds": 0.0}
+    ]
+    summary = summarize(results, wall_seconds=15.0, workers=2)
+    assert summary["filesPerSecond"] == pytest.approx(2 / 15)
+    assert summary["audioSecondsPerSecond"] == pytest.approx(12.0)
+    assert summary["realtimeFactorPerWorker"] == pytest.approx(6.0)
+    assert (summary["failed"], summary["skipped"]) == (1, 1)
+    assert "audio-seconds/s" in format_summary(summary)
+
+
+def test_batch_does_not_import_firebase():
+    """Test that the CLI only depends on the Firebase-free audio package."""
+    code = "import sys, batch.__main__; sys.exit(any(m == 'spec' or m.startswith(('spec.', 'firebase')) for m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            capture_output=True, timeout=300)
+    assert result.returncode == 0, result.stderr.decode()[-2000:]
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from unittest.mock import Mock, patch
+from audio.fingerprint import FRAMES_PER_SECOND, bit_error_rate, compute_fingerprint
+from loadtest.fakes import FakeBucket, FakeFirestore
+from spec.audio_track_ingest import _link_stems
+from spec.fingerprint_index import find_match, store_fingerprint
+
+SAMPLE_RATE = 22050
+
+
+def _melody(seconds, seed=0):
+    """Random sequence of short harmonic tones, as int16 mono."""
+    rng = np.random.default_rng(seed)
+    out = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    note_len = SAMPLE_RATE // 4
+    t = np.arange(note_len) / SAMPLE_RATE
+    envelope = np.exp(-3 * t)
+    for start in range(0, len(out) - note_len, note_len):
+        frequency = 110 * 2 ** (rng.integers(0, 36) / 12)
+        tone = sum(np.sin(2 * np.pi * frequency * h * t) / h for h in (1, 2, 3))
+        out[start:start + note_len] += tone * envelope
+    return (out / np.abs(out).max() * 20000).astype(np.int16)
+
+
+@pytest.fixture(scope="module")
+def reference():
+    samples = _melody(40)
+    return samples, compute_fingerprint(samples, SAMPLE_RATE)
+
+
+def _index_postings(track_path, landmarks):
+    postings = {}
+    for landmark, frame in landmarks:
+        postings.setdefault(landmark, []).append(f"{track_path}@{frame}")
+    return postings
+
+
+def _mock_db(postings):
+    db = Mock()
+    db.collection.return_value.document.side_effect = lambda doc_id: doc_id
+
+    def get_all(refs):
+        return [
+            Mock(exists=int(ref) in postings, id=ref,
+                 **{"to_dict.return_value": {"postings": postings.get(int(ref), [])}})
+            for ref in refs
+        ]
+    db.get_all.side_effect = get_all
+    return db
+
+
+def test_clip_of_track_has_low_bit_error_rate(reference):
+    """Test that a noisy clip lines up with the track it was cut from."""
+    samples, (ref_bits, _) = reference
+    clip = samples[10 * SAMPLE_RATE:30 * SAMPLE_RATE].astype(np.float32)
+    clip += np.random.default_rng(1).normal(0, 300, len(clip))
+    clip_bits, _ = compute_fingerprint(clip.astype(np.int16), SAMPLE_RATE)
+
+    offset = int(round(10 * FRAMES_PER_SECOND))
+    ber, overlap = bit_error_rate(clip_bits, ref_bits, offset)
+    unrelated, _ = bit_error_rate(compute_fingerprint(_melody(20, seed=7), SAMPLE_RATE)[0], ref_bits, 0)
+
+    assert overlap == len(clip_bits)
+    assert ber < 0.2
+    assert unrelated > 0.4
+
+
+def test_find_match_reports_offset_and_coverage(reference):
+    """Test that a clip is matched to the indexed track at the right offset."""
+    samples, (ref_bits, ref_landmarks) = reference
+    clip_bits, clip_landmarks = compute_fingerprint(samples[12 * SAMPLE_RATE + 37:32 * SAMPLE_RATE], SAMPLE_RATE)
+
+    mock_bucket = Mock()
+    mock_bucket.blob.return_value.download_as_bytes.return_value = ref_bits.astype("<u4").tobytes()
+    with patch("spec.fingerprint_index.db", _mock_db(_index_postings("v1/original", ref_landmarks))), \
+         patch("spec.fingerprint_index.bucket", mock_bucket):
+        match = find_match("v2", "original", clip_bits, clip_landmarks)
+
+    assert (match["videoId"], match["trackId"]) == ("v1", "original")
+    assert match["offsetSeconds"] == pytest.approx(12.0, abs=0.05)
+    assert match["coverage"] > 0.95
+    assert match["matchCoverage"] == pytest.approx(0.5, abs=0.05)
+    mock_bucket.blob.assert_called_with("fingerprints/v1/original.fp")
+
+
+def test_find_match_ignores_unrelated_audio(reference):
+    """Test that different audio and the track's own postings don't match."""
+    _, (ref_bits, ref_landmarks) = reference
+    other_bits, other_landmarks = compute_fingerprint(_melody(20, seed=3), SAMPLE_RATE)
+    postings = _index_postings("v1/original", ref_landmarks)
+    for landmark, entries in _index_postings("v2/original", other_landmarks).items():
+        postings.setdefault(landmark, []).extend(entries)
+
+    with patch("spec.fingerprint_index.db", _mock_db(postings)), \
+         patch("spec.fingerprint_index.bucket"):
+        assert find_match("v2", "original", other_bits, other_landmarks) is None
+
+
+def test_store_fingerprint_caps_postings_per_hash():
+    """Test that a hash stops taking postings once its document is full."""
+    db = FakeFirestore()
+    landmarks = [(7, 0), (7, 10), (9, 5)]
+    with patch("spec.postings.db", db), \
+         patch("spec.fingerprint_index.bucket", FakeBucket()), \
+         patch("spec.fingerprint_index.MAX_POSTINGS_PER_HASH", 3):
+        store_fingerprint("v1", "original", np.zeros(4, dtype=np.uint32), landmarks)
+        fingerprint = store_fingerprint("v2", "original", np.zeros(4, dtype=np.uint32), landmarks)
+
+    common = db.collection("audioFingerprintIndex").document("7").get().to_dict()
+    assert common["postings"] == ["v1/original@0", "v1/original@10", "v2/original@0"]
+    assert len(db.collection("audioFingerprintIndex").document("9").get().to_dict()["postings"]) == 2
+    assert fingerprint["fullHashes"] == 1
+
+
+def test_link_stems_skips_preview_stems():
+    """Test that a duplicate upload links full-quality stems but not a match's previews."""
+    db = FakeFirestore()
+    tracks = db.collection("videos").document("v1").collection("audioTracks")
+    tracks.document("original").set({"type": "original"})
+    tracks.document("vocals").set({"type": "vocals", "metadata": {"quality": "full"}})
+    tracks.document("drums").set({"type": "drums", "metadata": {"quality": "preview"}})
+    match = {"videoId": "v1", "trackId": "original", "offsetSeconds": 0.0}
+
+    with patch("spec.audio_track_ingest.db", db):
+        linked = _link_stems("v2", match)
+
+    assert linked == ["vocals"]
+    copied = db.collection("videos").document("v2").collection("audioTracks")
+    assert copied.document("vocals").get().to_dict()["linkedFrom"] == "v1/vocals"
+    assert not copied.document("drums").get().exists
+    assert db.collection("videos").document("v2").get().to_dict()["audioDedupe"]["linkedStems"] == ["vocals"]
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from audio.gating import (
+    REGION_GAP_SECONDS,
+    REGION_PADDING_SECONDS,
+    active_regions,
+    join_regions,
+    restore_note_times
+)
+
+SAMPLE_RATE = 22050
+
+
+def _sparse_signal():
+    """10 s of silence with tones at 2-3 s and 7-8 s."""
+    samples = np.zeros(10 * SAMPLE_RATE, dtype=np.int16)
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    tone = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+    samples[2 * SAMPLE_RATE:3 * SAMPLE_RATE] = tone
+    samples[7 * SAMPLE_RATE:8 * SAMPLE_RATE] = tone
+    return samples
+
+
+def test_active_regions_are_padded():
+    """Test that only the tones (plus padding) are kept."""
+    regions = active_regions(_sparse_signal(), SAMPLE_RATE)
+    pad = REGION_PADDING_SECONDS
+    assert [(s / SAMPLE_RATE, e / SAMPLE_RATE) for s, e in regions] == [
+        pytest.approx((2 - pad, 3 + pad), abs=0.06),
+        pytest.approx((7 - pad, 8 + pad), abs=0.06)
+    ]
+
+
+def test_active_regions_merge_short_gaps_and_handle_silence():
+    """Test that short pauses don't split a region, and silence yields nothing."""
+    samples = _sparse_signal()
+    samples[3 * SAMPLE_RATE + SAMPLE_RATE // 2:4 * SAMPLE_RATE] = samples[2 * SAMPLE_RATE:2 * SAMPLE_RATE + SAMPLE_RATE // 2]
+    assert len(active_regions(samples, SAMPLE_RATE)) == 2
+    assert active_regions(np.zeros(SAMPLE_RATE, dtype=np.int16), SAMPLE_RATE) == []
+    assert active_regions(np.zeros(0, dtype=np.int16), SAMPLE_RATE) == []
+
+
+def test_join_and_restore_round_trip():
+    """Test that note times in the joined audio map back to the original timeline."""
+    samples = _sparse_signal()
+    regions = active_regions(samples, SAMPLE_RATE)
+    joined, segments = join_regions(samples, SAMPLE_RATE, regions)
+    assert len(joined) == sum(e - s for s, e in regions) + int(REGION_GAP_SECONDS * SAMPLE_RATE)
+
+    second = segments[1][0]
+    notes = [
+        (0.6, 1.2, 60, 0.5, None),
+        (second + 0.6, second + 10.0, 64, 0.8, [0, 1, 2, 3]),
+        (segments[0][2] + 0.1, segments[0][2] + 0.2, 70, 0.5, None)  # inside the gap
+    ]
+    restored = restore_note_times(notes, segments)
+
+    assert [note[2] for note in restored] == [60, 64]
+    assert restored[0][0] == pytest.approx(regions[0][0] / SAMPLE_RATE + 0.6)
+    assert restored[1][0] == pytest.approx(regions[1][0] / SAMPLE_RATE + 0.6)
+    assert restored[1][1] == pytest.approx(regions[1][1] / SAMPLE_RATE)
+    assert len(restored[1][4]) < 4
@@ -1,5 +1,6 @@
 import json
 import pytest
+from unittest.mock import patch
 from firebase_functions import https_fn
 from spec.health_check import health_check
 
@@ -33,3 +34,30 @@ def test_basic_function_call(mock_request):
     response = health_check(mock_request)
     assert response.status_code == 200  # Assert instead of returning
     assert response.headers.get('Content-Type') == 'application/json'
+
+def test_health_check_default_ignores_deep_state(mock_request):
+    """Test that the default health check doesn't collect instance state."""
+    mock_request.args = {}
+    with patch('spec.health_check.deep_status') as mock_deep:
+        response = health_check(mock_request)
+    assert set(json.loads(response.data).keys()) == {'status', 'message', 'timestamp'}
+    mock_deep.assert_not_called()
+
+def test_health_check_deep(mock_request):
+    """Test that ?deep=1 reports model, cache, request and resource state."""
+    mock_request.args = {'deep': '1'}
+    response = health_check(mock_request)
+    response_data = json.loads(response.data)
+    deep = response_data['deep']
+
+    assert response.status_code == 200
+    assert response_data['status'] == 'success'
+    assert deep['model']['loaded'] in (True, False)
+    assert {'tracks', 'trackLists', 'noteStores'} <= set(deep['caches'])
+    assert 'hitRatio' in deep['caches']['tracks']
+    assert deep['requests']['transcriptions']['admission']['queueDepth'] == 0
+    assert deep['requests']['mixes']['inFlight'] == 0
+    assert deep['memory']['rssBytes'] > 0
+    assert deep['tmp']['totalBytes'] > 0
+    assert deep['startup']['uptimeSeconds'] >= 0
+    assert 'transcribe' in deep['startup']['phases']
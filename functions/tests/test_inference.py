@@ -0,0 +1,90 @@
+import threading
+import time
+import numpy as np
+import pytest
+from basic_pitch.constants import AUDIO_N_SAMPLES
+from basic_pitch.inference import window_audio_file
+from audio.inference import HOP_SAMPLES, OUTPUT_SHAPES, OVERLAP_SAMPLES, InferenceClient, serve, window_audio
+
+
+class WindowSumModel:
+    """Stands in for the basic-pitch model: each output is filled with its window's sum."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, windows):
+        self.batch_sizes.append(len(windows))
+        sums = windows.sum(axis=(1, 2)).astype(np.float32)
+        return {
+            name: np.broadcast_to(sums[:, None, None], (len(windows), *shape)).copy()
+            for name, shape in OUTPUT_SHAPES.items()
+        }
+
+
+@pytest.fixture
+def server(tmp_path):
+    model = WindowSumModel()
+    address = str(tmp_path / "inference.sock")
+    authkey = b"test-key"
+    threading.Thread(target=serve, args=(address, authkey, 4, 0.2, model), daemon=True).start()
+    deadline = time.monotonic() + 5
+    while not (tmp_path / "inference.sock").exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return InferenceClient(address, authkey), model
+
+
+def test_window_audio_matches_basic_pitch():
+    """Test that windows match basic-pitch's own padding and windowing."""
+    audio = np.random.default_rng(0).standard_normal(3 * AUDIO_N_SAMPLES + 123).astype(np.float32)
+    padded = np.concatenate([np.zeros(OVERLAP_SAMPLES // 2, dtype=np.float32), audio])
+    expected = np.stack([window for window, _ in window_audio_file(padded, HOP_SAMPLES)])
+    windows = window_audio(audio)
+    assert windows.shape == expected.shape
+    assert windows.dtype == np.float32
+    np.testing.assert_array_equal(windows, expected)
+
+
+def test_server_returns_outputs_for_each_window(server):
+    """Test that outputs come back through shared memory in window order."""
+    client, model = server
+    windows = np.zeros((6, AUDIO_N_SAMPLES, 1), dtype=np.float32)
+    windows[:, 0, 0] = np.arange(6)
+    outputs = client.predict(windows)
+    assert set(outputs) == set(OUTPUT_SHAPES)
+    for name, shape in OUTPUT_SHAPES.items():
+        assert outputs[name].shape == (6, *shape)
+        np.testing.assert_array_equal(outputs[name][:, 0, 0], np.arange(6))
+    # Larger requests are split into batches of at most max_batch_windows
+    assert model.batch_sizes == [4, 2]
+
+
+def test_server_batches_concurrent_requests(server):
+    """Test that windows from concurrent clients go through the model together."""
+    client, model = server
+    results = {}
+
+    def request(value):
+        windows = np.full((1, AUDIO_N_SAMPLES, 1), value, dtype=np.float32)
+        results[value] = client.predict(windows)["note"][0, 0, 0]
+
+    threads = [threading.Thread(target=request, args=(value,)) for value in (1.0, 2.0)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {1.0: AUDIO_N_SAMPLES, 2.0: 2 * AUDIO_N_SAMPLES}
+    assert model.batch_sizes == [2]
+    stats = client.stats()
+    assert stats["requests"] == 2
+    assert stats["batches"] == 1
+    assert stats["maxBatchRequests"] == 2
+
+
+def test_server_reports_model_errors(server):
+    """Test that a failing batch raises in the client instead of hanging it."""
+    client, model = server
+    model.predict = lambda windows: (_ for _ in ()).throw(ValueError("bad input"))
+    with pytest.raises(RuntimeError, match="bad input"):
+        client.predict(np.zeros((1, AUDIO_N_SAMPLES, 1), dtype=np.float32))
@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import Mock, patch
+from loadtest.fakes import FakeBucket, FakeFirestore
+from loadtest.report import parse_mix, percentile, summarize
+from spec.single_flight import run_with_lease
+
+
+def test_parse_mix():
+    """Test request mix parsing and validation."""
+    assert parse_mix("cached=4, health=1") == {"cached": 4.0, "health": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("cached")
+    with pytest.raises(ValueError):
+        parse_mix("cached=0")
+
+
+def test_percentile_and_summary():
+    """Test nearest-rank percentiles, error accounting and RSS peaks."""
+    assert percentile([], 50) is None
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile([3, 1, 2], 50) == 2
+
+    results = [
+        {"kind": "cached", "status": 200, "latency": 0.1},
+        {"kind": "cached", "status": 429, "latency": 0.2},
+        {"kind": "short", "status": 500, "latency": 1.0},
+        {"kind": "short", "status": None, "latency": 2.0}
+    ]
+    summary = summarize(results, 2.0, [(0.0, {1: 100}), (0.5, {1: 300, 2: 50})])
+
+    assert summary["throughput"] == 2.0
+    assert summary["kinds"]["cached"]["errors"] == 0
+    assert summary["kinds"]["cached"]["rejected"] == 1
+    assert summary["kinds"]["short"]["errorRate"] == 1.0
+    assert summary["rss"]["peakBytes"] == {"1": 300, "2": 50}
+
+
+def test_fakes_support_leases_and_batches():
+    """Test that the fake Firestore runs transactional code and batched writes unchanged."""
+    db, bucket = FakeFirestore(), FakeBucket()
+    compute = Mock(return_value=(b"MThd", 10.0))
+    with patch("spec.single_flight.db", db), patch("spec.single_flight.bucket", bucket):
+        assert run_with_lease("v/t:0:10000", compute) == (b"MThd", 10.0)
+        assert run_with_lease("v/t:0:10000", compute) == (b"MThd", 10.0)
+    compute.assert_called_once()
+
+    tracks = db.collection("videos").document("v").collection("audioTracks")
+    batch = db.batch()
+    batch.set(tracks.document("a"), {"type": "vocals"})
+    batch.set(tracks.document("b"), {"type": "bass"})
+    batch.commit()
+    tracks.document("a").update({"status": "done"})
+    assert [doc.id for doc in tracks.stream()] == ["a", "b"]
+    assert db.get_all([tracks.document("a")])[0].to_dict() == {"type": "vocals", "status": "done"}
+    assert not tracks.document("c").get().exists
@@ -0,0 +1,108 @@
+import json
+import pytest
+from unittest.mock import Mock, patch
+from flask import Flask
+from firebase_functions import https_fn
+from audio.melody import interval_ngrams, melody_contour, note_name_to_pitch
+from loadtest.fakes import FakeFirestore
+from spec.melody_index import index_melody, search_melody_index
+from spec.melody_search import search_melody
+
+# Ode to Joy, then Twinkle Twinkle, as (start, end, pitch, amplitude, bends) events
+ODE = [64, 64, 65, 67, 67, 65, 64, 62, 60, 60, 62, 64, 64, 62, 62]
+TWINKLE = [60, 60, 67, 67, 69, 69, 67, 65, 65, 64, 64, 62, 62, 60]
+
+
+def _events(pitches, start=0.0, step=0.5):
+    return [(start + i * step, start + i * step + 0.4, pitch, 0.8, None) for i, pitch in enumerate(pitches)]
+
+
+@pytest.fixture
+def fake_db():
+    db = FakeFirestore()
+    with patch("spec.melody_index.db", db), patch("spec.postings.db", db):
+        yield db
+
+
+def test_melody_contour_takes_top_voice_and_merges_repeats():
+    """Test that chords reduce to their top note and repeated notes merge."""
+    events = [
+        (0.0, 0.5, 48, 0.5, None), (0.01, 0.5, 64, 0.5, None),
+        (0.5, 1.0, 64, 0.5, None),
+        (1.0, 1.02, 90, 0.5, None),
+        (1.0, 1.5, 67, 0.5, None)
+    ]
+    assert melody_contour(events) == [(0.0, 64), (1.0, 67)]
+
+
+def test_interval_ngrams_are_transposition_invariant():
+    """Test that a transposed melody produces the same n-grams."""
+    contour = melody_contour(_events(ODE))
+    transposed = melody_contour(_events([p + 5 for p in ODE]))
+    assert [key for key, _, _ in interval_ngrams(contour)] == [key for key, _, _ in interval_ngrams(transposed)]
+    assert interval_ngrams(contour)[0][0] == "1,2,-2"
+    assert note_name_to_pitch("C4") == 60 and note_name_to_pitch("Bb3") == 58
+
+
+def test_search_finds_melody_in_any_key(fake_db):
+    """Test that a transposed fragment finds the right video and timestamp."""
+    index_melody("ode", "vocals", _events(TWINKLE) + _events(ODE, start=30.0))
+    index_melody("twinkle", "original", _events(TWINKLE))
+
+    query = melody_contour(_events([p - 3 for p in ODE[5:13]]))
+    results = search_melody_index(query)
+
+    assert results[0]["videoId"] == "ode"
+    assert results[0]["trackId"] == "vocals"
+    assert results[0]["timestamp"] == pytest.approx(30.0 + 5 * 0.5)
+    assert results[0]["score"] == 1.0
+    assert all(result["videoId"] != "twinkle" for result in results)
+
+
+def test_index_caps_postings_per_ngram(fake_db):
+    """Test that an n-gram's document stops growing once full, while other n-grams still index."""
+    with patch("spec.melody_index.MAX_POSTINGS_PER_NGRAM", 2):
+        for video_id in ("a", "b", "c"):
+            index_melody(video_id, "original", _events(TWINKLE))
+        info = index_melody("ode", "original", _events(ODE))
+
+    key = interval_ngrams(melody_contour(_events(TWINKLE)))[0][0]
+    document = fake_db.collection("melodyIndex").document(key).get().to_dict()
+    assert len(document["postings"]) == 2
+    assert {posting.split("/")[0] for posting in document["postings"]} == {"a", "b"}
+    assert search_melody_index(melody_contour(_events(ODE)))[0]["videoId"] == "ode"
+    assert info["ngrams"] > 0
+
+
+def test_reindexing_a_track_does_not_fill_its_ngrams(fake_db):
+    """Test that indexing the same track again leaves room for other tracks."""
+    with patch("spec.melody_index.MAX_POSTINGS_PER_NGRAM", 2):
+        for _ in range(3):
+            index_melody("a", "original", _events(ODE))
+        info = index_melody("b", "original", _events(ODE))
+
+    key = interval_ngrams(melody_contour(_events(ODE)))[0][0]
+    document = fake_db.collection("melodyIndex").document(key).get().to_dict()
+    assert {posting.split("/")[0] for posting in document["postings"]} == {"a", "b"}
+    assert info["fullNgrams"] == 0
+
+
+def test_search_melody_endpoint(fake_db):
+    """Test the HTTP endpoint with a typed melody and with a missing one."""
+    index_melody("twinkle", "original", _events(TWINKLE))
+    app = Flask(__name__)
+    with app.test_request_context():
+        request = Mock(spec=https_fn.Request)
+        request.get_json.return_value = {"pitches": "D4 D4 A4 A4 B4 B4 A4 G4"}
+        response = search_melody(request)
+        data = json.loads(response.get_data())
+        assert response.status_code == 200
+        assert data["results"][0]["videoId"] == "twinkle"
+        assert data["query"]["pitches"] == [62, 69, 71, 69, 67]
+
+        request.get_json.return_value = {"limit": 3}
+        assert search_melody(request).status_code == 400
+        request.get_json.return_value = {"pitches": ["H4"]}
+        assert search_melody(request).status_code == 400
+        request.get_json.return_value = {"pitches": [60, 62] * 40}
+        assert search_melody(request).status_code == 400
@@ -0,0 +1,49 @@
+import io
+import mido
+import numpy as np
+import pytest
+from basic_pitch.note_creation import note_events_to_midi
+from audio.midi import note_events_to_midi_bytes
+
+
+def _pretty_midi_bytes(note_events):
+    buffer = io.BytesIO()
+    note_events_to_midi(note_events).write(buffer)
+    return buffer.getvalue()
+
+
+def _random_note_events(rng, count, duration):
+    note_events = []
+    for _ in range(count):
+        start = float(np.round(rng.uniform(0, duration), 3))
+        bends = None if rng.random() < 0.3 else rng.integers(-20, 20, int(rng.integers(0, 8))).tolist()
+        note_events.append((start, start + float(np.round(rng.uniform(0, 2), 3)),
+                            int(rng.integers(21, 109)), float(rng.random()), bends))
+    return note_events
+
+
+@pytest.mark.parametrize("duration", [5.0, 60.0, 3600.0])
+def test_matches_basic_pitch_midi(duration):
+    """Test that the encoder writes the same file as basic-pitch and pretty_midi, overlaps and bends included."""
+    rng = np.random.default_rng(int(duration))
+    for _ in range(20):
+        note_events = _random_note_events(rng, int(rng.integers(1, 80)), duration)
+        assert note_events_to_midi_bytes(note_events) == _pretty_midi_bytes(note_events)
+
+
+def test_empty_and_overlapping_notes():
+    """Test the file without notes, and that overlapping notes lose their pitch bends."""
+    assert note_events_to_midi_bytes([]) == _pretty_midi_bytes([])
+    overlapping = [(0.0, 1.0, 60, 0.5, [0, 3, 6]), (0.5, 1.5, 64, 0.5, [1, 2]), (2.0, 2.5, 67, 1.0, [-3, 0])]
+    encoded = note_events_to_midi_bytes(overlapping)
+    assert encoded == _pretty_midi_bytes(overlapping)
+    # Only the last note's two bends are written
+    messages = mido.MidiFile(file=io.BytesIO(encoded)).tracks[1]
+    assert [message.pitch for message in messages if message.type == "pitchwheel"] == [-4096, 0]
+
+
+def test_time_offset_retimes_notes():
+    """Test that time_offset encodes a range as if its notes had been re-timed first."""
+    note_events = [(10.25, 11.0, 60, 0.5, [0, 1]), (12.0, 12.5, 62, 0.75, None)]
+    retimed = [(start - 10.0, end - 10.0, *rest) for start, end, *rest in note_events]
+    assert note_events_to_midi_bytes(note_events, time_offset=10.0) == _pretty_midi_bytes(retimed)
@@ -0,0 +1,140 @@
+import threading
+import time
+import numpy as np
+import pytest
+from unittest.mock import Mock, patch
+from audio.midi import note_events_to_midi_bytes
+from audio.note_store import NoteStore, encode_note_store
+from spec import note_cache
+from spec.note_cache import store_transcription, load_note_range, load_note_range_midi
+
+
+@pytest.fixture
+def note_events():
+    return [
+        (0.5, 1.0, 60, 0.5, None),
+        (29.0, 32.0, 62, 0.8, [0, 1, 2, 3]),
+        (45.0, 46.0, 64, 0.6, None),
+        (95.0, 96.5, 65, 0.7, None),
+    ]
+
+
+@pytest.fixture
+def fake_bucket():
+    """Bucket mock that keeps uploaded blobs in a dict."""
+    blobs = {}
+
+    def make_blob(path):
+        blob = Mock()
+        blob.upload_from_string.side_effect = lambda data, content_type=None: blobs.__setitem__(path, data)
+        blob.download_as_bytes.side_effect = lambda: blobs[path] if isinstance(blobs[path], bytes) \
+            else blobs[path].encode("utf-8")
+        return blob
+
+    mock_bucket = Mock()
+    mock_bucket.blob.side_effect = make_blob
+    mock_bucket.blobs = blobs
+    return mock_bucket
+
+
+@pytest.fixture
+def warm_cache(tmp_path):
+    with patch("spec.note_cache.NOTE_STORE_DIR", str(tmp_path)), \
+            patch.dict(note_cache._stores, clear=True):
+        yield tmp_path
+
+
+def test_note_store_slice_clips_and_retimes(note_events):
+    """Test that sliced notes are relative to the range start and clipped."""
+    sliced = NoteStore(encode_note_store(note_events)).slice(30.0, 50.0)
+
+    assert [note[2] for note in sliced] == [62, 64]
+    start, end, _, _, bends = sliced[0]
+    assert (start, end) == (0.0, pytest.approx(2.0))
+    assert bends == [1, 2, 3]
+    assert sliced[1][:2] == (15.0, 16.0)
+
+
+def test_note_store_finds_long_notes_before_range():
+    """Test that a note starting long before the range but still sounding is found."""
+    note_events = [(0.0, 100.0, 40, 0.5, None)] + [(t, t + 0.1, 70, 0.5, None) for t in range(1, 90)]
+    store = NoteStore(encode_note_store(note_events))
+
+    assert store.range_indices(50.2, 50.5).tolist() == [0]
+    assert [n[2] for n in store.slice(50.0, 50.5)] == [40, 70]
+    assert store.slice(100.0, 110.0) == []
+    assert len(NoteStore(encode_note_store([])).slice(0, 10)) == 0
+
+
+def test_note_store_range_query_is_fast():
+    """Test that a range query on a large store doesn't scan every note."""
+    rng = np.random.default_rng(0)
+    starts = np.sort(rng.uniform(0, 3600, 100000))
+    note_events = [(float(s), float(s) + 0.3, 60, 0.5, [0, 1] if i % 7 == 0 else None)
+                   for i, s in enumerate(starts)]
+    store = NoteStore(encode_note_store(note_events))
+
+    started = time.perf_counter()
+    for _ in range(100):
+        sliced = store.slice(1800.0, 1810.0)
+    assert (time.perf_counter() - started) / 100 < 0.005
+    assert len(sliced) == np.count_nonzero((starts < 1810.0) & (starts + 0.3 > 1800.0))
+
+
+def test_note_store_midi_matches_sliced_notes():
+    """Test that a range encoded from the note table is the MIDI file of its sliced notes."""
+    rng = np.random.default_rng(1)
+    starts = np.sort(rng.uniform(0, 600, 2000))
+    note_events = [(float(s), float(s) + float(rng.uniform(0.05, 3)), int(rng.integers(30, 90)),
+                    float(rng.random()), rng.integers(-6, 6, 5).tolist() if i % 3 else None)
+                   for i, s in enumerate(starts)]
+    store = NoteStore(encode_note_store(note_events))
+
+    for start_time, end_time in [(0.0, 600.0), (100.3, 130.7), (599.0, 610.0), (700.0, 710.0)]:
+        assert store.midi(start_time, end_time) == note_events_to_midi_bytes(store.slice(start_time, end_time))
+
+
+def test_store_and_load_round_trip(note_events, fake_bucket, warm_cache):
+    """Test that a stored transcription can be read back for a range, from the warm cache after the first read."""
+    with patch("spec.note_cache.bucket", fake_bucket), patch("spec.storage_upload.bucket", fake_bucket):
+        transcription = store_transcription("video", "track", note_events, duration=100.0)
+        sliced = load_note_range(transcription, 90.0, 100.0)
+        again = load_note_range(transcription, 25.0, 35.0)
+        midi_data = load_note_range_midi(transcription, 90.0, 100.0)
+
+    assert transcription["status"] == "complete"
+    assert transcription["noteCount"] == 4
+    assert transcription["maxNoteDuration"] == pytest.approx(3.0)
+    assert list(fake_bucket.blobs) == [transcription["notesPath"]]
+    assert [note[2] for note in sliced] == [65]
+    assert sliced[0][:2] == (5.0, 6.5)
+    assert [note[2] for note in again] == [62]
+    assert midi_data == note_events_to_midi_bytes(sliced)
+    # Downloaded once, then memory-mapped from the local copy
+    assert [call.args for call in fake_bucket.blob.call_args_list].count((transcription["notesPath"],)) == 2
+    assert len(list(warm_cache.iterdir())) == 1
+
+
+def test_concurrent_opens_survive_eviction(note_events, fake_bucket, warm_cache):
+    """Test that stores evicted (and their files removed) by other threads still open."""
+    with patch("spec.note_cache.bucket", fake_bucket), patch("spec.storage_upload.bucket", fake_bucket), \
+            patch("spec.note_cache.NOTE_STORE_CACHE_ENTRIES", 1):
+        paths = [store_transcription("video", f"track{i}", note_events, duration=100.0)["notesPath"]
+                 for i in range(3)]
+        errors = []
+
+        def open_stores(offset):
+            try:
+                for i in range(60):
+                    assert len(note_cache.open_note_store(paths[(i + offset) % 3])) == 4
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_stores, args=(offset,)) for offset in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
+    assert len(list(warm_cache.iterdir())) == 1
@@ -0,0 +1,104 @@
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from spec.admission import AdmissionController
+from spec.prefetch import PrefetchCancelled, Prefetcher, adjacent_windows
+from spec.single_flight import SingleFlight
+
+
+@pytest.fixture
+def leases():
+    """run_with_lease without Firestore: completed keys serve their stored result."""
+    results = {}
+
+    def run_with_lease(key, compute, wait=True):
+        if key not in results:
+            results[key] = compute()
+        return results[key]
+
+    with patch("spec.prefetch.run_with_lease", side_effect=run_with_lease):
+        yield results
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_adjacent_windows():
+    """Test that the following windows keep the range length and stop at the track end."""
+    assert adjacent_windows(10.0, 20.0, count=2) == [(20.0, 30.0), (30.0, 40.0)]
+    assert adjacent_windows(50.0, 60.0, track_seconds=65.0, count=2) == [(60.0, 70.0)]
+    assert adjacent_windows(None, 20.0) == []
+    assert adjacent_windows(0.0, 300.0) == []
+
+
+def test_prefetch_result_serves_follow_up(leases):
+    """Test that a prefetched range is reused by the next request for it."""
+    inflight = SingleFlight()
+    prefetcher = Prefetcher(AdmissionController(capacity=100), inflight)
+
+    assert prefetcher.schedule("t:10000:20000", 10, 10, lambda cancelled: (b"midi", 10.0))
+    assert not prefetcher.schedule("t:10000:20000", 10, 10, lambda cancelled: (b"other", 10.0))
+    _wait_for(lambda: prefetcher.stats()["completed"] == 1)
+
+    assert leases["t:10000:20000"] == (b"midi", 10.0)
+    assert prefetcher.stats()["budgetLeftSeconds"] == pytest.approx(prefetcher.budget_seconds - 10)
+
+
+def test_real_request_cancels_prefetch(leases):
+    """Test that a request for another range cancels the running prefetch."""
+    prefetcher = Prefetcher(AdmissionController(capacity=100), SingleFlight())
+    started = threading.Event()
+
+    def compute(cancelled):
+        started.set()
+        while not cancelled():
+            time.sleep(0.01)
+        raise PrefetchCancelled("preempted")
+
+    prefetcher.schedule("t:10000:20000", 10, 10, compute)
+    assert started.wait(5)
+    prefetcher.preempt("t:50000:60000")
+    _wait_for(lambda: prefetcher.stats()["cancelled"] == 1)
+    assert "t:10000:20000" not in leases
+
+
+def test_request_for_same_range_keeps_prefetch(leases):
+    """Test that a request for the prefetched range waits for it instead of cancelling it."""
+    inflight = SingleFlight()
+    prefetcher = Prefetcher(AdmissionController(capacity=100), inflight)
+    release = threading.Event()
+
+    def compute(cancelled):
+        release.wait(5)
+        if cancelled():
+            raise PrefetchCancelled("preempted")
+        return b"midi", 10.0
+
+    prefetcher.schedule("t:10000:20000", 10, 10, compute)
+    _wait_for(lambda: prefetcher.stats()["running"] == "t:10000:20000")
+    prefetcher.preempt("t:10000:20000")
+    prefetcher.preempt("t:50000:60000")
+    release.set()
+    _wait_for(lambda: prefetcher.stats()["completed"] == 1)
+    assert leases["t:10000:20000"] == (b"midi", 10.0)
+
+
+def test_prefetch_only_uses_spare_capacity_and_budget(leases):
+    """Test that prefetches are skipped when the instance is busy or over budget."""
+    admission = AdmissionController(capacity=100)
+    prefetcher = Prefetcher(admission, SingleFlight(), budget_seconds=15)
+
+    with admission.admit(95):
+        prefetcher.schedule("t:0:10000", 10, 10, lambda cancelled: (b"midi", 10.0))
+        _wait_for(lambda: prefetcher.stats()["skippedBusy"] == 1)
+    assert "t:0:10000" not in leases
+
+    assert prefetcher.schedule("t:10000:20000", 10, 10, lambda cancelled: (b"midi", 10.0))
+    _wait_for(lambda: prefetcher.stats()["completed"] == 1)
+    assert not prefetcher.schedule("t:20000:30000", 10, 10, lambda cancelled: (b"midi", 10.0))
+    assert prefetcher.stats()["overBudget"] == 1
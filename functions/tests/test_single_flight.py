@@ -0,0 +1,136 @@
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+from spec.single_flight import (
+    SingleFlight,
+    _acquire_lease,
+    run_with_lease,
+    transcription_key,
+    transcription_result_path
+)
+
+
+def test_transcription_key_rounds_times():
+    """Test that keys ignore float noise and mark open-ended ranges."""
+    assert transcription_key("v/t", 1.0, 2.5) == transcription_key("v/t", 1.0000001, 2.4999999)
+    assert transcription_key("v/t") == "v/t:start:end"
+    assert transcription_result_path("v/t:1000:2500") == "transcriptions/v/t/ranges/1000_2500.mid"
+
+
+def test_transcription_key_follows_track_audio():
+    """Test that replacing a track's audio changes its key and result path."""
+    preview = transcription_key("v/t", 1.0, 2.5, "https://example.com/preview/master.m3u8")
+    full = transcription_key("v/t", 1.0, 2.5, "https://example.com/full/master.m3u8")
+
+    assert preview != full
+    assert transcription_result_path(preview) != transcription_result_path(full)
+    version = preview.split(":")[1]
+    assert transcription_result_path(preview) == f"transcriptions/v/t/ranges/{version}/1000_2500.mid"
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """Test that concurrent calls with the same key run the function once."""
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "midi"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("key", work)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    while flight.waiting() < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == "midi" for result, _ in results)
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_shares_errors():
+    """Test that waiters receive the leader's exception."""
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("key", Mock(side_effect=ValueError("boom")))
+    # The key is released after failure so later calls run again
+    assert flight.do("key", lambda: 1) == (1, False)
+
+
+def test_run_with_lease_leader_stores_result():
+    """Test that the lease holder computes and publishes the result."""
+    with patch("spec.single_flight._acquire_lease", return_value=(True, None)), \
+         patch("spec.single_flight.db") as mock_db, \
+         patch("spec.single_flight.bucket") as mock_bucket:
+        result = run_with_lease("v/t:0:1000", lambda: (b"midi", 1.0))
+
+    assert result == (b"midi", 1.0)
+    mock_bucket.blob.assert_called_with("transcriptions/v/t/ranges/0_1000.mid")
+    lease_ref = mock_db.collection.return_value.document.return_value
+    assert lease_ref.update.call_args[0][0]["status"] == "done"
+    assert lease_ref.update.call_args[0][0]["expiresAt"] > time.time()
+
+
+def test_run_with_lease_reuses_completed_result():
+    """Test that a finished lease is read back instead of recomputed."""
+    lease = {"status": "done", "resultPath": "transcriptions/v/t/ranges/0_1000.mid", "audioDuration": 1.0}
+    compute = Mock()
+    with patch("spec.single_flight._acquire_lease", return_value=(False, lease)), \
+         patch("spec.single_flight.db"), \
+         patch("spec.single_flight.bucket") as mock_bucket:
+        mock_bucket.blob.return_value.download_as_bytes.return_value = b"midi"
+        result = run_with_lease("v/t:0:1000", compute)
+
+    assert result == (b"midi", 1.0)
+    compute.assert_not_called()
+
+
+def test_run_with_lease_releases_on_failure():
+    """Test that a failed leader deletes its lease so others can take over."""
+    with patch("spec.single_flight._acquire_lease", return_value=(True, None)), \
+         patch("spec.single_flight.db") as mock_db, \
+         patch("spec.single_flight.bucket"):
+        with pytest.raises(RuntimeError):
+            run_with_lease("v/t:0:1000", Mock(side_effect=RuntimeError("boom")))
+
+    mock_db.collection.return_value.document.return_value.delete.assert_called_once()
+
+
+def test_run_with_lease_releases_when_storing_fails():
+    """Test that a leader whose upload fails deletes its lease."""
+    with patch("spec.single_flight._acquire_lease", return_value=(True, None)), \
+         patch("spec.single_flight.db") as mock_db, \
+         patch("spec.single_flight.bucket") as mock_bucket:
+        mock_bucket.blob.return_value.upload_from_string.side_effect = OSError("storage down")
+        with pytest.raises(OSError):
+            run_with_lease("v/t:0:1000", lambda: (b"midi", 1.0))
+
+    lease_ref = mock_db.collection.return_value.document.return_value
+    lease_ref.delete.assert_called_once()
+    lease_ref.update.assert_not_called()
+
+
+def test_expired_done_lease_is_recomputed():
+    """Test that a completed lease past its TTL is taken over again."""
+    lease_ref = Mock()
+    lease_ref.get.return_value.exists = True
+    lease_ref.get.return_value.to_dict.return_value = {
+        "status": "done", "resultPath": "r.mid", "expiresAt": time.time() - 1
+    }
+    transaction = Mock()
+
+    acquired, lease = _acquire_lease.to_wrap(transaction, lease_ref, "owner", "v/t:0:1000")
+
+    assert acquired
+    assert transaction.set.call_args[0][1]["status"] == "running"
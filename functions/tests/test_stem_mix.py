@@ -0,0 +1,161 @@
+import io
+import json
+import pytest
+import numpy as np
+from unittest.mock import Mock, patch
+from flask import Flask
+from flask_cors import CORS
+from firebase_functions import https_fn
+from audio.hls import (
+    build_media_playlist,
+    parse_master_playlist,
+    parse_media_playlist,
+    resolve_segment_path,
+    storage_path_from_url
+)
+from audio.mixing import mix_key, mix_segments, mix_streams, quantize_gains
+from loadtest.fakes import FakeFirestore
+from spec.stem_mix import mix_stems
+from spec.track_cache import invalidate_tracks
+
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    CORS(app)
+    with app.app_context():
+        with app.test_request_context():
+            yield
+
+
+@pytest.fixture
+def mock_request():
+    mock = Mock(spec=https_fn.Request)
+    mock.method = "POST"
+    mock.headers = {"Content-Type": "application/json"}
+    return mock
+
+
+def test_quantize_gains_shares_cache_keys():
+    """Test that nearby gains map to the same mix and muted stems are dropped."""
+    first = quantize_gains({"vocals": 0.98, "drums": 0.51, "bass": 0.01})
+    second = quantize_gains({"drums": 0.49, "vocals": 1.02, "other": 0})
+    assert first == second == {"drums": 0.5, "vocals": 1.0}
+    assert mix_key(first) == mix_key(second)
+    assert quantize_gains({"vocals": 10})["vocals"] == 2.0
+
+
+def test_mix_segments_sums_with_gains():
+    """Test vectorized summing, padding of short stems and clipping."""
+    vocals = np.full((4, 2), 0.5, dtype=np.float32)
+    drums = np.full((3, 2), 0.25, dtype=np.float32)
+    mixed = mix_segments([vocals, drums], [1.0, 2.0])
+    assert mixed.shape == (4, 2)
+    assert np.allclose(mixed[:3], 1.0)
+    assert np.allclose(mixed[3], 0.5)
+    assert np.allclose(mix_segments([vocals], [4.0]), 1.0)
+
+
+def test_mix_streams_mixes_continuously_in_blocks():
+    """Test that streamed stems are mixed across block boundaries and a short stem ends in silence."""
+    vocals = np.linspace(-0.5, 0.5, 20, dtype=np.float32).reshape(10, 2)
+    drums = np.full((7, 2), 0.25, dtype=np.float32)
+    output = io.BytesIO()
+    mix_streams([io.BytesIO(vocals.tobytes()), io.BytesIO(drums.tobytes())], [1.0, 2.0], output, block_samples=4)
+
+    mixed = np.frombuffer(output.getvalue(), dtype=np.float32).reshape(-1, 2)
+    assert mixed.shape == (10, 2)
+    assert np.allclose(mixed[:7], vocals[:7] + 0.5)
+    assert np.allclose(mixed[7:], vocals[7:])
+
+
+def test_playlist_round_trip():
+    """Test parsing master and media playlists and writing a media playlist."""
+    master = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=128000,CODECS=\"mp4a.40.2\"\nlow/playlist.m3u8\n" \
+             "#EXT-X-STREAM-INF:BANDWIDTH=256000\nhigh/playlist.m3u8\n"
+    assert parse_master_playlist(master) == [(128000, "low/playlist.m3u8"), (256000, "high/playlist.m3u8")]
+
+    playlist = build_media_playlist([(6.0, "segment_0.ts"), (4.5, "segment_1.ts")])
+    assert "#EXT-X-TARGETDURATION:6" in playlist
+    assert playlist.endswith("#EXT-X-ENDLIST\n")
+    assert parse_media_playlist(playlist) == [(6.0, "segment_0.ts"), (4.5, "segment_1.ts")]
+
+
+def test_storage_paths_from_urls():
+    """Test the Storage URL forms stored in audio track documents."""
+    path = "videos/u/v/audio/vocals/playlist.m3u8"
+    assert storage_path_from_url(f"gs://bucket/{path}") == path
+    assert storage_path_from_url(
+        "https://firebasestorage.googleapis.com/v0/b/bucket/o/videos%2Fu%2Fv%2Faudio%2Fvocals%2Fplaylist.m3u8?alt=media"
+    ) == path
+    assert storage_path_from_url(path) == path
+    assert resolve_segment_path(path, "../vocals/segment_1.ts") == "videos/u/v/audio/vocals/segment_1.ts"
+
+
+def test_mix_stems_returns_cached_mix(app_context, mock_request):
+    """Test that an existing rendition is returned without re-mixing."""
+    request = mock_request
+    request.get_json.return_value = {"videoId": "v", "gains": {"vocals": 1, "drums": 0.5}}
+
+    stem_docs = []
+    for stem in ("vocals", "drums"):
+        doc = Mock(exists=True, update_time=None)
+        doc.id = stem
+        doc.to_dict.return_value = {"type": stem, "masterPlaylistUrl": f"videos/v/{stem}/master.m3u8"}
+        stem_docs.append(doc)
+
+    mix_doc = Mock(exists=True)
+    mix_doc.to_dict.return_value = {"status": "complete", "playlistUrl": "https://example.com/mix.m3u8"}
+
+    with patch("spec.stem_mix.db") as mock_db, \
+         patch("spec.track_cache.db") as mock_cache_db, \
+         patch("spec.stem_mix.build_stem_mix") as mock_build:
+        mock_cache_db.collection.return_value.document.return_value \
+            .collection.return_value.stream.return_value = stem_docs
+        video_ref = mock_db.collection.return_value.document.return_value
+        video_ref.collection.return_value.document.return_value.get.return_value = mix_doc
+        response = mix_stems(request)
+
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert data["cached"] is True
+    assert data["gains"] == {"drums": 0.5, "vocals": 1.0}
+    assert data["playlistUrl"] == "https://example.com/mix.m3u8"
+    mock_build.assert_not_called()
+
+
+def test_mix_stems_rejects_unknown_stems(app_context, mock_request):
+    """Test that requesting a stem the video doesn't have returns 404."""
+    request = mock_request
+    request.get_json.return_value = {"videoId": "v", "gains": {"vocals": 1}}
+    with patch("spec.stem_mix.list_tracks", return_value={}):
+        response = mix_stems(request)
+    assert response.status_code == 404
+
+
+def test_mix_is_rendered_again_after_stem_upgrade(app_context, mock_request):
+    """Test that a mix cached while the stems were previews isn't served once they are full quality."""
+    db = FakeFirestore()
+    tracks = db.collection("videos").document("v").collection("audioTracks")
+    for stem in ("vocals", "drums"):
+        tracks.document(stem).set({"type": stem, "masterPlaylistUrl": f"videos/v/{stem}/preview/master.m3u8"})
+    mock_request.get_json.return_value = {"videoId": "v", "gains": {"vocals": 1, "drums": 0.5}}
+
+    invalidate_tracks("v")
+    with patch("spec.stem_mix.db", db), patch("spec.track_cache.db", db), \
+         patch("spec.stem_mix.bucket_name", return_value="bucket"), \
+         patch("spec.stem_mix.queue_lazy_separation", return_value=False), \
+         patch("spec.stem_mix.build_stem_mix", side_effect=lambda video_id, stems, gains, mix_id: f"{mix_id}.m3u8") \
+            as mock_build:
+        preview = json.loads(mix_stems(mock_request).data)
+        cached = json.loads(mix_stems(mock_request).data)
+
+        for stem in ("vocals", "drums"):
+            tracks.document(stem).update({"masterPlaylistUrl": f"videos/v/{stem}/master.m3u8"})
+        invalidate_tracks("v")
+        upgraded = json.loads(mix_stems(mock_request).data)
+    invalidate_tracks("v")
+
+    assert cached["cached"] is True and cached["mixId"] == preview["mixId"]
+    assert upgraded["cached"] is False and upgraded["mixId"] != preview["mixId"]
+    assert mock_build.call_count == 2
@@ -0,0 +1,312 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from audio.hls import build_media_playlist, parse_master_playlist, parse_media_playlist, storage_download_url
+from audio.separation import STEM_TYPES
+from loadtest.fakes import FakeBucket, FakeFirestore
+from spec import stem_separation
+from spec.hls_storage import stem_segment_proxy_url, track_segments
+from spec.stem_separation import SeparationError, lazy_segment_url, queue_lazy_separation, start_separation
+from spec.task_queue import LocalTaskQueue, register_task_handler, set_local_queue
+from spec.track_cache import invalidate_tracks
+
+VIDEO_ID = "sep-video"
+SEGMENT_SAMPLES = 100
+
+
+@pytest.fixture
+def backend():
+    db, bucket = FakeFirestore(), FakeBucket()
+    queue = LocalTaskQueue()
+    register_task_handler(stem_separation.SEPARATION_TASK, stem_separation.separate_chunk)
+    set_local_queue(queue)
+    invalidate_tracks(VIDEO_ID)
+    stem_separation._lazy_jobs.clear()
+
+    # Segment i decodes to samples of value i, so the stems can be traced back
+    def decode(segments):
+        return np.concatenate([
+            np.full((SEGMENT_SAMPLES, 2), float(data.decode()), dtype=np.float32) for data in segments
+        ])
+
+    def separate(samples, quality="full"):
+        return {stem: samples + index * 1000 for index, stem in enumerate(STEM_TYPES)}
+
+    # Each segment records its first sample and its start time
+    def encode(samples, durations, ts_offset, output_dir, bitrate=None):
+        paths = []
+        for k, duration in enumerate(durations):
+            paths.append(f"{output_dir}/segment_{k:05d}.ts")
+            with open(paths[-1], "w") as f:
+                f.write(f"{samples[k * SEGMENT_SAMPLES, 0]:.0f}@{ts_offset + sum(durations[:k]):.0f}")
+        return paths
+
+    with patch("spec.stem_separation.db", db), \
+            patch("spec.stem_separation.bucket", bucket), \
+            patch("spec.hls_storage.bucket", bucket), \
+            patch("spec.storage_upload.bucket", bucket), \
+            patch("spec.track_cache.db", db), \
+            patch("spec.stem_separation.decode_segments", side_effect=decode), \
+            patch("spec.stem_separation.separate_stems", side_effect=separate), \
+            patch("spec.stem_separation.encode_segments", side_effect=encode):
+        yield db, bucket, queue
+    set_local_queue(None)
+    invalidate_tracks(VIDEO_ID)
+
+
+def _seed_video(db, bucket, segment_count=7, **video_fields):
+    base = f"videos/{VIDEO_ID}/audio/original"
+    for i in range(segment_count):
+        bucket.blob(f"{base}/segment_{i:03d}.ts").upload_from_string(str(i))
+    bucket.blob(f"{base}/playlist.m3u8").upload_from_string(
+        build_media_playlist([(6.0, f"segment_{i:03d}.ts") for i in range(segment_count)])
+    )
+    video_ref = db.collection("videos").document(VIDEO_ID)
+    video_ref.set({"title": "Test", **video_fields})
+    video_ref.collection("audioTracks").document("original").set({
+        "type": "original",
+        "hlsBasePath": f"{base}/",
+        "variants": [{"bitrate": 192000, "playlistUrl": storage_download_url(bucket.name, f"{base}/playlist.m3u8")}]
+    })
+    return video_ref
+
+
+def _read(bucket, path):
+    return bucket.blob(path).download_as_text()
+
+
+def test_separation_fans_out_and_finalizes(backend):
+    """Test that every chunk is separated by a task and the last one writes the stems."""
+    db, bucket, queue = backend
+    video_ref = _seed_video(db, bucket)
+
+    job = start_separation(VIDEO_ID, chunk_segments=3, preview=False)
+    assert job["status"] == "running" and job["chunkCount"] == 3
+    queue.drain()
+
+    assert len(queue.completed) == 3 and not queue.failed
+    assert video_ref.get().to_dict()["stemSeparation"]["status"] == "complete"
+    job_doc = video_ref.collection("stemJobs").document(job["jobId"]).get().to_dict()
+    assert job_doc["status"] == "complete" and job_doc["completedChunks"] == [0, 1, 2]
+
+    for index, stem in enumerate(STEM_TYPES):
+        base = f"videos/{VIDEO_ID}/audio/{stem}"
+        # Each stem segment comes from the matching original segment, at its own offset
+        for i in range(7):
+            assert _read(bucket, f"{base}/segment_{i:05d}.ts") == f"{i + index * 1000}@{i * 6}"
+        playlist = parse_media_playlist(_read(bucket, f"{base}/playlist.m3u8"))
+        assert len(playlist) == 7 and playlist[-1][1] == storage_download_url(bucket.name, f"{base}/segment_00006.ts")
+        assert len(parse_master_playlist(_read(bucket, f"{base}/master.m3u8"))) == 1
+
+        track = video_ref.collection("audioTracks").document(stem).get().to_dict()
+        assert track["type"] == stem
+        assert track["hlsBasePath"] == f"{base}/"
+
+
+def test_failed_finalize_is_retried(backend):
+    """Test that a finalizer failing once is run again by the retried chunk task."""
+    db, bucket, queue = backend
+    video_ref = _seed_video(db, bucket)
+    finalize = stem_separation.finalize_separation
+    calls = []
+
+    def flaky_finalize(video_id, job_id):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise RuntimeError("Playlist upload failed")
+        finalize(video_id, job_id)
+
+    with patch("spec.stem_separation.finalize_separation", side_effect=flaky_finalize):
+        job = start_separation(VIDEO_ID, chunk_segments=3, preview=False)
+        queue.drain()
+
+    assert len(calls) == 2 and not queue.failed
+    assert video_ref.get().to_dict()["stemSeparation"]["status"] == "complete"
+    assert video_ref.collection("stemJobs").document(job["jobId"]).get().to_dict()["status"] == "complete"
+    assert video_ref.collection("audioTracks").document("vocals").get().exists
+
+
+def test_failed_full_phase_enqueue_is_resumed(backend):
+    """Test that full chunks the preview finalizer failed to enqueue are queued by its retry."""
+    db, bucket, queue = backend
+    video_ref = _seed_video(db, bucket)
+    enqueue = stem_separation.enqueue
+    full_enqueues = []
+
+    def flaky_enqueue(function_name, payload):
+        if payload["phase"] == "full":
+            full_enqueues.append(payload["chunkIndex"])
+            if len(full_enqueues) == 2:
+                raise RuntimeError("Cloud Tasks unavailable")
+        return enqueue(function_name, payload)
+
+    with patch("spec.stem_separation.enqueue", side_effect=flaky_enqueue):
+        job = start_separation(VIDEO_ID, chunk_segments=3)
+        queue.drain()
+
+    assert not queue.failed
+    assert video_ref.get().to_dict()["stemSeparation"]["status"] == "complete"
+    job_data = video_ref.collection("stemJobs").document(job["jobId"]).get().to_dict()
+    assert job_data["status"] == "complete" and job_data["enqueuePending"] is False
+    track = video_ref.collection("audioTracks").document("bass").get().to_dict()
+    assert track["metadata"]["quality"] == "full"
+    assert _read(bucket, f"videos/{VIDEO_ID}/audio/bass/segment_00006.ts") == f"{6 + 2000}@36"
+
+
+def test_separation_is_not_restarted(backend):
+    """Test that a running or complete job is returned instead of starting another."""
+    db, bucket, queue = backend
+    _seed_video(db, bucket)
+
+    first = start_separation(VIDEO_ID)
+    second = start_separation(VIDEO_ID)
+    assert second["jobId"] == first["jobId"]
+    queue.drain()
+    assert start_separation(VIDEO_ID)["status"] == "complete"
+    # One preview and one full-quality task per chunk
+    assert len(queue.completed) == 2 * first["chunkCount"]
+
+
+def test_separation_publishes_preview_first(backend):
+    """Test that preview stems are published before the full-quality ones replace them."""
+    db, bucket, queue = backend
+    video_ref = _seed_video(db, bucket)
+    qualities = []
+
+    def separate(samples, quality):
+        qualities.append(quality)
+        return {stem: samples + index * 1000 for index, stem in enumerate(STEM_TYPES)}
+
+    with patch("spec.stem_separation.separate_stems", side_effect=separate):
+        job = start_separation(VIDEO_ID, chunk_segments=3)
+        assert job["phase"] == "preview"
+        for _ in range(3):
+            queue._run(*queue._tasks.popleft())
+
+        # Every preview chunk is done: the stems are playable while full quality runs
+        assert qualities == ["preview"] * 3
+        state = video_ref.get().to_dict()["stemSeparation"]
+        assert state["status"] == "running" and state["phase"] == "full"
+        track = video_ref.collection("audioTracks").document("bass").get().to_dict()
+        assert track["metadata"]["quality"] == "preview"
+        assert track["masterPlaylistUrl"] == storage_download_url(
+            bucket.name, f"videos/{VIDEO_ID}/audio/bass/preview/master.m3u8")
+        playlist = parse_media_playlist(_read(bucket, f"videos/{VIDEO_ID}/audio/bass/preview/playlist.m3u8"))
+        assert playlist[0][1] == storage_download_url(bucket.name, f"videos/{VIDEO_ID}/audio/bass/preview/segment_00000.ts")
+        assert start_separation(VIDEO_ID)["jobId"] == job["jobId"]
+
+        queue.drain()
+
+    assert qualities == ["preview"] * 3 + ["full"] * 3
+    assert video_ref.get().to_dict()["stemSeparation"]["status"] == "complete"
+    track = video_ref.collection("audioTracks").document("bass").get().to_dict()
+    assert track["metadata"]["quality"] == "full"
+    assert track["metadata"]["jobId"] == job["jobId"]
+    assert track["metadata"]["separatedBy"] == "openunmix-umxl"
+    assert track["masterPlaylistUrl"] == storage_download_url(bucket.name, f"videos/{VIDEO_ID}/audio/bass/master.m3u8")
+    assert track["variants"][0]["playlistUrl"] == storage_download_url(
+        bucket.name, f"videos/{VIDEO_ID}/audio/bass/playlist.m3u8")
+    assert _read(bucket, f"videos/{VIDEO_ID}/audio/bass/segment_00006.ts") == f"{6 + 2000}@36"
+
+
+def test_separation_uses_linked_stems(backend):
+    """Test that audio matched to an earlier upload reuses its stems."""
+    db, bucket, queue = backend
+    _seed_video(db, bucket, audioDedupe={
+        "status": "matched", "videoId": "earlier", "trackId": "original", "linkedStems": ["vocals", "drums"]
+    })
+
+    job = start_separation(VIDEO_ID)
+    assert job == {"status": "linked", "linkedFrom": "earlier", "stems": ["vocals", "drums"]}
+    assert not queue._tasks
+
+
+def test_separation_requires_original_track(backend):
+    """Test that a video without an original track is rejected."""
+    db, _, _ = backend
+    db.collection("videos").document(VIDEO_ID).set({"title": "No audio"})
+    with pytest.raises(SeparationError) as error:
+        start_separation(VIDEO_ID)
+    assert error.value.status == 404
+
+
+def test_lazy_separation_publishes_proxied_stems(backend):
+    """Test that lazy mode publishes playable stems without separating anything."""
+    db, bucket, queue = backend
+    video_ref = _seed_video(db, bucket)
+
+    job = start_separation(VIDEO_ID, chunk_segments=3, mode="lazy")
+    assert job["status"] == "complete" and job["mode"] == "lazy"
+    assert not queue._tasks
+    assert video_ref.get().to_dict()["stemSeparation"]["mode"] == "lazy"
+    assert not bucket.blob(f"videos/{VIDEO_ID}/audio/vocals/segment_00000.ts").exists()
+
+    track = video_ref.collection("audioTracks").document("vocals").get().to_dict()
+    assert track["metadata"]["separationMode"] == "lazy"
+    playlist = parse_media_playlist(_read(bucket, f"videos/{VIDEO_ID}/audio/vocals/playlist.m3u8"))
+    assert playlist[4][1] == stem_segment_proxy_url(VIDEO_ID, job["jobId"], "vocals", 4)
+    # Server-side readers see where the segments will be stored
+    assert track_segments(track)[4][1] == f"videos/{VIDEO_ID}/audio/vocals/segment_00004.ts"
+
+
+def test_lazy_segment_separates_on_first_request(backend):
+    """Test that the first request separates the segment's chunk and queues the next one."""
+    db, bucket, queue = backend
+    _seed_video(db, bucket)
+    job_id = start_separation(VIDEO_ID, chunk_segments=3, mode="lazy")["jobId"]
+    base = f"videos/{VIDEO_ID}/audio/drums"
+
+    with patch("spec.stem_separation._separate_segments", wraps=stem_separation._separate_segments) as mock_separate:
+        url = lazy_segment_url(VIDEO_ID, job_id, "drums", 4)
+        assert url == storage_download_url(bucket.name, f"{base}/segment_00004.ts")
+        assert _read(bucket, f"{base}/segment_00004.ts") == f"{4 + 1000}@24"
+        assert [call.args[2] for call in mock_separate.call_args_list] == [1]
+
+        # The chunk's segments now point at Storage; the others still at the proxy
+        playlist = parse_media_playlist(_read(bucket, f"{base}/playlist.m3u8"))
+        assert playlist[3][1] == storage_download_url(bucket.name, f"{base}/segment_00003.ts")
+        assert playlist[0][1] == stem_segment_proxy_url(VIDEO_ID, job_id, "drums", 0)
+
+        # Later requests for the chunk don't read the job or separate again
+        with patch.object(stem_separation, "_job_ref", side_effect=AssertionError("job read")):
+            lazy_segment_url(VIDEO_ID, job_id, "vocals", 5)
+
+        # The chunk after it was queued for a worker
+        assert [task[1]["chunkIndex"] for task in queue._tasks] == [2]
+        queue.drain()
+        assert [call.args[2] for call in mock_separate.call_args_list] == [1, 2]
+        lazy_segment_url(VIDEO_ID, job_id, "bass", 6)
+        assert len(mock_separate.call_args_list) == 2
+
+    job_doc = db.collection("videos").document(VIDEO_ID).collection("stemJobs").document(job_id).get().to_dict()
+    assert job_doc["completedChunks"] == [1, 2] and job_doc["chunkClaims"] == {}
+    assert job_doc["status"] == "lazy"
+
+
+def test_lazy_segment_rejects_unknown_segments(backend):
+    """Test that requests outside the job are rejected with 404."""
+    db, bucket, _ = backend
+    _seed_video(db, bucket)
+    job_id = start_separation(VIDEO_ID, mode="lazy")["jobId"]
+    for args in ((job_id, "vocals", 7), (job_id, "kazoo", 0), ("missing", "vocals", 0)):
+        with pytest.raises(SeparationError) as error:
+            lazy_segment_url(VIDEO_ID, *args)
+        assert error.value.status == 404
+
+
+def test_queue_lazy_separation_finishes_stems(backend):
+    """Test that whole-stem consumers queue the remaining chunks until the job completes."""
+    db, bucket, queue = backend
+    video_ref = _seed_video(db, bucket)
+    job_id = start_separation(VIDEO_ID, chunk_segments=3, mode="lazy")["jobId"]
+    tracks = [video_ref.collection("audioTracks").document(stem).get().to_dict() for stem in ("vocals", "bass")]
+
+    assert queue_lazy_separation(VIDEO_ID, tracks)
+    queue.drain()
+    assert not queue.failed
+    assert not queue_lazy_separation(VIDEO_ID, tracks)
+
+    job_doc = video_ref.collection("stemJobs").document(job_id).get().to_dict()
+    assert job_doc["status"] == "complete"
+    playlist = parse_media_playlist(_read(bucket, f"videos/{VIDEO_ID}/audio/bass/playlist.m3u8"))
+    assert all(uri.startswith("https://firebasestorage") for _, uri in playlist)
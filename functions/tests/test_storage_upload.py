@@ -0,0 +1,101 @@
+import os
+from unittest.mock import Mock, patch
+from spec.storage_upload import (
+    IMMUTABLE_CACHE_CONTROL,
+    OBJECT_CACHE_CONTROL,
+    PLAYLIST_CACHE_CONTROL,
+    RESUMABLE_CHUNK_BYTES,
+    content_type_for,
+    upload_objects,
+    upload_tree
+)
+
+
+def _recording_bucket():
+    blobs = {}
+    order = []
+
+    def blob(path):
+        mock = Mock(chunk_size=None)
+        mock.upload_from_string.side_effect = lambda *a, **k: order.append(path)
+        mock.upload_from_filename.side_effect = lambda *a, **k: order.append(path)
+        blobs[path] = mock
+        return mock
+
+    bucket = Mock()
+    bucket.blob.side_effect = blob
+    return bucket, blobs, order
+
+
+def _write(path, text="x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_content_types():
+    """Test content types of HLS and other outputs."""
+    assert content_type_for("a/playlist.m3u8") == "application/vnd.apple.mpegurl"
+    assert content_type_for("a/segment_001.TS") == "video/mp2t"
+    assert content_type_for("a/thumb.jpg") == "image/jpeg"
+    assert content_type_for("a/unknown.zzz") == "application/octet-stream"
+
+
+def test_upload_tree_writes_playlists_last(tmp_path):
+    """Test that segments precede media playlists, which precede the master playlist."""
+    root = str(tmp_path)
+    for variant in ("low", "high"):
+        _write(f"{root}/{variant}/segment_000.ts")
+        _write(f"{root}/{variant}/playlist.m3u8", "#EXTM3U\n#EXTINF:6.0,\nsegment_000.ts\n")
+    _write(f"{root}/master.m3u8", "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nlow/playlist.m3u8\n")
+
+    bucket, blobs, order = _recording_bucket()
+    with patch("spec.storage_upload.bucket", bucket):
+        uploaded = upload_tree(root, "videos/v/audio/")
+
+    assert sorted(uploaded) == sorted(order)
+    assert set(order[:2]) == {"videos/v/audio/low/segment_000.ts", "videos/v/audio/high/segment_000.ts"}
+    assert set(order[2:4]) == {"videos/v/audio/low/playlist.m3u8", "videos/v/audio/high/playlist.m3u8"}
+    assert order[4] == "videos/v/audio/master.m3u8"
+    assert blobs["videos/v/audio/low/segment_000.ts"].cache_control == OBJECT_CACHE_CONTROL
+    assert blobs["videos/v/audio/master.m3u8"].cache_control == PLAYLIST_CACHE_CONTROL
+    blobs["videos/v/audio/low/segment_000.ts"].upload_from_filename.assert_called_once_with(
+        f"{root}/low/segment_000.ts", content_type="video/mp2t"
+    )
+
+
+def test_large_files_use_resumable_chunks(tmp_path):
+    """Test that big files get a chunk size (resumable upload) and small ones don't."""
+    big = tmp_path / "big.mp4"
+    with open(big, "wb") as f:
+        f.truncate(RESUMABLE_CHUNK_BYTES + 1)
+    _write(str(tmp_path / "small.ts"))
+
+    bucket, blobs, _ = _recording_bucket()
+    with patch("spec.storage_upload.bucket", bucket), \
+         patch("spec.storage_upload.RESUMABLE_THRESHOLD_BYTES", RESUMABLE_CHUNK_BYTES):
+        upload_tree(str(tmp_path), "out", workers=2)
+
+    assert blobs["out/big.mp4"].chunk_size == RESUMABLE_CHUNK_BYTES
+    assert blobs["out/small.ts"].chunk_size is None
+
+
+def test_upload_objects_orders_in_memory_playlists():
+    """Test that in-memory uploads also write playlists after their segments."""
+    bucket, _, order = _recording_bucket()
+    with patch("spec.storage_upload.bucket", bucket):
+        upload_objects({"m/playlist.m3u8": "#EXTM3U\n", "m/segment_000.ts": b"ts"})
+    assert order == ["m/segment_000.ts", "m/playlist.m3u8"]
+
+
+def test_immutable_cache_control_is_opt_in():
+    """Test that only uploads marked content-addressed are cached forever."""
+    bucket, blobs, _ = _recording_bucket()
+    with patch("spec.storage_upload.bucket", bucket):
+        upload_objects({"peaks/256.bin": b"p"})
+        upload_objects({"mix/segment_000.ts": b"ts", "mix/playlist.m3u8": "#EXTM3U\n"},
+                       cache_control=IMMUTABLE_CACHE_CONTROL)
+
+    assert blobs["peaks/256.bin"].cache_control == OBJECT_CACHE_CONTROL
+    assert blobs["mix/segment_000.ts"].cache_control == IMMUTABLE_CACHE_CONTROL
+    assert blobs["mix/playlist.m3u8"].cache_control == IMMUTABLE_CACHE_CONTROL
@@ -0,0 +1,106 @@
+import pytest
+from unittest.mock import Mock, patch
+from spec import track_cache
+from spec.track_cache import DocumentCache, get_track, get_tracks, list_tracks
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    track_cache._tracks.invalidate()
+    track_cache._track_lists.invalidate()
+    yield
+
+
+def _snapshot(video_id, track_id, data, update_time=1):
+    snapshot = Mock(exists=data is not None, id=track_id, update_time=update_time)
+    snapshot.to_dict.return_value = data
+    snapshot.reference.parent.parent.id = video_id
+    return snapshot
+
+
+def test_document_cache_ttl_and_lru():
+    """Test expiry, LRU eviction and hit ratio accounting."""
+    clock = FakeClock()
+    cache = DocumentCache(ttl=10, max_entries=2, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") == (False, None)
+
+    clock.now = 11
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_document_cache_keeps_newer_version():
+    """Test that data from an older update_time never replaces newer data."""
+    cache = DocumentCache()
+    cache.put("a", "new", update_time=2)
+    cache.put("a", "old", update_time=1)
+    assert cache.get("a") == (True, "new")
+
+
+def test_get_track_reads_firestore_once():
+    """Test that a warm track read skips Firestore, including for missing tracks."""
+    with patch("spec.track_cache.db") as mock_db:
+        tracks = mock_db.collection.return_value.document.return_value.collection.return_value
+        tracks.document.return_value.get.return_value = _snapshot("v", "t", {"type": "vocals"})
+        assert get_track("v", "t") == {"type": "vocals"}
+        assert get_track("v", "t") == {"type": "vocals"}
+
+        tracks.document.return_value.get.return_value = _snapshot("v", "gone", None)
+        assert get_track("v", "gone") is None
+        assert get_track("v", "gone") is None
+    assert tracks.document.return_value.get.call_count == 2
+
+
+def test_missing_track_is_cached_briefly():
+    """Test that a track created just after a miss is seen once the short miss TTL passes."""
+    clock = FakeClock()
+    with patch("spec.track_cache.db") as mock_db, patch.object(track_cache._tracks, "_clock", clock):
+        tracks = mock_db.collection.return_value.document.return_value.collection.return_value
+        tracks.document.return_value.get.return_value = _snapshot("v", "t", None)
+        assert get_track("v", "t") is None
+
+        tracks.document.return_value.get.return_value = _snapshot("v", "t", {"type": "vocals"})
+        assert get_track("v", "t") is None
+        clock.now = track_cache.TRACK_MISS_TTL_SECONDS + 0.1
+        assert get_track("v", "t") == {"type": "vocals"}
+        clock.now += track_cache.TRACK_MISS_TTL_SECONDS + 0.1
+        assert get_track("v", "t") == {"type": "vocals"}
+    assert tracks.document.return_value.get.call_count == 2
+
+
+def test_get_tracks_batches_misses():
+    """Test that cache misses are fetched with a single get_all."""
+    track_cache._tracks.put("v/a", {"type": "vocals"})
+    with patch("spec.track_cache.db") as mock_db:
+        mock_db.get_all.return_value = [_snapshot("v", "b", {"type": "drums"}), _snapshot("w", "c", None)]
+        tracks = get_tracks(["v/a", "v/b", "w/c"])
+
+    assert tracks == {"v/a": {"type": "vocals"}, "v/b": {"type": "drums"}, "w/c": None}
+    mock_db.get_all.assert_called_once()
+    assert len(mock_db.get_all.call_args[0][0]) == 2
+
+
+def test_list_tracks_uses_cached_listing():
+    """Test that a repeated listing is served without streaming the collection."""
+    with patch("spec.track_cache.db") as mock_db:
+        collection = mock_db.collection.return_value.document.return_value.collection.return_value
+        collection.stream.return_value = [_snapshot("v", "a", {"type": "vocals"}), _snapshot("v", "b", {"type": "bass"})]
+        first = list_tracks("v")
+        second = list_tracks("v")
+
+    assert first == second == {"a": {"type": "vocals"}, "b": {"type": "bass"}}
+    collection.stream.assert_called_once()
+    mock_db.get_all.assert_not_called()
@@ -0,0 +1,131 @@
+import base64
+import gzip
+import json
+import pytest
+from unittest.mock import Mock, patch
+from flask import Flask
+from flask_cors import CORS
+from firebase_functions import https_fn
+from audio.midi import note_events_to_midi_bytes
+from spec.single_flight import transcription_key, transcription_result_path
+from spec.transcribe import transcribe_to_midi
+
+NOTE_EVENTS = [(0.0, 0.5, 60, 0.5, None), (0.5, 1.0, 64, 1.0, [0, 1])]
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    app = Flask(__name__)
+    CORS(app)
+    with app.app_context():
+        with app.test_request_context():
+            yield
+
+
+@pytest.fixture
+def make_request():
+    def make(body, headers=None, args=None):
+        mock = Mock(spec=https_fn.Request)
+        mock.method = "POST"
+        mock.headers = {"Content-Type": "application/json", **(headers or {})}
+        mock.args = args or {}
+        mock.get_json.return_value = body
+        return mock
+    return make
+
+
+@pytest.fixture
+def pretranscribed_track():
+    """Track cache mock returning a track with a complete stored transcription."""
+    track_data = {
+        "masterPlaylistUrl": "https://example.com/master.m3u8",
+        "transcription": {"status": "complete", "duration": 60.0}
+    }
+    with patch("spec.transcribe.get_track", return_value=track_data), \
+         patch("spec.transcribe.load_note_range", return_value=NOTE_EVENTS), \
+         patch("spec.transcribe.load_note_range_midi",
+               return_value=note_events_to_midi_bytes(NOTE_EVENTS)) as mock_load:
+        yield mock_load
+
+
+def test_default_mode_returns_base64_json(make_request, pretranscribed_track):
+    """Test that the original base64 JSON response is still the default."""
+    response = transcribe_to_midi(make_request({"trackId": "v/t", "startTime": 10, "endTime": 20}))
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data["success"] is True
+    assert base64.b64decode(data["midiData"])[:4] == b"MThd"
+    assert data["timeRange"] == {"startTime": 10, "endTime": 20}
+    pretranscribed_track.assert_called_once()
+
+
+def test_binary_mode_returns_raw_midi(make_request, pretranscribed_track):
+    """Test that Accept: audio/midi streams the MIDI bytes."""
+    response = transcribe_to_midi(make_request({"trackId": "v/t"}, headers={"Accept": "audio/midi"}))
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "audio/midi"
+    assert "attachment" in response.headers["Content-Disposition"]
+    # Readable by web clients despite the wildcard CORS origin
+    assert "Content-Disposition" in response.headers["Access-Control-Expose-Headers"]
+    assert response.data[:4] == b"MThd"
+
+
+def test_notes_format_is_gzipped_when_accepted(make_request, pretranscribed_track):
+    """Test the notes JSON format and gzip negotiation."""
+    with patch("spec.delivery.GZIP_MIN_BYTES", 0):
+        response = transcribe_to_midi(make_request(
+            {"trackId": "v/t", "format": "notes"},
+            headers={"Accept-Encoding": "gzip, deflate"}
+        ))
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    data = json.loads(gzip.decompress(response.data))
+    assert [note["pitch"] for note in data["notes"]] == [60, 64]
+    assert data["notes"][1]["velocity"] == 127
+    assert data["notes"][1]["pitchBends"] == [0, 1]
+
+
+def test_redirect_mode_uploads_and_redirects(make_request, pretranscribed_track):
+    """Test that redirect mode stores the result and 302s to a signed URL."""
+    with patch("spec.delivery.bucket") as mock_bucket:
+        mock_bucket.blob.return_value.generate_signed_url.return_value = "https://signed.example.com/r.mid"
+        response = transcribe_to_midi(make_request({"trackId": "v/t", "startTime": 1, "endTime": 2},
+                                                   args={"responseMode": "redirect"}))
+
+    assert response.status_code == 302
+    assert response.headers["Location"] == "https://signed.example.com/r.mid"
+    key = transcription_key("v/t", 1, 2, "https://example.com/master.m3u8")
+    mock_bucket.blob.assert_called_with(transcription_result_path(key))
+    mock_bucket.blob.return_value.upload_from_string.assert_called_once()
+
+
+def test_invalid_response_mode(make_request):
+    """Test that an unknown response mode is rejected."""
+    response = transcribe_to_midi(make_request({"trackId": "v/t", "responseMode": "fax"}))
+    assert response.status_code == 400
+
+
+def test_profiling_is_opt_in(make_request, pretranscribed_track):
+    """Test that X-Profile with the token stores cProfile/tracemalloc artifacts and returns their ID."""
+    with patch("spec.profiling.bucket") as mock_bucket:
+        plain = transcribe_to_midi(make_request({"trackId": "v/t"}))
+        # Without a configured token the header is ignored
+        untrusted = transcribe_to_midi(make_request({"trackId": "v/t"}, headers={"X-Profile": "1"}))
+        with patch("spec.profiling.PROFILE_TOKEN", "secret"):
+            wrong = transcribe_to_midi(make_request({"trackId": "v/t"}, headers={"X-Profile": "1"}))
+            mock_bucket.blob.assert_not_called()
+            profiled = transcribe_to_midi(make_request({"trackId": "v/t"}, headers={"X-Profile": "secret"}))
+
+    for response in (plain, untrusted, wrong):
+        assert "X-Profile-Id" not in response.headers
+    request_id = profiled.headers["X-Profile-Id"]
+    assert profiled.status_code == 200
+    paths = [call[0][0] for call in mock_bucket.blob.call_args_list]
+    assert paths == [
+        f"profiles/transcribe_to_midi/{request_id}/{name}"
+        for name in ("cpu.prof", "cpu.txt", "allocations.txt", "metadata.json")
+    ]
+    allocations = mock_bucket.blob.return_value.upload_from_string.call_args_list[1][0][0]
+    assert "KiB" in allocations
@@ -0,0 +1,55 @@
+import numpy as np
+from unittest.mock import Mock, patch
+from audio.peaks import compute_peaks
+from spec.audio_track_ingest import generate_waveform_peaks, peaks_base_path
+
+
+def test_compute_peaks_levels_and_values():
+    """Test min/max pairs at each level, with coarser levels reduced from finer ones."""
+    samples = np.zeros(1024 * 3, dtype=np.int16)
+    samples[10] = 32767
+    samples[2000] = -32768
+
+    peaks = compute_peaks(samples, levels=(256, 1024))
+
+    assert set(peaks) == {256, 1024}
+    assert peaks[256].dtype == np.int8
+    assert len(peaks[256]) == 2 * 12
+    assert len(peaks[1024]) == 2 * 3
+    # Bin 0 holds the positive spike, bin 1 of the coarse level the negative one
+    assert peaks[256][1] == 127
+    assert peaks[1024][1] == 127
+    assert peaks[1024][2] == -128
+
+
+def test_compute_peaks_pads_partial_bins():
+    """Test that a trailing partial bin is still represented, without padding values in its extremes."""
+    peaks = compute_peaks(np.full(300, 256, dtype=np.int16), levels=(256, 1024))
+    assert len(peaks[256]) == 4
+    assert len(peaks[1024]) == 2
+    assert list(peaks[256]) == [1, 1, 1, 1]
+    assert list(peaks[1024]) == [1, 1]
+
+
+def test_peaks_base_path_uses_hls_base_path():
+    """Test that peak files are stored next to the HLS output."""
+    assert peaks_base_path("v", "t", {"hlsBasePath": "videos/u/v/audio/original/"}) == \
+        "videos/u/v/audio/original/peaks"
+    assert peaks_base_path("v", "t", {}) == "videos/v/audioTracks/t/peaks"
+
+
+def test_generate_waveform_peaks_updates_track():
+    """Test that each level is uploaded and referenced from the track document."""
+    samples = np.zeros(44100, dtype=np.int16)
+
+    track_ref = Mock()
+    with patch("spec.storage_upload.bucket") as mock_bucket:
+        generate_waveform_peaks("v", "t", {"hlsBasePath": "hls/v/t"}, samples, 44100, track_ref)
+
+    waveform = track_ref.update.call_args[0][0]["waveformPeaks"]
+    assert waveform["status"] == "complete"
+    assert waveform["sampleRate"] == 44100
+    assert [level["samplesPerPeak"] for level in waveform["levels"]] == [256, 1024, 4096, 16384]
+    assert waveform["levels"][0]["path"] == "hls/v/t/peaks/peaks_256.bin"
+    assert waveform["levels"][0]["length"] == -(-44100 // 256)
+    assert mock_bucket.blob.call_count == 4
@@ -18,11 +18,15 @@ class TranscriptionService {
     try {
       final response = await http.post(
         Uri.parse(_functionUrl),
-        headers: {'Content-Type': 'application/json'},
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'audio/midi',
+        },
         body: json.encode({
           'trackId': trackId,
           if (startTime != null) 'startTime': startTime,
           if (endTime != null) 'endTime': endTime,
+          'responseMode': 'binary',
         }),
       );
 
@@ -31,19 +35,16 @@ class TranscriptionService {
         throw Exception(error['error'] ?? 'Failed to transcribe audio');
       }
 
-      final data = json.decode(response.body);
-      if (data['success'] != true) {
-        throw Exception(data['error'] ?? 'Failed to transcribe audio');
-      }
+      // The MIDI file is returned as raw bytes, named in Content-Disposition
+      final blob = html.Blob([response.bodyBytes], 'audio/midi');
+      final filename = _filenameFromDisposition(
+        response.headers['content-disposition'],
+      ) ?? '${trackId.replaceAll('/', '_')}.mid';
 
-      // Convert base64 MIDI data to blob
-      final midiData = base64.decode(data['midiData']);
-      final blob = html.Blob([midiData], 'audio/midi');
-      
       // Create download URL and trigger download
       final url = html.Url.createObjectUrlFromBlob(blob);
       final anchor = html.AnchorElement(href: url)
-        ..setAttribute('download', data['filename'])
+        ..setAttribute('download', filename)
         ..style.display = 'none';
       
       html.document.body!.children.add(anchor);
@@ -57,4 +58,10 @@ class TranscriptionService {
       rethrow;
     }
   }
+
+  static String? _filenameFromDisposition(String? disposition) {
+    if (disposition == null) return null;
+    final match = RegExp(r'filename="([^"]+)"').firstMatch(disposition);
+    return match?.group(1);
+  }
 } 
\ No newline at end of file